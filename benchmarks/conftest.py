@@ -0,0 +1,37 @@
+"""Pytest configuration and fixtures for pingme benchmarks."""
+import pytest
+
+from pingme.stubs import StubSMTPServer, StubWebhookServer, self_signed_context
+
+
+@pytest.fixture(scope="session")
+def webhook_server():
+    """Local stub webhook server shared by all benchmarks."""
+    with StubWebhookServer() as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def smtp_ssl_context(tmp_path_factory):
+    """Self-signed TLS context for the stub SMTP server, send_to_email always issues STARTTLS."""
+    context = self_signed_context(str(tmp_path_factory.mktemp("smtp_cert")))
+    if context is None:
+        pytest.skip("openssl is required to create a certificate for the stub SMTP server")
+    return context
+
+
+@pytest.fixture(scope="session")
+def smtp_server(smtp_ssl_context):
+    """Local stub SMTP server shared by all benchmarks."""
+    with StubSMTPServer(ssl_context=smtp_ssl_context) as server:
+        yield server
+
+
+@pytest.fixture
+def stub_env(monkeypatch, webhook_server, smtp_server):
+    """Point the default webhook channel and SMTP relay at the local stubs."""
+    monkeypatch.setenv("PINGME_WEBHOOK_URL_DEFAULT", webhook_server.url)
+    monkeypatch.setenv("PINGME_EMAIL_FROM", "bench@example.com")
+    monkeypatch.setenv("PINGME_EMAIL_TO", "bench@example.com")
+    monkeypatch.setenv("PINGME_EMAIL_SMTP_HOST", smtp_server.host)
+    monkeypatch.setenv("PINGME_EMAIL_SMTP_PORT", str(smtp_server.port))
@@ -0,0 +1,91 @@
+"""Benchmarks for the notification hot path.
+
+Run with pytest-benchmark, results are stored as JSON under .benchmarks/ so runs can be compared between commits:
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from pingme import core
+from pingme.api import app
+from pingme.pingme_class import Card, PingMe, resolved_payload
+
+
+def make_template(blocks: int, variables: int) -> dict:
+    """Adaptive-card-like template with `blocks` text blocks cycling through `variables` variables."""
+    return {
+        "type": "message",
+        "attachments": [
+            {
+                "contentType": "application/vnd.microsoft.card.adaptive",
+                "content": {
+                    "type": "AdaptiveCard",
+                    "body": [
+                        {"type": "TextBlock", "text": "${var" + str(i % variables) + "}", "wrap": True}
+                        for i in range(blocks)
+                    ],
+                },
+            }
+        ],
+    }
+
+
+class TestConfigBenchmarks:
+    """Benchmarks for config loading."""
+
+    def test_get_config(self, benchmark):
+        benchmark(core.get_config, "")
+
+    def test_pingme_init(self, benchmark):
+        card = Card(name="default", context={"title": "Bench title", "text": "Bench text"})
+        benchmark(PingMe, card, config_file="")
+
+
+class TestResolvedPayloadBenchmarks:
+    """Benchmarks for template rendering across template sizes and variable counts."""
+
+    @pytest.mark.parametrize("blocks", [2, 20, 200])
+    @pytest.mark.parametrize("variables", [2, 20])
+    def test_resolved_payload(self, benchmark, blocks, variables):
+        template = make_template(blocks, variables)
+        context = {f"var{i}": f"value {i}" for i in range(variables)}
+        benchmark(resolved_payload, template, context)
+
+
+class TestTransportBenchmarks:
+    """Benchmarks for sending against local stub servers."""
+
+    def test_send_webhook(self, benchmark, stub_env, webhook_server):
+        card = Card(name="default", context={"title": "Bench title", "text": "Bench text"})
+        notification = PingMe(card, config_file="")
+        response = benchmark(notification.send_webhook)
+        assert response.status_code == 200
+
+    def test_send_spool(self, benchmark, tmp_path, monkeypatch):
+        monkeypatch.setattr(core.settings, "data_dir", str(tmp_path))
+        card = Card(name="default", context={"title": "Bench title", "text": "Bench text"})
+        notification = PingMe(card, config_file="")
+        benchmark(notification.send_spool)
+
+    def test_send_email(self, benchmark, stub_env, smtp_server):
+        card = Card(name="default", context={"title": "Bench title", "text": "Bench text"})
+        notification = PingMe(card, config_file="")
+        response = benchmark(notification.send_email)
+        assert json.loads(response)["response"] is True
+
+
+class TestAPIBenchmarks:
+    """End-to-end benchmarks through the API."""
+
+    def test_webhook_simple_endpoint(self, benchmark, stub_env):
+        client = TestClient(app)
+
+        def post():
+            return client.post("/webhook/simple", params={"title": "Bench title", "text": "Bench text"})
+
+        response = benchmark(post)
+        assert response.status_code == 200
@@ -0,0 +1,170 @@
+import contextlib
+import threading
+import time
+import urllib.parse
+
+import requests  # for its Timeout/ConnectionError types
+
+from . import metrics
+from .limits import Overloaded
+
+# Status codes that mean the receiver is overloaded, the limit is cut on these
+OVERLOAD_STATUS = (429, 503, 504)
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit for one webhook host (additive increase, multiplicative decrease). Every healthy
+    response raises the limit by `increase / limit`, about `increase` per round trip of a full window. A 429/503/504,
+    a timeout or connection error, or a round trip time above `latency_tolerance` times the long-term average cuts
+    it to `limit * decrease`, at most once per round trip so one overloaded burst counts as one signal.
+    Callers over the limit wait for a slot up to `queue_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        initial: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 32,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        queue_timeout: float = 30.0,
+        name: str = "",
+    ):
+        """
+        Args:
+            initial (float): starting limit
+            min_limit (float): the limit never goes below this
+            max_limit (float): the limit never goes above this, keep it at most the HTTP pool size per host
+            increase (float): additive increase per window of healthy responses
+            decrease (float): factor applied to the limit on an overload signal
+            latency_tolerance (float): a round trip this many times the long-term average counts as overload
+            queue_timeout (float): seconds a send waits for a slot before Overloaded (503) is raised
+            name (str): host name, used as the metrics label
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self.in_flight = 0
+        self.rtt = None  # short-term average round trip, seconds
+        self.baseline = None  # long-term average round trip, seconds
+        self._samples = 0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.WEBHOOK_CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+        if self.rtt is not None:
+            metrics.WEBHOOK_RTT_SECONDS.labels(self.name).set(self.rtt)
+
+    def _observe(self, rtt: float, overloaded: bool) -> None:
+        # Called with the lock held after every send
+        if rtt is not None and not overloaded:
+            self._samples += 1
+            self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+            self.baseline = rtt if self.baseline is None else 0.99 * self.baseline + 0.01 * rtt
+            overloaded = self._samples >= 10 and self.rtt > self.latency_tolerance * self.baseline
+        now = time.monotonic()
+        if overloaded:
+            if now - self._last_cut >= (self.rtt or 0.0):
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_cut = now
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        self._publish()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Hold a slot for one request, set `status_code` on the yielded object to report the response
+
+        Raises:
+            Overloaded: if no slot became free within queue_timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout=self.queue_timeout):
+                raise Overloaded(f"Webhook host {self.name} is at its concurrency limit of {int(self.limit)}", 1, 503)
+            self.in_flight += 1
+        result = _Result()
+        start = time.perf_counter()
+        try:
+            yield result
+        except (requests.Timeout, requests.ConnectionError):
+            result.overloaded = True
+            raise
+        except Exception:
+            result.rtt_valid = False
+            raise
+        finally:
+            rtt = time.perf_counter() - start if result.rtt_valid else None
+            overloaded = result.overloaded or result.status_code in OVERLOAD_STATUS
+            with self._cond:
+                self.in_flight -= 1
+                self._observe(rtt, overloaded)
+                self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: current limit, in-flight requests and smoothed round trip times in milliseconds
+        """
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "rtt_ms": None if self.rtt is None else round(self.rtt * 1000, 2),
+                "baseline_ms": None if self.baseline is None else round(self.baseline * 1000, 2),
+            }
+
+
+class _Result:
+    __slots__ = ("status_code", "overloaded", "rtt_valid")
+
+    def __init__(self):
+        self.status_code = None
+        self.overloaded = False
+        self.rtt_valid = True
+
+
+_limiters: dict = {}  # host -> AIMDLimiter
+_limiters_lock = threading.Lock()
+defaults: dict = {}  # AIMDLimiter arguments for new hosts, e.g. {"max_limit": 16}
+
+
+def host_of(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def limiter_for(url: str) -> AIMDLimiter:
+    """
+    The process-wide adaptive limiter of a webhook URL's host, shared by every channel and tenant posting to it
+
+    Args:
+        url (str): webhook URL
+
+    Returns:
+        AIMDLimiter: the limiter of the URL's host
+    """
+    host = host_of(url)
+    limiter = _limiters.get(host)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(host)
+            if limiter is None:
+                limiter = _limiters[host] = AIMDLimiter(name=host, **defaults)
+    return limiter
+
+
+def snapshot() -> dict:
+    """
+    Returns:
+        dict: host -> limiter snapshot for every webhook host sent to so far
+    """
+    return {host: limiter.snapshot() for host, limiter in list(_limiters.items())}
@@ -2,32 +2,98 @@ import uvicorn  # Server for hosting the API, ref: https://www.uvicorn.org/
 from fastapi import FastAPI  # library for creating the API
 from fastapi.testclient import TestClient  # test client for notebook to test API calls
 from fastapi import HTTPException  # for raising exceptions
+from fastapi import Query, Response
 
 from .core import settings
-from . import core
+from . import config_watch, core, health, metrics
 from .pingme_class import Card
-from .services import NotificationService
+from .services import Notification, NotificationService
+from .limits import Overloaded
+from . import tenants
+from .tenants import TenantMiddleware
+from .channels import UnknownChannel
+from .sizeguard import PayloadTooLarge
+from .mail import AttachmentError
+from . import scheduler
+from .scheduler import ScheduleRequest
+
+import contextlib
+import functools
+from typing import List, Optional
 
 from fastcore.script import call_parse
 
 import json  # for parsing json data
+import os
+import shutil
+import tempfile
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and validate every served config so misconfiguration fails at start up instead of under load
+    for config_file in [settings.config_file, *settings.tenants.values()]:
+        model = core.get_config(config_file)["pingme"]["model"]
+        for path in model.unresolved:
+            core.logger.warning(f"Config {config_file or 'default'} option {path} references an unset variable")
+    # Reload changed configs in the background instead of restarting the process
+    config_watch.start()
+    # Resume persisted timers on start up, they are otherwise started on first use
+    scheduler.get_scheduler()
+    # Probe webhook hosts and SMTP relays in the background, /ready only reads the results
+    health.start()
+    yield
+    health.stop()
+    scheduler.stop_scheduler()
+    config_watch.stop()
+    metrics.mark_process_dead()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def _send_errors(endpoint):
+    """
+    Map the errors of a send endpoint to HTTP responses. Raised as HTTPException, so an unreachable or failing webhook
+    is an ordinary error response rather than a server error logged with its traceback.
+    """
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        try:
+            return endpoint(*args, **kwargs)
+        except HTTPException:
+            raise
+        except UnknownChannel as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        except AttachmentError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except PayloadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Overloaded as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
+    return wrapper
 
-app = FastAPI()
+
+# The stage latency histogram is only recorded where /metrics serves it
+metrics.enable()
+app.add_middleware(TenantMiddleware)
 
 
 @app.post("/webhook/default")
+@_send_errors
 def webhook_card_default(channel: str = None):
     """
     Send a default card to the webhook, intention is strictly for testing and showcasing.
     """
-    try:
-        return NotificationService.send_default_card_to_webhook(channel=channel)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return NotificationService.send_default_card_to_webhook(channel=channel)
 
 
 @app.post("/webhook/simple")
+@_send_errors
 def webhook_card_simple(title: str, text: str, channel: str = None):
     """
     Send a simple card to the webhook, should be used for most general use cases of sending a message.
@@ -36,13 +102,11 @@ def webhook_card_simple(title: str, text: str, channel: str = None):
         title (str):  Title of the card
         text (str): Text of the card
     """
-    try:
-        return NotificationService.send_simple_card_to_webhook(title, text, channel=channel)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return NotificationService.send_simple_card_to_webhook(title, text, channel=channel)
 
 
 @app.post("/webhook/card/")
+@_send_errors
 def webhook_card(card: Card, channel: str = None):
     """
     Send a card to the webhook, card defines a card thats installed into the config.yaml. Advanced usage which may not get used.
@@ -50,24 +114,20 @@ def webhook_card(card: Card, channel: str = None):
     Args:
         card (Card): Card object
     """
-    try:
-        return NotificationService.send_card_to_webhook(card, channel=channel)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return NotificationService.send_card_to_webhook(card, channel=channel)
 
 
 @app.post("/email/default")
+@_send_errors
 def email_card_default():
     """
     Send a default card via email, intention is strictly for testing and showcasing.
     """
-    try:
-        return NotificationService.send_default_card_to_email()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return NotificationService.send_default_card_to_email()
 
 
 @app.post("/email/simple")
+@_send_errors
 def email_card_simple(title: str, text: str):
     """
     Send a simple card via email, should be used for most general use cases of sending an email message.
@@ -76,13 +136,11 @@ def email_card_simple(title: str, text: str):
         title (str): Title of the email (subject)
         text (str): Text of the email
     """
-    try:
-        return NotificationService.send_simple_card_to_email(title, text)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return NotificationService.send_simple_card_to_email(title, text)
 
 
 @app.post("/email/card/")
+@_send_errors
 def email_card(card: Card):
     """
     Send a card via email, card defines a card that's installed into the config.yaml. Advanced usage which may not get used.
@@ -90,10 +148,122 @@ def email_card(card: Card):
     Args:
         card (Card): Card object
     """
-    try:
-        return NotificationService.send_card_to_email(card)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return NotificationService.send_card_to_email(card)
+
+
+@app.post("/route")
+@_send_errors
+def route_card(card: Card):
+    """
+    Send a card wherever the routing rules in the config send it, based on the severity and tags in its context.
+
+    Args:
+        card (Card): Card object, e.g. {"name": "default", "context": {"title": "...", "severity": "critical", "tags": ["pipeline"]}}
+    """
+    return NotificationService.send_routed_card(card)
+
+
+@app.post("/route/explain")
+@_send_errors
+def route_explain(card: Card):
+    """
+    Show which routing rule matches a card and where it would be sent, nothing is sent.
+
+    Args:
+        card (Card): Card object
+    """
+    return NotificationService.explain_route(card)
+
+
+@app.post("/bulk")
+def bulk(notifications: List[Notification]):
+    """
+    Send many notifications in one request, used by pingme.client to batch. Each notification is a card with its
+    transport (webhook, email, logfile or route), webhook channel and an optional id; a notification retried with an
+    id that was already sent is not sent again. Errors are reported per notification.
+
+    Args:
+        notifications (List[Notification]): the notifications
+    """
+    return {"results": NotificationService.send_bulk(notifications)}
+
+
+@app.post("/schedule")
+def schedule_card(request: ScheduleRequest):
+    """
+    Schedule a card to be sent at a time (`at`) or after a delay (`delay` seconds), optionally repeating `every` seconds.
+    Timers are persisted and survive restarts.
+
+    Args:
+        request (ScheduleRequest): the card, when to send it and how (transport webhook/email/logfile/route and channel)
+    """
+    spec = {
+        "card": request.card.model_dump(),
+        "transport": request.transport,
+        "channel": request.channel,
+        "every": request.every,
+        "config_file": tenants.active_config_file(),
+    }
+    due = scheduler.due_time(request)
+    job_id = scheduler.get_scheduler().schedule(spec, due)
+    return {"id": job_id, "due": due}
+
+
+@app.get("/schedule/{job_id}")
+def get_scheduled_card(job_id: str):
+    """
+    Show a pending scheduled job.
+    """
+    job = scheduler.get_scheduler().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No pending job {job_id}")
+    return job
+
+
+@app.delete("/schedule/{job_id}")
+def cancel_scheduled_card(job_id: str):
+    """
+    Cancel a pending scheduled job.
+    """
+    if not scheduler.get_scheduler().cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"No pending job {job_id}")
+    return {"id": job_id, "cancelled": True}
+
+
+@app.post("/heartbeat/{key}")
+def heartbeat(key: str, timeout: float = Query(7200, gt=0), card: Optional[Card] = None, transport: str = "webhook", channel: str = None):
+    """
+    Dead-man switch: each heartbeat re-arms a timer, if no heartbeat for `key` arrives within `timeout` seconds the
+    card is sent (by default a "Missed heartbeat" card with the default template).
+
+    Args:
+        key (str): heartbeat key, e.g. the pipeline name
+        timeout (float): seconds until the alert is sent, must be positive
+        card (Card): the alert card, optional
+    """
+    if card is None:
+        card = Card(
+            name="default",
+            context={"title": f"Missed heartbeat: {key}", "text": f"No heartbeat from {key} in the last {timeout:g} seconds"},
+        )
+    spec = {
+        "card": card.model_dump(),
+        "transport": transport,
+        "channel": channel,
+        "config_file": tenants.active_config_file(),
+    }
+    due = scheduler.get_scheduler().heartbeat(key, timeout, spec)
+    return {"key": key, "due": due}
+
+
+@app.delete("/heartbeat/{key}")
+def stop_heartbeat(key: str):
+    """
+    Disarm the dead-man switch for `key`.
+    """
+    if not scheduler.get_scheduler().cancel(f"heartbeat:{key}"):
+        raise HTTPException(status_code=404, detail=f"No heartbeat armed for {key}")
+    return {"key": key, "cancelled": True}
 
 
 @app.get(path="/")
@@ -104,11 +274,49 @@ async def help():
     """
     return {"msg": "please check /docs for more information on how to use the API"}
 
+
+@app.get("/health", tags=["monitoring"])
+async def health_check():
+    """
+    Liveness check from in-memory state only, cheap enough to poll often. Reports the config generation (increases
+    whenever a config is loaded or reloaded), webhook connection pool use, in-flight sends and queues per config and
+    the adaptive concurrency limit of every webhook host.
+    """
+    return health.health()
+
+
+@app.get("/ready", tags=["monitoring"])
+def ready_check(response: Response, probe: bool = False):
+    """
+    Readiness check for load balancers, 503 when a served config does not load, a limiter or one of its channels is
+    saturated or, with probe, a webhook host or SMTP relay did not accept connections. Hosts are probed in the
+    background every 30 seconds, the check itself never opens a connection.
+
+    Args:
+        probe (bool): also require the webhook hosts and SMTP relays to be reachable
+    """
+    # Not async: a served config that fails to load is read and parsed again on every call, off the event loop here
+    ok, report = health.ready(probe_hosts=probe)
+    if not ok:
+        response.status_code = 503
+    return report
+
+
+@app.get("/metrics", tags=["monitoring"])
+def metrics_endpoint():
+    """
+    Prometheus metrics: send/failure/retry/suppression counters by card, channel and transport and per-stage latency histograms
+    """
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @call_parse
 def webservice(
     host: str = "127.0.0.1",  # Host to run the server on
     port: int = 5000,  # Port to run the server on"
     config_file: str = None,  # Path to config file"
+    workers: int = 1,  # Number of worker processes
+    tenants: str = None,  # Comma separated tenant=config_file pairs, selected per request by header or /tenant/{name}/ prefix
 ):
     """Start the PingMe API server
     
@@ -116,12 +324,37 @@ def webservice(
         host (str): Host to run the server on, default is 127.0.1
         port (int): Port to run the server on, default is 5000
         config_file (str): Path to config file, default is None which uses default config file
+        workers (int): Number of worker processes, with more than 1 metrics are aggregated through PROMETHEUS_MULTIPROC_DIR
+        tenants (str): Comma separated tenant=config_file pairs, e.g. "lab1=/etc/pingme/lab1.env,lab2=/etc/pingme/lab2.env"
     """
     # Override settings if provided
     if config_file is not None:
         settings.config_file = config_file
+    if tenants:
+        settings.tenants = dict(pair.strip().split("=", 1) for pair in tenants.split(",") if pair.strip())
 
-    
+    if workers > 1:
+        # Worker processes build their own settings from the environment
+        os.environ["CONFIG_FILE"] = settings.config_file
+        os.environ["TENANTS"] = json.dumps(settings.tenants)
 
-    # Run using module path instead of app instance to ensure updated config
-    uvicorn.run("pingme.api:app", host=host, port=port, reload=core.DEV_MODE)
+    metrics_dir = None
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        # Workers inherit the env var, it must be set before they import prometheus_client
+        metrics_dir = tempfile.mkdtemp(prefix="pingme_metrics_")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    try:
+        # Run using module path instead of app instance to ensure updated config
+        uvicorn.run(
+            "pingme.api:app",
+            host=host,
+            port=port,
+            reload=core.DEV_MODE and workers == 1,
+            workers=workers,
+        )
+    finally:
+        if metrics_dir is not None:
+            # Only remove the directory this process created, a user supplied one may be shared
+            del os.environ["PROMETHEUS_MULTIPROC_DIR"]
+            shutil.rmtree(metrics_dir, ignore_errors=True)
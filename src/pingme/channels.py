@@ -0,0 +1,168 @@
+import fnmatch  # glob channel patterns
+import re
+import threading
+
+from .hedging import HedgePolicy
+
+
+class UnknownChannel(KeyError):
+    """Raised when a webhook channel is not configured and no fallback channel is set"""
+
+
+class ChannelTable:
+    """
+    Webhook routing table compiled once per config: channel, alias and group names map straight to their URLs so a
+    lookup is a dict access. Glob patterns are compiled into one regex and the names they match are memoised.
+    Names are case-insensitive, like the PINGME_WEBHOOK_URL_<NAME> env vars they often come from.
+    """
+
+    max_memoised: int = 1024  # bound on pattern-matched names remembered, protects against arbitrary caller input
+
+    def __init__(
+        self,
+        channels: dict,
+        aliases: dict = None,
+        groups: dict = None,
+        patterns: dict = None,
+        fallback: str = None,
+    ):
+        """
+        Args:
+            channels (dict): channel name -> webhook URL, or {"url": ..., "hedge": {"backup": ..., "after": ...}} to also
+                send to a backup channel or URL when the channel is slower than its p95 (or `after` seconds)
+            aliases (dict): alias -> channel, group or alias name
+            groups (dict): group name -> list of channel/alias names or URLs, a send goes to all of them
+            patterns (dict): glob pattern -> channel, group or alias name, the first matching pattern wins
+            fallback (str): name used for unknown channels, None raises UnknownChannel instead
+        """
+        self._routes: dict = {}
+        hedges = {}
+        for name, spec in (channels or {}).items():
+            if isinstance(spec, dict):
+                if spec.get("hedge"):
+                    hedges[name.lower()] = spec["hedge"]
+                spec = spec.get("url")
+            if spec:
+                self._routes[name.lower()] = (name.lower(), (spec,))
+        for name, members in (groups or {}).items():
+            urls = []
+            for member in members or []:
+                if "://" in member:
+                    urls.append(member)
+                else:
+                    urls.extend(self._follow(member, aliases or {})[1])
+            self._routes[name.lower()] = (name.lower(), tuple(dict.fromkeys(urls)))
+        for alias in aliases or {}:
+            self._routes[alias.lower()] = self._follow(alias, aliases)
+
+        self._pattern_targets: list = []
+        regexes = []
+        for i, (pattern, target) in enumerate((patterns or {}).items()):
+            regexes.append(f"(?P<p{i}>{fnmatch.translate(pattern.lower())})")
+            self._pattern_targets.append(self._follow(target, aliases or {}))
+        self._pattern = re.compile("|".join(regexes)) if regexes else None
+        self._memo: dict = {}
+        self._memo_lock = threading.Lock()
+
+        self.fallback = None
+        if fallback:
+            self.fallback = self._follow(fallback, aliases or {})
+
+        self._hedges: dict = {}
+        for name, hedge in hedges.items():
+            backup = hedge.get("backup")
+            if not backup:
+                raise ValueError(f"Hedged webhook channel {name} has no backup")
+            urls = (backup,) if "://" in backup else self._follow(backup, aliases or {})[1]
+            self._hedges[name] = HedgePolicy.from_config(hedge, urls)
+
+    @classmethod
+    def from_config(cls, webhook: dict):
+        """
+        Args:
+            webhook (dict): the config["pingme"]["options"]["webhook"] section
+        """
+        return cls(
+            webhook.get("channels") or {},
+            aliases=webhook.get("aliases"),
+            groups=webhook.get("groups"),
+            patterns=webhook.get("patterns"),
+            fallback=webhook.get("fallback"),
+        )
+
+    def _follow(self, name: str, aliases: dict) -> tuple:
+        # Resolve an alias chain to an already compiled channel or group
+        seen = set()
+        key = name.lower()
+        lowered = {k.lower(): v for k, v in aliases.items()}
+        while key in lowered and key not in self._routes:
+            if key in seen:
+                raise ValueError(f"Webhook alias cycle involving {name}")
+            seen.add(key)
+            key = lowered[key].lower()
+        if key not in self._routes:
+            raise ValueError(f"Webhook alias, group or pattern refers to unknown channel {name}")
+        return self._routes[key]
+
+    def resolve(self, channel: str = None) -> tuple:
+        """
+        Args:
+            channel (str): channel, alias or group name, None means "default"
+
+        Returns:
+            tuple: (canonical channel name, tuple of webhook URLs)
+
+        Raises:
+            UnknownChannel: if nothing matches and no fallback is configured
+        """
+        key = "default" if channel is None else channel.lower()
+        route = self._routes.get(key) or self._memo.get(key)
+        if route is not None:
+            return route
+        if self._pattern is not None:
+            match = self._pattern.match(key)
+            if match is not None:
+                route = self._pattern_targets[int(match.lastgroup[1:])]
+                with self._memo_lock:
+                    if len(self._memo) < self.max_memoised:
+                        self._memo[key] = route
+                return route
+        if self.fallback is not None:
+            return self.fallback
+        raise UnknownChannel(f"Webhook channel {channel or 'default'} is not configured")
+
+    def hedge_for(self, channel: str):
+        """
+        Args:
+            channel (str): canonical channel name, as returned by resolve
+
+        Returns:
+            HedgePolicy: the channel's hedging policy, None if it is not hedged
+        """
+        return self._hedges.get(channel)
+
+    def names(self) -> list:
+        """
+        Returns:
+            list: the configured channel, alias and group names
+        """
+        return sorted(self._routes)
+
+
+def table_for(webhook: dict) -> ChannelTable:
+    """
+    The compiled channel table of a webhook config section, compiled and stored in the section on first use
+    (core.load_config and config_model.PingMeConfig compile it up front)
+
+    Args:
+        webhook (dict): the config["pingme"]["options"]["webhook"] section
+
+    Returns:
+        ChannelTable: the table
+    """
+    table = webhook.get("table")
+    if table is None:
+        table = ChannelTable.from_config(webhook)
+        if isinstance(webhook, dict):  # a read-only section, e.g. from a frozen config model, is compiled per call
+            table = webhook.setdefault("table", table)
+    return table
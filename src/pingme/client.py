@@ -0,0 +1,386 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import uuid
+from typing import Union
+
+import httpx  # pooled keep-alive connections, sync and async
+
+from .core import logger
+from .pingme_class import Card
+from .services import Notification, NotificationService
+from .tenants import TENANT_HEADER
+
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+
+def _notification(card: Union[Card, dict, str], context: dict = None, transport: str = "webhook", channel: str = None, priority: str = None) -> Notification:
+    # Accepts a Card, a card dict or a card name with context, and assigns the idempotency id used for retries
+    if isinstance(card, str):
+        card = Card(name=card, context=context or {})
+    elif isinstance(card, dict):
+        card = Card.model_validate(card)
+    if priority is not None:
+        card = card.model_copy(update={"priority": priority})
+    return Notification(card=card, transport=transport, channel=channel, id=uuid.uuid4().hex)
+
+
+def _retry_after(response: httpx.Response, default: float) -> float:
+    try:
+        return float(response.headers.get("Retry-After", default))
+    except ValueError:
+        return default
+
+
+class _Batcher:
+    # Shared configuration and batching rules of the sync and async clients
+
+    def __init__(
+        self,
+        base_url: str,
+        batch_size: int,
+        flush_interval: float,
+        retries: int,
+        backoff: float,
+        fallback: bool,
+        config_file: str,
+        tenant: str,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.fallback = fallback
+        self.config_file = config_file
+        self.headers = {TENANT_HEADER.decode(): tenant} if tenant else {}
+
+    def _payload(self, notifications: list) -> list:
+        return [n.model_dump(mode="json") for n in notifications]
+
+    def _pending_after(self, notifications: list, results: list, done: dict) -> tuple:
+        # Record final results in done, return the notifications to retry and the longest Retry-After among them
+        retry, wait = [], 0.0
+        for notification, result in zip(notifications, results):
+            if result["status_code"] in (429, 503) and "retry_after" in result:
+                retry.append(notification)
+                wait = max(wait, float(result["retry_after"]))
+            else:
+                done[notification.id] = result
+        return retry, wait
+
+    def _fallback_results(self, notifications: list, error: Exception) -> list:
+        logger.warning(f"PingMe service at {self.base_url} unreachable ({error!r}), sending {len(notifications)} notifications in-process")
+        return NotificationService.send_bulk(notifications, config_file=self.config_file)
+
+    def _attempts(self, notifications: list):
+        """
+        The retry and fallback decisions for a batch, without the I/O: a generator yielding ("post", payload),
+        ("sleep", seconds) and ("fallback", notifications, error) steps, which is sent the response or
+        httpx.TransportError of a post and the results of a fallback, and returns the result per notification id.
+        The sync and async clients only carry out the steps.
+        """
+        done: dict = {}
+        delay = self.backoff
+        # Falling back is only safe while no attempt may have reached the service: after a read timeout or any
+        # response it may have sent the batch, and sending in-process as well would deliver twice
+        reached = False
+        for attempt in range(self.retries + 1):
+            wait = delay
+            outcome = yield ("post", self._payload(notifications))
+            if isinstance(outcome, httpx.TransportError):
+                reached = reached or not isinstance(outcome, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt == self.retries:
+                    if not self.fallback or reached:
+                        raise outcome
+                    results = yield ("fallback", notifications, outcome)
+                    notifications, _ = self._pending_after(notifications, results, done)
+                    break
+            else:
+                reached = True
+                if outcome.status_code in RETRYABLE_STATUS or outcome.status_code >= 500:
+                    if attempt == self.retries:
+                        outcome.raise_for_status()
+                    wait = _retry_after(outcome, delay)
+                else:
+                    outcome.raise_for_status()
+                    notifications, retry_after = self._pending_after(notifications, outcome.json()["results"], done)
+                    if not notifications:
+                        break
+                    wait = max(retry_after, delay)
+            if attempt < self.retries:
+                yield ("sleep", wait)
+                delay *= 2
+        for notification in notifications:
+            done.setdefault(notification.id, {"id": notification.id, "status_code": 503, "detail": "Service overloaded, retries exhausted"})
+        return done
+
+
+class PingMeClient(_Batcher):
+    """
+    Client for the PingMe service. Notifications are buffered and sent to `/bulk` in batches of up to `batch_size`,
+    when the buffer is full or every `flush_interval` seconds, over one pooled keep-alive connection. Each
+    notification carries an id, so a batch retried after a timeout or a 429/503 is not delivered twice. When the
+    service cannot be reached the notifications are sent in-process with PingMe (needs a config file on this host).
+
+    `send` returns a concurrent.futures.Future with the result of the notification, e.g.
+    `{"id": ..., "status_code": 200, "response": ...}`; `send(...).result()` waits for it.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:5000",
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        timeout: float = 30.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        fallback: bool = True,
+        config_file: str = None,
+        tenant: str = None,
+        transport: httpx.BaseTransport = None,
+    ):
+        """
+        Args:
+            base_url (str): URL of the PingMe service
+            batch_size (int): notifications per request, a full buffer is flushed right away
+            flush_interval (float): seconds a notification may wait in the buffer
+            timeout (float): request timeout in seconds
+            retries (int): retries of a batch on connection errors, 429 and 5xx, with exponential backoff
+            backoff (float): seconds before the first retry
+            fallback (bool): send in-process with PingMe when the service cannot be connected to, not after e.g. a
+                read timeout where the service may have sent the batch
+            config_file (str): config file for in-process sending, None uses the default
+            tenant (str): tenant to send as, sent as the X-PingMe-Tenant header
+            transport (httpx.BaseTransport): custom httpx transport, e.g. for tests
+        """
+        super().__init__(base_url, batch_size, flush_interval, retries, backoff, fallback, config_file, tenant)
+        self._http = httpx.Client(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8),
+            transport=transport,
+        )
+        self._buffer: list = []  # (notification, future)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # one batch in flight keeps notifications in order
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="pingme-client", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, card: Union[Card, dict, str], context: dict = None, transport: str = "webhook", channel: str = None, priority: str = None) -> concurrent.futures.Future:
+        """
+        Queue a notification
+
+        Args:
+            card (Card | dict | str): the card, or a card name with context
+            context (dict): the card context when card is a name
+            transport (str): webhook, email, logfile or route
+            channel (str): webhook channel
+            priority (str): critical, normal or bulk, overrides the card's priority
+
+        Returns:
+            Future: resolves to the result of the notification
+        """
+        if self._closed:
+            raise RuntimeError("PingMeClient is closed")
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._buffer.append((_notification(card, context, transport, channel, priority), future))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+        return future
+
+    def flush(self) -> None:
+        """Send everything buffered and wait for it"""
+        while True:
+            with self._lock:
+                batch, self._buffer = self._buffer[: self.batch_size], self._buffer[self.batch_size:]
+            if not batch:
+                return
+            self._send_batch(batch)
+
+    def _send_batch(self, batch: list) -> None:
+        notifications = [n for n, _ in batch]
+        try:
+            with self._send_lock:
+                done = self._deliver(notifications)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for notification, future in batch:
+            future.set_result(done[notification.id])
+
+    def _deliver(self, notifications: list) -> dict:
+        attempts = self._attempts(notifications)
+        outcome = None
+        while True:
+            try:
+                step = attempts.send(outcome)
+            except StopIteration as stop:
+                return stop.value
+            if step[0] == "post":
+                try:
+                    outcome = self._http.post("/bulk", json=step[1])
+                except httpx.TransportError as e:
+                    outcome = e
+            elif step[0] == "sleep":
+                time.sleep(step[1])
+                outcome = None
+            else:
+                outcome = self._fallback_results(*step[1:])
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("PingMeClient flush failed")
+
+    def close(self) -> None:
+        """Send what is buffered and close the connection pool"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self._http.close()
+
+
+class AsyncPingMeClient(_Batcher):
+    """
+    asyncio variant of PingMeClient: `await client.send(...)` returns an asyncio.Future with the result, batches are
+    flushed by a background task. Use it as `async with AsyncPingMeClient(...) as client:` or call `await aclose()`.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:5000",
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        timeout: float = 30.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        fallback: bool = True,
+        config_file: str = None,
+        tenant: str = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        """
+        Args:
+            see PingMeClient
+        """
+        super().__init__(base_url, batch_size, flush_interval, retries, backoff, fallback, config_file, tenant)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8),
+            transport=transport,
+        )
+        self._buffer: list = []
+        self._send_lock = None
+        self._wake = None
+        self._task = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def _start(self) -> None:
+        # Created on first use so the client can be constructed outside of a running loop
+        if self._task is None:
+            self._send_lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def send(self, card: Union[Card, dict, str], context: dict = None, transport: str = "webhook", channel: str = None, priority: str = None) -> asyncio.Future:
+        """
+        Queue a notification, see PingMeClient.send
+
+        Returns:
+            asyncio.Future: resolves to the result of the notification
+        """
+        if self._closed:
+            raise RuntimeError("AsyncPingMeClient is closed")
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((_notification(card, context, transport, channel, priority), future))
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+        return future
+
+    async def flush(self) -> None:
+        """Send everything buffered and wait for it"""
+        while self._buffer:
+            batch, self._buffer = self._buffer[: self.batch_size], self._buffer[self.batch_size:]
+            notifications = [n for n, _ in batch]
+            try:
+                async with self._send_lock:
+                    done = await self._deliver(notifications)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for notification, future in batch:
+                future.set_result(done[notification.id])
+
+    async def _deliver(self, notifications: list) -> dict:
+        attempts = self._attempts(notifications)
+        outcome = None
+        while True:
+            try:
+                step = attempts.send(outcome)
+            except StopIteration as stop:
+                return stop.value
+            if step[0] == "post":
+                try:
+                    outcome = await self._http.post("/bulk", json=step[1])
+                except httpx.TransportError as e:
+                    outcome = e
+            elif step[0] == "sleep":
+                await asyncio.sleep(step[1])
+                outcome = None
+            else:
+                # PingMe sends block, keep them off the event loop
+                outcome = await asyncio.to_thread(self._fallback_results, *step[1:])
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("AsyncPingMeClient flush failed")
+
+    async def aclose(self) -> None:
+        """Send what is buffered and close the connection pool"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            self._wake.set()
+            await self._task
+            await self.flush()
+        await self._http.aclose()
@@ -0,0 +1,189 @@
+import json
+import re
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator, model_validator
+
+from .channels import ChannelTable
+
+_UNRESOLVED = re.compile(r"\$\{[^}]+\}")
+
+
+def freeze(value):
+    """
+    Returns:
+        the value with every dict replaced by a read-only MappingProxyType and every list by a tuple, so a section
+        shared by all sends cannot be changed by one of them
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class _Frozen(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore", populate_by_name=True)
+
+
+class CardConfig(_Frozen):
+    """A card from config["pingme"]["cards"]"""
+
+    variables: Mapping[str, Any] = Field(default_factory=lambda: MappingProxyType({}))
+    template: Any
+    email_template: Optional[Mapping[str, Any]] = None
+    _template_json: str = PrivateAttr()
+
+    @field_validator("variables", mode="before")
+    @classmethod
+    def _variables(cls, value):
+        return value or {}
+
+    @field_validator("variables")
+    @classmethod
+    def _freeze_variables(cls, value):
+        return freeze(value)
+
+    @field_validator("template")
+    @classmethod
+    def _template(cls, value):
+        if value is None:
+            raise ValueError("template is required")
+        return freeze(value)
+
+    def model_post_init(self, __context) -> None:
+        # Serialized once, each send loads its own copy of the template from it
+        self._template_json = json.dumps(self.template, default=dict)
+
+    @field_validator("email_template")
+    @classmethod
+    def _email_template(cls, value):
+        if value is None:
+            return value
+        parts = {key: value.get(key) for key in ("subject", "text", "html")}
+        if not any(parts.values()):
+            raise ValueError("email_template needs a subject, text or html")
+        for key, part in parts.items():
+            if part is not None and not isinstance(part, str):
+                raise ValueError(f"email_template {key} must be a string")
+        return freeze(value)
+
+    def for_context(self, context: dict) -> dict:
+        """
+        Args:
+            context (dict): the context sent with the card
+
+        Returns:
+            dict: the card as PingMe.card, with the variables' defaults applied to a copy of the context and a copy
+            of the template
+        """
+        return {
+            "variables": dict(self.variables),
+            "template": json.loads(self._template_json),
+            "email_template": self.email_template,
+            "context": {**self.variables, **context},
+        }
+
+
+class SMTPOptions(_Frozen):
+    host: Optional[str] = None
+    port: Optional[int] = None
+    user: Optional[str] = None
+    password: Optional[str] = None
+
+
+class EmailOptions(_Frozen):
+    from_: Optional[str] = Field(None, alias="from")
+    to: Optional[str] = None
+    smtp: SMTPOptions = SMTPOptions()
+    attachments: Mapping[str, Any] = Field(default_factory=lambda: MappingProxyType({}))
+
+    @field_validator("attachments")
+    @classmethod
+    def _attachments(cls, value):
+        return freeze(value)
+
+    @model_validator(mode="after")
+    def _addresses(self):
+        if self.smtp.host and not (self.from_ and self.to):
+            raise ValueError("email from and to are required when an SMTP host is set")
+        return self
+
+
+class LogfileOptions(_Frozen):
+    path: Optional[str] = None
+
+
+class PingMeConfig(_Frozen):
+    """
+    The pingme section of a loaded config, validated once when the config is loaded so misconfiguration fails at
+    start up rather than at send time. Sections compiled by their own modules (webhook channels, routing, limits,
+    spool) are kept unvalidated in `options`, frozen like the rest of the model since every send shares them.
+    """
+
+    cards: Mapping[str, CardConfig]
+    email: EmailOptions = Field(default_factory=EmailOptions)
+    logfile: LogfileOptions = Field(default_factory=LogfileOptions)
+    options: Mapping[str, Any]
+    unresolved: Tuple[str, ...] = ()  # option paths still holding a ${VARIABLE}, e.g. "logfile.path"
+
+    @field_validator("cards", "options")
+    @classmethod
+    def _freeze(cls, value):
+        return freeze(value)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PingMeConfig":
+        """
+        Args:
+            config (dict): a config from core.load_config
+
+        Returns:
+            PingMeConfig: the validated model
+
+        Raises:
+            pydantic.ValidationError: if a card or option is invalid
+        """
+        pingme = config["pingme"]
+        options = pingme["options"]
+        webhook = options.get("webhook")
+        if isinstance(webhook, dict) and webhook.get("table") is None:
+            # Configs assembled by hand: compile the channel table now, the frozen options cannot store it later
+            options = {**options, "webhook": {**webhook, "table": ChannelTable.from_config(webhook)}}
+        return cls(
+            cards=pingme.get("cards") or {},
+            email=options.get("email") or {},
+            logfile=options.get("logfile") or {},
+            options=options,
+            unresolved=tuple(unresolved_paths(options, exclude=("table",))),
+        )
+
+
+def unresolved_paths(section, path: str = "", exclude: tuple = ()):
+    """
+    Yield the dotted paths of values in section that still contain a ${VARIABLE}, i.e. variables that were not set
+
+    Args:
+        section: a config section
+        path (str): the path of section
+        exclude (tuple): keys not to descend into
+    """
+    if isinstance(section, dict):
+        for key, value in section.items():
+            if key not in exclude:
+                yield from unresolved_paths(value, f"{path}.{key}" if path else str(key), exclude)
+    elif isinstance(section, list):
+        for i, value in enumerate(section):
+            yield from unresolved_paths(value, f"{path}[{i}]", exclude)
+    elif isinstance(section, str) and _UNRESOLVED.search(section):
+        yield path
+
+
+def model_of(config: dict) -> PingMeConfig:
+    """
+    Returns:
+        PingMeConfig: the model compiled by core.load_config, built now for configs assembled by hand
+    """
+    model = config["pingme"].get("model")
+    return model if model is not None else PingMeConfig.from_config(config)
@@ -0,0 +1,106 @@
+import os
+import threading
+from typing import Optional
+
+from . import core
+from .core import logger
+
+try:  # optional, Linux only: wake up on file events instead of waiting for the next poll
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class ConfigWatcher:
+    """
+    Background thread reloading the cached configs when their .env/.yaml files change, see core.reload_changed_configs.
+    While it runs get_config trusts its cache and skips the per call file checks. Uses inotify on the files'
+    directories when inotify_simple is installed, so editors that replace files are seen too, and polls otherwise.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        """
+        Args:
+            interval (float): seconds between checks, with inotify the longest wait between an event and the reload
+        """
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._watched = set()
+
+    def start(self) -> "ConfigWatcher":
+        if inotify_simple is not None:
+            try:
+                self._inotify = inotify_simple.INotify()
+            except OSError as e:
+                logger.warning(f"inotify is not available, polling config files instead: {e!r}")
+        core._cache_trusted = True
+        self._thread = threading.Thread(target=self.run, name="pingme-config-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        core._cache_trusted = False
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def _watch_directories(self) -> None:
+        flags = inotify_simple.flags
+        for directory in {os.path.dirname(os.path.abspath(path)) for path in core.config_files()} - self._watched:
+            try:
+                self._inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE)
+                self._watched.add(directory)
+            except OSError:
+                pass  # the directory may not exist yet, retried on the next round
+
+    def wait(self) -> None:
+        """Wait until a watched directory changes or interval seconds passed"""
+        if self._inotify is None:
+            self._stop.wait(self.interval)
+            return
+        self._watch_directories()
+        if self._inotify.read(timeout=int(self.interval * 1000)):
+            self._stop.wait(0.05)  # let the writer finish related files, e.g. the .env and its .yaml
+            self._inotify.read(timeout=0)
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self.wait()
+            if self._stop.is_set():
+                break
+            try:
+                core.reload_changed_configs()
+            except Exception as e:
+                logger.error(f"Config reload failed: {e!r}")
+
+
+_watcher: Optional[ConfigWatcher] = None
+
+
+def start(interval: float = None) -> Optional[ConfigWatcher]:
+    """
+    Start the process-wide config watcher, a no-op if it is running or the interval is 0
+
+    Args:
+        interval (float): seconds between checks, None uses settings.config_watch_interval
+
+    Returns:
+        ConfigWatcher: the watcher, None when reloading is disabled
+    """
+    global _watcher
+    interval = core.settings.config_watch_interval if interval is None else interval
+    if _watcher is None and interval > 0:
+        _watcher = ConfigWatcher(interval).start()
+    return _watcher
+
+
+def stop() -> None:
+    """Stop the process-wide config watcher, get_config checks the files on every call again"""
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
@@ -32,6 +32,11 @@ class Settings(BaseSettings):
 
     app_name: str = "PingMe"
     config_file: str = ""
+    tenants: dict = {}  # tenant name -> config file, selected per request by the API
+    config_cache_size: int = 32  # loaded configs kept in the LRU cache
+    data_dir: str = os.path.join(PROJECT_DIR, "output")  # local state such as the schedule database
+    log_format: str = "text"  # text or json, json writes one object per record including structured fields
+    config_watch_interval: float = 1.0  # seconds between config file checks of the webservice, 0 disables reloading
 
     @classmethod
     def create(cls):
@@ -44,33 +49,68 @@ class Settings(BaseSettings):
 
 settings = Settings().create()
 
+import atexit
+import json
 import logging
+import logging.handlers  # QueueHandler/QueueListener, request threads only enqueue records
 import os
+import queue
 import sys
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line with time, level, logger and message, plus any structured fields
+    passed with `extra=`, e.g. card, channel, transport, status_code and latency_ms of a send
+    """
+
+    _reserved = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in self._reserved and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+_queue_handler = None
+_listener = None
+
+
 # Set up logging
-def setup_logging(log_level=None):
-    """Configure logging for the application
-    
+def setup_logging(log_level=None, log_format: str = None):
+    """Configure logging for the application. Records are put on a queue by a QueueHandler on the root logger and
+    written to stdout (and logs/pingme.log in dev mode) by a QueueListener thread, so request threads never wait on
+    log I/O. Calling it again replaces the previous setup instead of adding handlers.
+
     Args:
         log_level (logging.Level): The logging level to use, if None it will default to DEBUG in dev mode and INFO in production mode
+        log_format (str): text or json, if None uses settings.log_format
     """
+    global _queue_handler, _listener
     log_level = log_level or (logging.DEBUG if DEV_MODE else logging.INFO)
+    log_format = log_format or settings.log_format
 
     # Create formatter
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-
-    # Configure root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(log_level)
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
 
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers = [console_handler]
 
     # File handler (optional)
     if DEV_MODE:
@@ -78,7 +118,21 @@ def setup_logging(log_level=None):
         os.makedirs(log_dir, exist_ok=True)
         file_handler = logging.FileHandler(os.path.join(log_dir, "pingme.log"))
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    # Configure root logger, replacing a previous setup
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    if _listener is not None:
+        _listener.stop()  # flushes what is queued
+        for handler in _listener.handlers:
+            handler.close()
+    if _queue_handler is not None:
+        root_logger.removeHandler(_queue_handler)
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    root_logger.addHandler(_queue_handler)
 
     # Create a logger for pingme
     logger = logging.getLogger("pingme")
@@ -86,6 +140,13 @@ def setup_logging(log_level=None):
     return logger
 
 
+@atexit.register
+def _stop_logging() -> None:
+    # Write out records still on the queue when the process exits
+    if _listener is not None:
+        _listener.stop()
+
+
 # Initialize logger
 logger = setup_logging()
 
@@ -97,6 +158,13 @@ import sys
 # add into settings.ini, requirements, package name is python-dotenv, for conda build ensure `conda config --add channels conda-forge`
 import dotenv  # for loading config from .env files, https://pypi.org/project/python-dotenv/
 import envyaml  # Allows to loads env vars into a yaml file, https://github.com/thesimj/envyaml
+import collections
+import re
+import threading
+
+from .channels import ChannelTable
+from .config_model import PingMeConfig
+from .routing import router_for
 
 from fastcore.script import call_parse
 
@@ -136,44 +204,232 @@ def set_env_variables(config_path: str, overide_env_vars: bool = True) -> bool:
     return True
 
 
-def get_config(config_path: str = None, overide_env_vars: bool = True) -> dict:
+# ${VAR} and ${VAR:-default} references in .env values, the syntax python-dotenv interpolates
+_ENV_REFERENCE = re.compile(r"\$\{(?P<name>[^}:]*)(?::-(?P<default>[^}]*))?\}")
+
+
+def _interpolate(value: str, variables: dict) -> str:
+    # Like python-dotenv's interpolation but against a private mapping instead of os.environ, unset names become ""
+    return _ENV_REFERENCE.sub(lambda match: variables.get(match["name"], match["default"]) or "", value)
+
+
+def _merge_env_file(variables: dict, env_file: str, override: bool) -> None:
     """
-    Load the config.env from the config path, the config.env should reference the config.yaml file, which will be loaded and returned as
-    a dictionary. The config.yaml file should be in the same directory as the config.env file.
+    Merge the values of a .env file into variables, ${VAR} references are interpolated against variables itself
+
+    Args:
+        variables (dict): the mapping to merge into, modified in place
+        env_file (str): path to the .env file
+        override (bool): if True, values from the file replace existing values
+    """
+    for name, value in dotenv.dotenv_values(env_file, interpolate=False).items():
+        if value is None:
+            continue
+        value = _interpolate(value, variables)
+        if override or name not in variables:
+            variables[name] = value
+
+
+def resolve_env_variables(config_path: str, overide_env_vars: bool = True) -> dict:
+    """
+    Build the variables for a config file without touching os.environ, same precedence as set_env_variables:
+    the default .env file < environment variables < config_path (unless overide_env_vars is False)
+
+    Args:
+        config_path (str): path to the config file
+        overide_env_vars (bool): if True, values from config_path replace environment variables
+
+    Returns:
+        dict: a private copy of the environment with the .env values applied
+    """
+    variables = dict(os.environ)
+    _merge_env_file(variables, f"{PACKAGE_DIR}/config/config.default.env", override=False)
+    if config_path and os.path.isfile(config_path):
+        _merge_env_file(variables, config_path, override=overide_env_vars)
+    return variables
+
+
+def load_config(config_path: str, overide_env_vars: bool = True) -> dict:
+    """
+    Build the config for a config file from its private variable mapping, nothing process-wide is modified so
+    configs for different files can be built concurrently
 
     Args:
         config_path (str): The path to the config.env file
-        overide_env_vars (bool): If the env vars should be overriden by the config.yaml file
+        overide_env_vars (bool): If the config.env values should override environment variables
 
     Returns:
-        dict: The config.yaml file as a dictionary, it'll also replace any ENV variables in the yaml file
+        dict: The config.yaml file as a dictionary with the variables interpolated
+
+    Raises:
+        pydantic.ValidationError: if a card or option in the config is invalid
     """
-    if config_path is None:
-        config_path = ""
-    # First sets environment with variables from config_path, then uses those variables to fill in appropriate values in the config.yaml file, the yaml file is then returned as a dict
-    # If you want user env variables to take precedence over the config.yaml file then set overide_env_vars to False
-    set_env_variables(config_path, overide_env_vars)
+    variables = resolve_env_variables(config_path, overide_env_vars)
 
     config: dict = envyaml.EnvYAML(
-        os.environ.get(
+        variables.get(
             "CORE_YAML_CONFIG_FILE", f"{PACKAGE_DIR}/config/config.default.yaml"
         ),
+        include_environment=False,
         strict=False,
+        **variables,
     ).export()
-    
 
-    
-    # loop through all environmental variables and print the ones with "WEBHOOK" in the name
+    # loop through all variables and add the ones prefixed with PINGME_WEBHOOK_URL_ as webhook channels
     prefix = 'PINGME_WEBHOOK_URL_'
-    for k, v in os.environ.items():
+    channels = config["pingme"]["options"]["webhook"]["channels"]
+    names = {name.lower(): name for name in channels}
+    for k, v in variables.items():
         if k.startswith(prefix):
             channel_name = k[len(prefix):].lower()
-            config["pingme"]["options"]["webhook"]["channels"][channel_name] = v
+            name = names.get(channel_name, channel_name)
+            if isinstance(channels.get(name), dict):
+                channels[name]["url"] = v  # keep the channel's other settings, e.g. its hedge
+            else:
+                channels[name] = v
+
+    # Compile the routing table once per load, sends then resolve channels with a dict lookup
+    webhook = config["pingme"]["options"]["webhook"]
+    webhook["table"] = ChannelTable.from_config(webhook)
+    router_for(config)
+    # Validate cards and options once, PingMe then reads them from the frozen model
+    config["pingme"]["model"] = PingMeConfig.from_config(config)
 
-    
     return config
 
 
+def _environ_snapshot() -> dict:
+    # Compared with the environment on every get_config, unless a config watcher keeps the cache fresh
+    return dict(os.environ)
+
+
+def _config_stamp(config_path: str) -> tuple:
+    # Anything that changes what load_config would produce for config_path, besides the environment
+    files = [f"{PACKAGE_DIR}/config/config.default.env", config_path]
+    stamp = []
+    for file in files:
+        try:
+            stamp.append(os.stat(file).st_mtime_ns)
+        except (OSError, TypeError):
+            stamp.append(None)
+    return tuple(stamp)
+
+
+# LRU of (config_path, overide_env_vars) -> (stamp, environ snapshot, yaml mtime, config), bounded by settings.config_cache_size
+_config_cache: collections.OrderedDict = collections.OrderedDict()
+_config_lock = threading.Lock()
+config_generation = 0  # bumped whenever a config is built or reloaded, reported on /health
+_cache_trusted = False  # set while a config_watch.ConfigWatcher keeps the cache fresh, get_config skips its checks
+
+
+def _yaml_mtime(config: dict):
+    try:
+        return os.stat(config.get("CORE_YAML_CONFIG_FILE", f"{PACKAGE_DIR}/config/config.default.yaml")).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_config(config_path: str = None, overide_env_vars: bool = True) -> dict:
+    """
+    Load the config.env from the config path, the config.env should reference the config.yaml file, which will be loaded and returned as
+    a dictionary. The config.yaml file should be in the same directory as the config.env file.
+
+    Configs are kept in an LRU cache per config path (settings.config_cache_size entries) and rebuilt when the .env/.yaml
+    files or the environment change. Building a config
+    does not modify os.environ, so it is safe to serve several config files from one process concurrently.
+    The returned dict is shared between callers and must be treated as read-only.
+
+    Args:
+        config_path (str): The path to the config.env file
+        overide_env_vars (bool): If the env vars should be overriden by the config.yaml file
+
+    Returns:
+        dict: The config.yaml file as a dictionary, it'll also replace any ENV variables in the yaml file
+    """
+    if config_path is None:
+        config_path = ""
+    global config_generation
+    key = (config_path, overide_env_vars)
+    cached = _config_cache.get(key)
+    if cached is not None and (_cache_trusted or _is_current(config_path, cached)):
+        try:
+            _config_cache.move_to_end(key)
+        except KeyError:
+            pass  # evicted concurrently, still valid for this caller
+        return cached[3]
+
+    with _config_lock:
+        stamp = _config_stamp(config_path)
+        environ = _environ_snapshot()
+        config = load_config(config_path, overide_env_vars)
+        _config_cache[key] = (stamp, environ, _yaml_mtime(config), config)
+        _config_cache.move_to_end(key)
+        config_generation += 1
+        while len(_config_cache) > max(settings.config_cache_size, 1):
+            _config_cache.popitem(last=False)
+    return config
+
+
+def _is_current(config_path: str, cached: tuple) -> bool:
+    # The files and environment a cached config was built from are unchanged
+    return (
+        cached[0] == _config_stamp(config_path)
+        and cached[1] == _environ_snapshot()
+        and cached[2] == _yaml_mtime(cached[3])
+    )
+
+
+def reload_changed_configs() -> list:
+    """
+    Rebuild the cached configs whose .env/.yaml files changed and swap them in. Requests already holding the old
+    config finish with it. A config that fails to load is logged and the old one is kept serving.
+
+    Returns:
+        list: the config paths that were reloaded
+    """
+    global config_generation
+    reloaded = []
+    for key, cached in list(_config_cache.items()):
+        config_path, overide_env_vars = key
+        stamp = cached[0]
+        try:
+            # Inside the try so a config whose files cannot be checked does not stop the others from reloading
+            stamp = _config_stamp(config_path)
+            if cached[0] == stamp and cached[2] == _yaml_mtime(cached[3]):
+                continue
+            config = load_config(config_path, overide_env_vars)
+        except Exception as e:
+            logger.error(f"Config {config_path or 'default'} changed but failed to load, keeping the previous one: {e!r}")
+            # Remember the stamp so the broken files are not retried until they change again
+            _config_cache[key] = (stamp, cached[1], _yaml_mtime(cached[3]), cached[3])
+            continue
+        with _config_lock:
+            _config_cache[key] = (stamp, _environ_snapshot(), _yaml_mtime(config), config)
+            config_generation += 1
+        logger.info(f"Reloaded config {config_path or 'default'}, generation {config_generation}")
+        reloaded.append(config_path)
+    return reloaded
+
+
+def config_files() -> set:
+    """
+    Returns:
+        set: the .env and .yaml files of every cached config
+    """
+    files = {f"{PACKAGE_DIR}/config/config.default.env"}
+    for (config_path, _), cached in list(_config_cache.items()):
+        if config_path:
+            files.add(config_path)
+        files.add(cached[3].get("CORE_YAML_CONFIG_FILE", f"{PACKAGE_DIR}/config/config.default.yaml"))
+    return files
+
+
+def clear_config_cache() -> None:
+    """Drop all cached configs, the next get_config rebuilds them"""
+    with _config_lock:
+        _config_cache.clear()
+
+
 # create a os.PathLike object
 config = get_config(os.environ.get("CORE_CONFIG_FILE", ""))
 
@@ -244,10 +500,10 @@ def cli(
         config_file (str): The path to the config file, if not provided it will use the default config file
     """
     config = get_config(config_file)  # Set env vars and get config variables
-    if name is not None:
-        config["example"]["input"]["name"] = name
+    if name is None:
+        name = config["example"]["input"]["name"]
 
-    print(hello_world(config["example"]["input"]["name"]))
+    print(hello_world(name))
 
 
 
@@ -0,0 +1,340 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import sqlite3  # compact local store, one row per failed delivery
+import threading
+import time
+from typing import Optional
+
+from fastcore.script import call_parse
+
+from . import metrics
+from .core import logger, settings
+
+
+class DeadLetterStore:
+    """
+    Failed deliveries kept on disk so they can be replayed once the receiver is back. Each letter holds the card
+    (name, context and priority, the payload is rendered again on replay), the transport and channel, the config file
+    it was sent with, the last error and the number of attempts. When only some URLs of a channel group or parts of a
+    split card failed, `targets` lists those as {"url", "part"} and a replay only sends to them.
+    """
+
+    _columns = (
+        "id", "failed_at", "last_attempt", "card", "transport", "channel", "config_file", "error", "status_code",
+        "attempts", "targets",
+    )
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): SQLite file to store letters in
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS letters ("
+            "id INTEGER PRIMARY KEY, failed_at REAL NOT NULL, last_attempt REAL NOT NULL, card TEXT NOT NULL, "
+            "card_name TEXT NOT NULL, transport TEXT NOT NULL, channel TEXT, config_file TEXT, error TEXT, "
+            "status_code INTEGER, attempts INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS letters_failed_at ON letters (failed_at)")
+        if "targets" not in {row[1] for row in self._db.execute("PRAGMA table_info(letters)")}:
+            self._db.execute("ALTER TABLE letters ADD COLUMN targets TEXT")  # stores from before targets were kept
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM letters").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def add(
+        self,
+        card: dict,
+        transport: str,
+        channel: str = None,
+        config_file: str = None,
+        error: str = None,
+        status_code: int = None,
+        targets: list = None,
+    ) -> int:
+        """
+        Store a failed delivery
+
+        Args:
+            card (dict): the card as {"name", "context", "priority"}
+            transport (str): webhook or email
+            channel (str): webhook channel, None for the default channel
+            config_file (str): the config file the card was sent with
+            error (str): the exception or response of the failed attempt
+            status_code (int): status code of the failed attempt, None if it raised
+            targets (list): the {"url", "part"} that failed when others succeeded, None if the whole card failed
+
+        Returns:
+            int: the letter id
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO letters (failed_at, last_attempt, card, card_name, transport, channel, config_file, error, "
+                "status_code, attempts, targets) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)",
+                (
+                    now, now, json.dumps(card), card["name"], transport, channel, config_file, error, status_code,
+                    json.dumps(targets) if targets is not None else None,
+                ),
+            )
+            return cursor.lastrowid
+
+    def query(
+        self,
+        since: float = None,
+        until: float = None,
+        channel: str = None,
+        card: str = None,
+        transport: str = None,
+        limit: int = None,
+    ) -> list:
+        """
+        Args:
+            since (float): only letters that first failed at or after this unix time
+            until (float): only letters that first failed before this unix time
+            channel (str): only letters for this webhook channel, "default" matches sends without a channel
+            card (str): only letters for this card name
+            transport (str): only letters for this transport
+            limit (int): at most this many letters, oldest first
+
+        Returns:
+            list: letters as dicts, oldest first
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("failed_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("failed_at < ?")
+            params.append(until)
+        if channel is not None:
+            conditions.append("COALESCE(channel, 'default') = ?")
+            params.append(channel)
+        if card is not None:
+            conditions.append("card_name = ?")
+            params.append(card)
+        if transport is not None:
+            conditions.append("transport = ?")
+            params.append(transport)
+        sql = f"SELECT {', '.join(self._columns)} FROM letters"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        letters = [dict(zip(self._columns, row)) for row in rows]
+        for letter in letters:
+            letter["card"] = json.loads(letter["card"])
+            letter["targets"] = json.loads(letter["targets"]) if letter["targets"] is not None else None
+        return letters
+
+    def remove(self, letter_id: int) -> bool:
+        """
+        Returns:
+            bool: True if the letter existed
+        """
+        with self._lock:
+            return self._db.execute("DELETE FROM letters WHERE id = ?", (letter_id,)).rowcount > 0
+
+    def failed_again(self, letter_id: int, error: str = None, status_code: int = None, targets: list = None) -> None:
+        """
+        Record another failed attempt of a letter
+
+        Args:
+            letter_id (int): the letter id
+            error (str): the exception or response of the attempt
+            status_code (int): status code of the attempt, None if it raised
+            targets (list): the {"url", "part"} that failed again when others succeeded, None keeps the letter's targets
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE letters SET attempts = attempts + 1, last_attempt = ?, error = ?, status_code = ?, "
+                "targets = COALESCE(?, targets) WHERE id = ?",
+                (time.time(), error, status_code, json.dumps(targets) if targets is not None else None, letter_id),
+            )
+
+
+_store: Optional[DeadLetterStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> DeadLetterStore:
+    """
+    The process-wide dead-letter store in settings.data_dir, opened on first use
+
+    Returns:
+        DeadLetterStore: the store
+    """
+    global _store
+    path = os.path.join(settings.data_dir, "deadletter.sqlite")
+    if _store is None or _store.path != path:
+        with _store_lock:
+            if _store is None or _store.path != path:
+                os.makedirs(settings.data_dir, exist_ok=True)
+                _store = DeadLetterStore(path)
+    return _store
+
+
+def close_store() -> None:
+    """Close the process-wide store if it was opened"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+
+def record(
+    card,
+    transport: str,
+    channel: str = None,
+    config_file: str = None,
+    error: str = None,
+    status_code: int = None,
+    targets: list = None,
+) -> None:
+    """
+    Store a failed delivery in the process-wide store, a failure to store is logged and never hides the original error
+
+    Args:
+        card (Card): the card that failed
+        transport (str): webhook or email
+        channel (str): webhook channel
+        config_file (str): the config file the card was sent with
+        error (str): the exception or response of the failed attempt
+        status_code (int): status code of the failed attempt, None if it raised
+        targets (list): the {"url", "part"} that failed when others succeeded, None if the whole card failed
+    """
+    try:
+        letter_id = get_store().add(card.model_dump(), transport, channel, config_file, error, status_code, targets)
+    except Exception:
+        logger.exception(f"Could not dead-letter card {card.name}")
+        return
+    logger.warning(f"Dead-lettered {transport} card {card.name} as {letter_id}: {error}")
+
+
+def send_letter(letter: dict) -> dict:
+    """
+    Send a letter again through the normal delivery path, without dead-lettering it a second time
+
+    Args:
+        letter (dict): a letter from DeadLetterStore.query
+
+    Returns:
+        dict: the parsed response
+    """
+    from .pingme_class import Card
+    from .services import NotificationService
+
+    card = Card.model_validate(letter["card"])
+    if letter["transport"] == "email":
+        return NotificationService._deliver_email(card, config_file=letter["config_file"], dead_letter=False)
+    return NotificationService._deliver_webhook(
+        card, channel=letter["channel"], config_file=letter["config_file"], dead_letter=False, targets=letter.get("targets")
+    )
+
+
+def replay(
+    store: DeadLetterStore,
+    letters: list,
+    concurrency: int = 4,
+    rate: float = 0.0,
+    send=send_letter,
+) -> dict:
+    """
+    Send letters again, letters that succeed are removed and letters that fail have their attempt count increased
+
+    Args:
+        store (DeadLetterStore): the store the letters came from
+        letters (list): letters from store.query
+        concurrency (int): sends in flight at once
+        rate (float): maximum sends started per second, 0 means unlimited
+        send (callable): sends a letter and returns the parsed response
+
+    Returns:
+        dict: counts of replayed (delivered) and failed letters
+    """
+    from .pingme_class import failed_targets
+
+    interval = 1.0 / rate if rate else 0.0
+    pacer = {"next": time.monotonic()}
+    pacer_lock = threading.Lock()
+    counts = {"replayed": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def replay_one(letter: dict) -> None:
+        if interval:
+            with pacer_lock:
+                start = max(pacer["next"], time.monotonic())
+                pacer["next"] = start + interval
+            time.sleep(max(0.0, start - time.monotonic()))
+        metrics.record_retry(letter["card"]["name"], letter["channel"] or "", letter["transport"])
+        try:
+            result = send(letter)
+            failure = None
+            if not 200 <= result["status_code"] < 300:
+                failure = (str(result["response"])[:2000], result["status_code"], result.get("failed_targets"))
+        except Exception as e:
+            failure = (repr(e)[:2000], None, failed_targets(e))
+        if failure is None:
+            store.remove(letter["id"])
+        else:
+            store.failed_again(letter["id"], *failure)
+        with counts_lock:
+            counts["failed" if failure else "replayed"] += 1
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="pingme-replay") as pool:
+        list(pool.map(replay_one, letters))
+    return counts
+
+
+def _timestamp(value: str) -> Optional[float]:
+    # ISO 8601 time (naive times are local time) to unix time
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+@call_parse
+def cli(
+    since: str = None,  # Only letters that failed at or after this ISO time, e.g. 2026-10-19T08:00
+    until: str = None,  # Only letters that failed before this ISO time
+    channel: str = None,  # Only letters for this webhook channel
+    card: str = None,  # Only letters for this card name
+    transport: str = None,  # Only letters for this transport, webhook or email
+    limit: int = None,  # Replay at most this many letters, oldest first
+    concurrency: int = 4,  # Sends in flight at once
+    rate: float = 10.0,  # Maximum sends per second, 0 for unlimited
+    dry_run: bool = False,  # List the matching letters instead of sending them
+):
+    """
+    Replay failed deliveries from the dead-letter store in <DATA_DIR>/deadletter.sqlite, e.g. after a webhook outage.
+    Delivered letters are removed, letters that fail again stay with their attempt count increased.
+    """
+    store = get_store()
+    letters = store.query(since=_timestamp(since), until=_timestamp(until), channel=channel, card=card, transport=transport, limit=limit)
+    if dry_run:
+        for letter in letters:
+            failed_at = datetime.datetime.fromtimestamp(letter["failed_at"]).isoformat(timespec="seconds")
+            print(
+                f"{letter['id']}\t{failed_at}\t{letter['transport']}\t{letter['channel'] or 'default'}\t"
+                f"{letter['card']['name']}\tattempts={letter['attempts']}\t{letter['error']}"
+            )
+        print(f"{len(letters)} letters")
+        return
+    counts = replay(store, letters, concurrency=concurrency, rate=rate)
+    print(f"Replayed {counts['replayed']} of {len(letters)} letters, {counts['failed']} failed again, {len(store)} left in the store")
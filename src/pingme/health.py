@@ -0,0 +1,217 @@
+import concurrent.futures
+import socket
+import threading
+import urllib.parse
+from typing import Optional
+
+from . import adaptive, core, limits, spool, tenants
+from .core import logger
+from .pingme_class import http_session
+
+REFRESH_INTERVAL = 30.0  # seconds between probe rounds, so load balancer checks never open connections themselves
+PROBE_TIMEOUT = 2.0
+PROBE_WORKERS = 8
+
+_probes: dict = {}  # (host, port) -> error or None, written by refresh()
+_spool_pending = None  # spooled payloads of the active config at the last refresh(), None before the first
+
+
+def http_pools() -> dict:
+    """
+    Returns:
+        dict: host -> connections in use, idle and the pool size of the shared webhook HTTP session
+    """
+    pools = {}
+    for adapter in http_session.adapters.values():
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            # The pool's queue holds idle connections and None for slots without a connection yet
+            slots = list(pool.pool.queue)
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "in_use": max(pool.pool.maxsize - len(slots), 0),
+                "idle": sum(1 for connection in slots if connection is not None),
+                "size": pool.pool.maxsize,
+            }
+    return pools
+
+
+def health() -> dict:
+    """
+    Liveness and load of this instance from in-memory state only, cheap enough to poll often
+
+    Returns:
+        dict: status, config generation, HTTP pool use, in-flight sends and queues per config and the adaptive limit
+        of every webhook host
+    """
+    return {
+        "status": "ok",
+        "config_generation": core.config_generation,
+        "http_pools": http_pools(),
+        "limits": limits.snapshot(),
+        "webhook_hosts": adaptive.snapshot(),
+    }
+
+
+def probe(host: str, port: int, timeout: float = PROBE_TIMEOUT):
+    """
+    Check a host accepts TCP connections
+
+    Args:
+        host (str): host name
+        port (int): port
+        timeout (float): connect timeout in seconds
+
+    Returns:
+        str: the error, None if the host is reachable
+    """
+    try:
+        socket.create_connection((host, port), timeout=timeout).close()
+        return None
+    except OSError as e:
+        return repr(e)
+
+
+def _targets(config: dict) -> set:
+    # (host, port) of every webhook channel and the SMTP relay of a config
+    targets = set()
+    for url in (config["pingme"]["options"]["webhook"].get("channels") or {}).values():
+        url = url.get("url") if isinstance(url, dict) else url
+        parts = urllib.parse.urlsplit(url or "")
+        if parts.hostname:
+            targets.add((parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)))
+    smtp = config["pingme"]["model"].email.smtp
+    if smtp.host:
+        targets.add((smtp.host, smtp.port or 25))
+    return targets
+
+
+def _served_configs() -> dict:
+    return {"default": core.settings.config_file, **core.settings.tenants}
+
+
+def refresh() -> None:
+    """
+    Probe every webhook host and SMTP relay of the served configs and count the spool backlog, the results are what
+    ready() reports. Blocks for up to PROBE_TIMEOUT seconds per round of PROBE_WORKERS hosts, run it in the background.
+    """
+    global _probes, _spool_pending
+    targets = set()
+    for config_file in _served_configs().values():
+        try:
+            targets |= _targets(core.get_config(config_file))
+        except Exception:
+            pass  # reported by ready() as a config failure
+    targets = sorted(targets)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="pingme-probe") as pool:
+        errors = list(pool.map(lambda target: probe(*target), targets))
+    _probes = dict(zip(targets, errors))  # swapped whole, readers never see a half finished round
+    try:
+        options = core.get_config(tenants.active_config_file())["pingme"]["options"]
+        _spool_pending = len(spool.pending(spool.spool_dir(options.get("spool"))))
+    except Exception:
+        _spool_pending = None
+
+
+def ready(probe_hosts: bool = False) -> tuple:
+    """
+    Readiness of this instance: every served config loads and validates, no limiter or channel is saturated and, if
+    probe_hosts, every webhook host and SMTP relay accepted connections when last probed. Never opens a connection or
+    reads the spool itself, probes and the spool backlog are the results of the last refresh()
+
+    Args:
+        probe_hosts (bool): also require the webhook hosts and SMTP relays to be reachable
+
+    Returns:
+        tuple: (ready, report) where report is health() plus the failed checks and the spool backlog
+    """
+    failures = []
+    targets = set()
+    for name, config_file in _served_configs().items():
+        try:
+            config = core.get_config(config_file)
+        except Exception as e:
+            failures.append(f"config {name}: {e!r}")
+            continue
+        targets |= _targets(config)
+    report = health()
+    for config_file, snapshot in report["limits"].items():
+        if snapshot["saturated"]:
+            failures.append(f"limits {config_file or 'default'}: saturated")
+        for channel in snapshot["saturated_channels"]:
+            failures.append(f"limits {config_file or 'default'}: channel {channel} saturated")
+    if probe_hosts:
+        report["probes"] = {}
+        probes = _probes
+        for host, port in sorted(targets):
+            if (host, port) not in probes:
+                report["probes"][f"{host}:{port}"] = "pending"  # not probed yet, e.g. a config added since
+                continue
+            error = probes[(host, port)]
+            report["probes"][f"{host}:{port}"] = error or "ok"
+            if error is not None:
+                failures.append(f"probe {host}:{port}: {error}")
+    if _spool_pending is not None:
+        report["spool_pending"] = _spool_pending
+    report["status"] = "ready" if not failures else "not ready"
+    report["failures"] = failures
+    return not failures, report
+
+
+class ProbeRefresher:
+    """Background thread calling refresh() every interval seconds, so /ready only reads cached results"""
+
+    def __init__(self, interval: float = REFRESH_INTERVAL):
+        """
+        Args:
+            interval (float): seconds between refreshes
+        """
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "ProbeRefresher":
+        self._thread = threading.Thread(target=self.run, name="pingme-probes", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=PROBE_TIMEOUT + 1)
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                refresh()
+            except Exception as e:
+                logger.error(f"Health probes failed: {e!r}")
+            self._stop.wait(self.interval)
+
+
+_refresher: Optional[ProbeRefresher] = None
+
+
+def start(interval: float = REFRESH_INTERVAL) -> ProbeRefresher:
+    """
+    Start the process-wide probe refresher, a no-op if it is running
+
+    Args:
+        interval (float): seconds between refreshes
+
+    Returns:
+        ProbeRefresher: the refresher
+    """
+    global _refresher
+    if _refresher is None:
+        _refresher = ProbeRefresher(interval).start()
+    return _refresher
+
+
+def stop() -> None:
+    """Stop the process-wide probe refresher"""
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher = None
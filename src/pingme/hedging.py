@@ -0,0 +1,190 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Optional
+
+
+class LatencyWindow:
+    """Latencies of the most recent sends to a channel, for percentile thresholds"""
+
+    def __init__(self, size: int = 256):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Args:
+            q (float): percentile between 0 and 100
+
+        Returns:
+            float: nearest-rank percentile of the window, None when empty
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(int(-(-q * len(samples) // 100)) - 1, 0)
+        return samples[min(rank, len(samples) - 1)]
+
+
+_windows: dict = collections.defaultdict(LatencyWindow)  # channel -> LatencyWindow
+
+
+def observe(channel: str, seconds: float) -> None:
+    """Record the latency of a send to a channel"""
+    _windows[channel].observe(seconds)
+
+
+def window(channel: str) -> LatencyWindow:
+    """
+    Returns:
+        LatencyWindow: the recent latencies of a channel
+    """
+    return _windows[channel]
+
+
+class HedgePolicy:
+    """
+    When to also send to a backup: after a fixed delay, or after the channel's observed latency percentile once enough
+    sends have been seen (`delay` is used until then), clamped to [min_delay, max_delay]
+    """
+
+    def __init__(
+        self,
+        backup_urls: tuple,
+        after="p95",
+        delay: float = 1.0,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+        max_delay: float = 10.0,
+    ):
+        """
+        Args:
+            backup_urls (tuple): URLs the payload is also sent to when the primary is slow
+            after (str | float): "p<N>" for the channel's N-th latency percentile, or a fixed number of seconds
+            delay (float): seconds used while fewer than min_samples latencies are known
+            min_samples (int): latencies needed before the percentile is trusted
+            min_delay (float): lower bound of the hedge delay
+            max_delay (float): upper bound of the hedge delay
+        """
+        self.backup_urls = tuple(backup_urls)
+        self.quantile = None
+        self.delay = delay
+        if isinstance(after, str) and after.lower().startswith("p"):
+            self.quantile = float(after[1:])
+        elif after is not None:
+            self.delay = float(after)
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, hedge: dict, backup_urls: tuple):
+        """
+        Args:
+            hedge (dict): the hedge section of a channel, e.g. {"backup": "default", "after": "p95"}
+            backup_urls (tuple): the resolved URLs of hedge["backup"]
+        """
+        return cls(
+            backup_urls,
+            after=hedge.get("after", "p95"),
+            delay=hedge.get("delay", 1.0),
+            min_samples=hedge.get("min_samples", 20),
+            min_delay=hedge.get("min_delay", 0.05),
+            max_delay=hedge.get("max_delay", 10.0),
+        )
+
+    def threshold(self, channel: str) -> float:
+        """
+        Returns:
+            float: seconds to wait for the primary before hedging
+        """
+        delay = self.delay
+        if self.quantile is not None:
+            latencies = window(channel)
+            if len(latencies) >= self.min_samples:
+                delay = latencies.quantile(self.quantile)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+
+_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="pingme-hedge")
+    return _pool
+
+
+def _ok(future: concurrent.futures.Future) -> bool:
+    return future.exception() is None and future.result().status_code < 300
+
+
+def hedged_send(send, url: str, policy: HedgePolicy, channel: str, on_hedge=None):
+    """
+    Send to url, and also to the policy's backup URLs if url has not answered within the policy's threshold.
+    Returns the first successful response; the slower request is left to finish in the background. The primary's
+    latency is recorded for the channel, including when it finishes after the backup.
+
+    Args:
+        send (callable): send(url) returning a response
+        url (str): the primary URL
+        policy (HedgePolicy): when and where to hedge
+        channel (str): the channel, for its latency threshold
+        on_hedge (callable): called when the backup requests are started
+
+    Returns:
+        the first 2xx response, otherwise the primary's response
+
+    Raises:
+        Exception: the primary's exception when every request failed and the primary raised
+    """
+    pool = _executor()
+    primary = pool.submit(timed(send, channel), url)
+    try:
+        primary.result(timeout=policy.threshold(channel))
+    except concurrent.futures.TimeoutError:
+        pass
+    except Exception:
+        pass  # a failed primary is hedged right away
+    if primary.done() and _ok(primary):
+        return primary.result()
+
+    if on_hedge is not None:
+        on_hedge()
+    pending = {primary} | {pool.submit(send, backup) for backup in policy.backup_urls}
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if _ok(future):
+                return future.result()
+    return primary.result()
+
+
+def timed(send, channel: str):
+    """
+    Wrap send(url) so the latency of every successful call is recorded for the channel
+
+    Args:
+        send (callable): send(url) returning a response
+        channel (str): the channel to record latencies for
+    """
+    def timed_send(url):
+        start = time.perf_counter()
+        response = send(url)
+        observe(channel, time.perf_counter() - start)
+        return response
+
+    return timed_send
@@ -0,0 +1,159 @@
+import contextlib
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger("pingme.hooks")
+
+# Registered hooks, replaced (never mutated) on register/remove so the hot path can iterate without a lock
+_stage_hooks: tuple = ()
+_enter_hooks: tuple = ()
+_registry_lock = threading.Lock()
+_NOOP = contextlib.nullcontext()
+
+
+def on_stage(hook):
+    """
+    Register a hook called as hook(name, duration, attrs) after every timed stage. If the hook also has an
+    enter(name, attrs) method it is called when the stage starts. Can be used as a decorator.
+
+    Stages: request, get_config, card_lookup, resolved_payload, size_guard, render_email, send_to_webhook,
+    send_to_email, send_to_logfile, parse_webhook_response, parse_smtp_response
+
+    Args:
+        hook (callable): the hook, duration is in seconds and attrs is a dict with e.g. card, channel and transport
+
+    Returns:
+        callable: the hook
+    """
+    global _stage_hooks, _enter_hooks
+    with _registry_lock:
+        _stage_hooks = _stage_hooks + (hook,)
+        if callable(getattr(hook, "enter", None)):
+            _enter_hooks = _enter_hooks + (hook,)
+    return hook
+
+
+def remove_hook(hook) -> None:
+    """
+    Unregister a hook added with on_stage, unknown hooks are ignored
+    """
+    global _stage_hooks, _enter_hooks
+    with _registry_lock:
+        _stage_hooks = tuple(h for h in _stage_hooks if h is not hook)
+        _enter_hooks = tuple(h for h in _enter_hooks if h is not hook)
+
+
+class _Stage:
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        for hook in _enter_hooks:
+            try:
+                hook.enter(self.name, self.attrs)
+            except Exception:
+                logger.exception(f"Stage hook {hook!r} failed on enter of {self.name}")
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        duration = time.perf_counter() - self.start
+        for hook in _stage_hooks:
+            try:
+                hook(self.name, duration, self.attrs)
+            except Exception:
+                logger.exception(f"Stage hook {hook!r} failed on {self.name}")
+
+
+def stage(name: str, **attrs):
+    """
+    Context manager timing a stage and firing the registered hooks, a shared no-op context when no hooks are registered
+
+    Args:
+        name (str): stage name
+        **attrs: attributes passed on to the hooks e.g. card, channel, transport
+    """
+    if not _stage_hooks:
+        return _NOOP
+    return _Stage(name, attrs)
+
+
+class LogHook:
+    """
+    Built-in hook that logs each stage as a structured record, the fields are also attached to the record as
+    `stage`, `duration_ms` and the stage attributes for JSON formatters
+    """
+
+    def __init__(self, stages: set = None, threshold: float = 0.0, level: int = logging.INFO, log=None):
+        """
+        Args:
+            stages (set): stage names to log, None logs all
+            threshold (float): only log stages taking at least this many seconds
+            level (int): logging level
+            log (logging.Logger): logger to use, defaults to pingme.stages
+        """
+        self.stages = stages
+        self.threshold = threshold
+        self.level = level
+        self.log = log or logging.getLogger("pingme.stages")
+
+    def __call__(self, name: str, duration: float, attrs: dict) -> None:
+        if duration < self.threshold or (self.stages is not None and name not in self.stages):
+            return
+        fields = " ".join(f"{k}={v}" for k, v in attrs.items())
+        self.log.log(
+            self.level,
+            f"stage={name} duration_ms={duration * 1000:.3f} {fields}".rstrip(),
+            extra={"stage": name, "duration_ms": duration * 1000, **attrs},
+        )
+
+
+class SlowRequestProfiler:
+    """
+    Built-in hook that runs cProfile on a sample of `request` stages and dumps the stats of those slower than a
+    threshold as `<directory>/<transport>-<card>-<timestamp>.prof`, inspect them with `python -m pstats` or snakeviz
+    """
+
+    def __init__(self, directory: str, threshold: float = 1.0, sample_rate: float = 0.01, stage: str = "request"):
+        """
+        Args:
+            directory (str): where to write .prof files, created if missing
+            threshold (float): only dump profiles of requests taking at least this many seconds
+            sample_rate (float): fraction of requests to profile
+            stage (str): the stage to profile
+        """
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.stage = stage
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+
+    def enter(self, name: str, attrs: dict) -> None:
+        if name != self.stage or random.random() >= self.sample_rate:
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # another profiler is active (Python 3.12+ allows only one)
+        self._local.profiler = profiler
+
+    def __call__(self, name: str, duration: float, attrs: dict) -> None:
+        if name != self.stage:
+            return
+        profiler = getattr(self._local, "profiler", None)
+        if profiler is None:
+            return
+        profiler.disable()
+        self._local.profiler = None
+        if duration >= self.threshold:
+            filename = f"{attrs.get('transport', name)}-{attrs.get('card', '')}-{time.time_ns()}.prof"
+            profiler.dump_stats(os.path.join(self.directory, filename))
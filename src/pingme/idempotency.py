@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3  # shared by all worker processes, one row per notification id
+import threading
+import time
+from typing import Optional
+
+from .core import settings
+
+
+class StillSending(Exception):
+    """Another request is sending a notification with the same id and has not finished within the wait"""
+
+
+class IdempotencyStore:
+    """
+    Notification ids and the results they got, kept in SQLite so every worker process sees them. An id is reserved
+    before its notification is sent: a retry arriving while the first attempt is still sending waits for that
+    result instead of sending again. A reservation not completed within `lease` seconds (the process died while
+    sending) can be taken over. Ids are forgotten after `ttl` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, lease: float = 300.0):
+        """
+        Args:
+            path (str): SQLite file to store ids in
+            ttl (float): seconds an id and its result are remembered
+            lease (float): seconds after which an unfinished reservation is considered abandoned
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ids (config_file TEXT NOT NULL, id TEXT NOT NULL, reserved_at REAL NOT NULL, "
+            "result TEXT, PRIMARY KEY (config_file, id))"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _try_claim(self, config_file: str, key: str):
+        # Returns (True, None) when reserved by the caller, (False, result) when already sent, (False, None) when
+        # another request is still sending it
+        now = time.time()
+        with self._lock:
+            if self._db.execute(
+                "INSERT OR IGNORE INTO ids (config_file, id, reserved_at) VALUES (?, ?, ?)", (config_file, key, now)
+            ).rowcount:
+                return True, None
+            row = self._db.execute(
+                "SELECT reserved_at, result FROM ids WHERE config_file = ? AND id = ?", (config_file, key)
+            ).fetchone()
+            if row is None:
+                return False, None  # released in between, try again
+            reserved_at, result = row
+            if result is not None:
+                return False, json.loads(result)
+            if now - reserved_at > self.lease and self._db.execute(
+                "UPDATE ids SET reserved_at = ? WHERE config_file = ? AND id = ? AND reserved_at = ? AND result IS NULL",
+                (now, config_file, key, reserved_at),
+            ).rowcount:
+                return True, None
+            return False, None
+
+    def claim(self, config_file: str, key: str, wait: float = 30.0) -> Optional[dict]:
+        """
+        Reserve a notification id before sending it
+
+        Args:
+            config_file (str): the config file the notification is sent with, ids are per config
+            key (str): the notification id
+            wait (float): seconds to wait for another request sending the same id
+
+        Returns:
+            dict: None if the caller reserved the id and must send, complete or release it, otherwise the result
+            of the earlier send
+
+        Raises:
+            StillSending: if another request is still sending the id after wait seconds
+        """
+        deadline = time.monotonic() + wait
+        pause = 0.005
+        while True:
+            claimed, result = self._try_claim(config_file, key)
+            if claimed or result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                raise StillSending(f"Notification {key} is still being sent")
+            time.sleep(min(pause, max(0.0, deadline - time.monotonic())))
+            pause = min(pause * 2, 0.1)
+
+    def complete(self, config_file: str, key: str, result: dict) -> None:
+        """Store the result of a reserved id, later claims get it instead of sending again"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE ids SET result = ? WHERE config_file = ? AND id = ?", (json.dumps(result), config_file, key)
+            )
+            self._writes += 1
+            if self._writes % 1024 == 0:
+                self._db.execute("DELETE FROM ids WHERE reserved_at < ?", (time.time() - self.ttl,))
+
+    def release(self, config_file: str, key: str) -> None:
+        """Drop a reservation without a result, the notification was not sent and may be retried"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM ids WHERE config_file = ? AND id = ? AND result IS NULL", (config_file, key)
+            )
+
+
+_store: Optional[IdempotencyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> IdempotencyStore:
+    """
+    The process-wide idempotency store in settings.data_dir, opened on first use
+
+    Returns:
+        IdempotencyStore: the store
+    """
+    global _store
+    path = os.path.join(settings.data_dir, "idempotency.sqlite")
+    if _store is None or _store.path != path:
+        with _store_lock:
+            if _store is None or _store.path != path:
+                os.makedirs(settings.data_dir, exist_ok=True)
+                _store = IdempotencyStore(path)
+    return _store
+
+
+def close_store() -> None:
+    """Close the process-wide store if it was opened"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
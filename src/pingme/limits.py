@@ -0,0 +1,267 @@
+import collections
+import contextlib
+import threading
+
+from . import core
+
+
+class Overloaded(Exception):
+    """
+    Raised when a send is refused because the in-flight limit is reached, the API turns it into 429 (queue full) or
+    503 (timed out waiting in the queue) with a Retry-After header
+    """
+
+    def __init__(self, message: str, retry_after: int = 1, status_code: int = 429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+_EMPTY = collections.Counter()
+
+
+class _Waiter:
+    __slots__ = ("channel", "lane", "granted")
+
+    def __init__(self, channel: str, lane: str):
+        self.channel = channel
+        self.lane = lane
+        self.granted = False
+
+
+class InFlightLimiter:
+    """
+    Bounds concurrent sends globally and per channel, with a bounded number of callers allowed to wait for a slot.
+    A limit of 0 means unlimited.
+
+    Sends are split into priority lanes. Each lane can have a reserved share of every limit that other lanes cannot
+    use, so critical alerts find free capacity under bulk load. When a slot frees up it is handed to the waiting lanes
+    by weighted fair queuing (a lane with weight 8 gets 8 slots for every slot of a lane with weight 1), FIFO within
+    a lane.
+    """
+
+    def __init__(
+        self,
+        in_flight: int = 0,
+        channels: dict = None,
+        queue_depth: int = 0,
+        queue_timeout: float = 10.0,
+        retry_after: int = 1,
+        weights: dict = None,
+        reserved: dict = None,
+    ):
+        """
+        Args:
+            in_flight (int): maximum concurrent sends over all channels
+            channels (dict): channel name -> maximum concurrent sends to that channel, email sends use the channel "email".
+                Names are matched case-insensitively against the canonical channel a send resolves to
+            queue_depth (int): how many callers per lane may wait for a slot before new ones are refused
+            queue_timeout (float): seconds a caller waits for a slot before giving up
+            retry_after (int): seconds suggested to refused callers
+            weights (dict): lane -> weight for sharing freed slots between waiting lanes, unknown lanes use "normal"
+            reserved (dict): lane -> fraction of each limit only that lane may use, e.g. {"critical": 0.25}
+        """
+        self.in_flight = in_flight or 0
+        self.channels: dict = {name.lower(): limit for name, limit in (channels or {}).items()}
+        self.queue_depth = queue_depth or 0
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.weights: dict = dict(weights or {"critical": 8, "normal": 2, "bulk": 1})
+        self.weights.setdefault("normal", 1)
+        self.reserved: dict = {lane: fraction for lane, fraction in (reserved or {}).items() if fraction}
+        self._cond = threading.Condition()
+        self._total = collections.Counter()  # lane -> in flight
+        self._per_channel: dict = {}  # channel -> lane -> in flight, channels without sends in flight are removed
+        self._queues = {lane: collections.deque() for lane in self.weights}
+        self._vtime = {lane: 0.0 for lane in self.weights}
+        self._clock = 0.0
+
+    @classmethod
+    def from_config(cls, limits: dict):
+        """
+        Args:
+            limits (dict): the config["pingme"]["options"]["limits"] section, may be None
+        """
+        limits = limits or {}
+        return cls(
+            in_flight=limits.get("in_flight", 0),
+            channels=limits.get("channels"),
+            queue_depth=limits.get("queue_depth", 0),
+            queue_timeout=limits.get("queue_timeout", 10.0),
+            retry_after=limits.get("retry_after", 1),
+            weights=limits.get("weights"),
+            reserved=limits.get("reserved"),
+        )
+
+    def lane_of(self, priority: str) -> str:
+        """
+        Returns:
+            str: the lane for a priority, unknown priorities go to the normal lane
+        """
+        return priority if priority in self.weights else "normal"
+
+    def _fits(self, counts: collections.Counter, limit: int, lane: str) -> bool:
+        # A lane may use its own reservation plus whatever is left of the shared (unreserved) part of the limit
+        if not limit:
+            return True
+        reserved = {l: min(int(-(-f * limit // 1)), limit - 1) for l, f in self.reserved.items()}  # ceil, keep 1 shared
+        if counts[lane] < reserved.get(lane, 0):
+            return True
+        shared = limit - sum(reserved.values())
+        used = sum(max(0, n - reserved.get(l, 0)) for l, n in counts.items())
+        return used < shared
+
+    def _available(self, channel: str, lane: str) -> bool:
+        return self._fits(self._total, self.in_flight, lane) and self._fits(
+            self._per_channel.get(channel, _EMPTY), self.channels.get(channel, 0), lane
+        )
+
+    def _take(self, channel: str, lane: str) -> None:
+        self._total[lane] += 1
+        self._per_channel.setdefault(channel, collections.Counter())[lane] += 1
+
+    def _release(self, channel: str, lane: str) -> None:
+        # Counters at 0 are deleted so memory and snapshots only grow with the channels that have sends in flight
+        self._total[lane] -= 1
+        if not self._total[lane]:
+            del self._total[lane]
+        counts = self._per_channel[channel]
+        counts[lane] -= 1
+        if not counts[lane]:
+            del counts[lane]
+            if not counts:
+                del self._per_channel[channel]
+
+    def _next_waiter(self, lane: str):
+        # Index of the first waiter of the lane whose channel has room, a full channel does not hold up the others
+        for i, waiter in enumerate(self._queues[lane]):
+            if self._available(waiter.channel, lane):
+                return i
+        return None
+
+    def _dispatch(self) -> None:
+        # Hand free slots to waiting lanes in weighted fair order, called with the lock held
+        while True:
+            candidates = {}
+            for lane, queue in self._queues.items():
+                if queue:
+                    i = self._next_waiter(lane)
+                    if i is not None:
+                        candidates[lane] = i
+            if not candidates:
+                return
+            # The lane whose next grant finishes first in virtual time, heavier lanes win ties
+            lane = min(candidates, key=lambda l: (self._vtime[l] + 1.0 / self.weights[l], -self.weights[l]))
+            queue = self._queues[lane]
+            waiter = queue[candidates[lane]]
+            del queue[candidates[lane]]
+            self._take(waiter.channel, lane)
+            waiter.granted = True
+            self._clock = self._vtime[lane]
+            self._vtime[lane] += 1.0 / self.weights[lane]
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, channel: str, priority: str = "normal"):
+        """
+        Hold an in-flight slot for the duration of a send
+
+        Args:
+            channel (str): the canonical channel the send goes to, see ChannelTable.resolve
+            priority (str): the priority lane, e.g. critical, normal or bulk
+
+        Raises:
+            Overloaded: if no slot is free and the lane's queue is full (429) or the wait timed out (503)
+        """
+        lane = self.lane_of(priority)
+        with self._cond:
+            queue = self._queues[lane]
+            # Waiters that could use the slot were already granted one by _dispatch, so a send with room goes ahead
+            # even while others in its lane wait for full channels
+            if self._available(channel, lane):
+                self._take(channel, lane)
+            else:
+                if len(queue) >= self.queue_depth:
+                    raise Overloaded(
+                        f"Too many in-flight sends for channel {channel}, try again later", self.retry_after, 429
+                    )
+                if not queue:
+                    # An idle lane rejoins at the current virtual time instead of cashing in its idle period
+                    self._vtime[lane] = max(self._vtime[lane], self._clock)
+                waiter = _Waiter(channel, lane)
+                queue.append(waiter)
+                if not self._cond.wait_for(lambda: waiter.granted, timeout=self.queue_timeout):
+                    queue.remove(waiter)
+                    self._dispatch()  # pass on any free slot now instead of at the next release
+                    raise Overloaded(
+                        f"Timed out waiting for a free slot for channel {channel}", self.retry_after, 503
+                    )
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release(channel, lane)
+                self._dispatch()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: current in-flight total, per channel and per lane counts and number of queued callers, the limit
+            (0 is unlimited), whether it is saturated: a normal priority send would be refused because the normal
+            lane has no room under the limit, reservations of other lanes considered, and its queue is full, and the
+            channels saturated the same way under their own limits
+        """
+        with self._cond:
+            queue_full = len(self._queues["normal"]) >= self.queue_depth
+            return {
+                "in_flight": sum(self._total.values()),
+                "limit": self.in_flight,
+                "channels": {channel: sum(lanes.values()) for channel, lanes in self._per_channel.items()},
+                "lanes": dict(self._total),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "saturated": queue_full and not self._fits(self._total, self.in_flight, "normal"),
+                "saturated_channels": sorted(
+                    channel
+                    for channel, counts in self._per_channel.items()
+                    if queue_full and not self._fits(counts, self.channels.get(channel, 0), "normal")
+                ),
+            }
+
+
+_limiters: dict = {}
+_sections: dict = {}  # config file -> (config generation checked at, limits section the limiter was built from)
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(config_file: str) -> InFlightLimiter:
+    """
+    The process-wide limiter for a config file, built from its limits section on first use and rebuilt when a
+    reload changes that section. Sends already holding a slot of the old limiter release it there.
+
+    Args:
+        config_file (str): path to the config file
+
+    Returns:
+        InFlightLimiter: the limiter
+    """
+    limiter = _limiters.get(config_file)
+    checked = _sections.get(config_file)
+    if limiter is None or checked is None or checked[0] != core.config_generation:
+        with _limiters_lock:
+            generation = core.config_generation
+            section = core.get_config(config_file)["pingme"]["options"].get("limits")
+            limiter = _limiters.get(config_file)
+            checked = _sections.get(config_file)
+            if limiter is None or checked is None or checked[1] != section:
+                limiter = InFlightLimiter.from_config(section)
+                _limiters[config_file] = limiter
+            _sections[config_file] = (generation, section)
+    return limiter
+
+
+def snapshot() -> dict:
+    """
+    Returns:
+        dict: config file -> limiter snapshot for every config sent with so far
+    """
+    return {config_file: limiter.snapshot() for config_file, limiter in list(_limiters.items())}
@@ -0,0 +1,248 @@
+import collections
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import httpx  # client for driving the API, pooled and thread-safe
+import uvicorn  # Server for hosting the API, ref: https://www.uvicorn.org/
+from fastcore.script import call_parse
+
+from .stubs import StubSMTPServer, StubWebhookServer, self_signed_context
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+
+    Args:
+        sorted_values (list): ascending values
+        q (float): percentile between 0 and 100
+
+    Returns:
+        float: the percentile value, 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def outcome_of(response: httpx.Response) -> int:
+    """
+    The delivery outcome of an API response, the API answers 200 and reports the webhook/SMTP result as status_code in the body
+
+    Args:
+        response (httpx.Response): the API response
+
+    Returns:
+        int: the status code of the delivery
+    """
+    if response.status_code != 200:
+        return response.status_code
+    try:
+        return int(response.json().get("status_code", 200))
+    except (ValueError, AttributeError):
+        return response.status_code
+
+
+class LoadReport:
+    """
+    Collects per (endpoint, channel) latencies and outcomes from a load test run, thread-safe
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.outcomes = collections.defaultdict(collections.Counter)
+        self.duration: float = 0.0
+
+    def record(self, key: tuple, latency: float, outcome) -> None:
+        with self._lock:
+            self.latencies[key].append(latency)
+            self.outcomes[key][outcome] += 1
+
+    def summary(self) -> list:
+        """
+        Returns:
+            list: one dict per (endpoint, channel) with count, throughput, p50/p95/p99 latency in ms and outcome breakdown
+        """
+        rows = []
+        for key in sorted(self.latencies):
+            latencies = sorted(self.latencies[key])
+            outcomes = self.outcomes[key]
+            errors = {str(code): n for code, n in outcomes.items() if code != 200}
+            rows.append(
+                {
+                    "endpoint": key[0],
+                    "channel": key[1],
+                    "count": len(latencies),
+                    "throughput": len(latencies) / self.duration if self.duration else 0.0,
+                    "p50_ms": percentile(latencies, 50) * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                    "p99_ms": percentile(latencies, 99) * 1000,
+                    "errors": errors,
+                }
+            )
+        return rows
+
+    def print(self, file=sys.stdout) -> None:
+        print(
+            f"{'endpoint':<20}{'channel':<12}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  errors",
+            file=file,
+        )
+        for row in self.summary():
+            errors = ", ".join(f"{code}: {n}" for code, n in sorted(row["errors"].items())) or "-"
+            print(
+                f"{row['endpoint']:<20}{row['channel']:<12}{row['count']:>8}{row['throughput']:>10.1f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}  {errors}",
+                file=file,
+            )
+
+
+def run_load(
+    base_url: str,
+    targets: list,
+    rate: float,
+    duration: float,
+    concurrency: int,
+    poisson: bool = False,
+) -> LoadReport:
+    """
+    Drive the API with an open-loop arrival rate, requests are issued on schedule regardless of how quickly earlier ones
+    complete. Latency is measured from the scheduled start so queueing behind a saturated client counts against the service.
+
+    Args:
+        base_url (str): Base URL of the API e.g. http://127.0.0.1:5000
+        targets (list): (endpoint, channel) tuples, requests are spread round-robin over them
+        rate (float): Arrivals per second across all targets
+        duration (float): Seconds to generate load for
+        concurrency (int): Maximum in-flight requests (client threads and pooled connections)
+        poisson (bool): Use exponentially distributed gaps instead of a fixed interval
+
+    Returns:
+        LoadReport: the collected results
+    """
+    report = LoadReport()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    params = {"title": "Load test", "text": "Load test notification"}
+
+    with httpx.Client(base_url=base_url, limits=limits, timeout=60.0) as client:
+
+        def fire(key: tuple, scheduled: float) -> None:
+            endpoint, channel = key
+            query = dict(params, channel=channel) if endpoint.startswith("webhook") else params
+            try:
+                outcome = outcome_of(client.post(f"/{endpoint}", params=query))
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            report.record(key, time.perf_counter() - scheduled, outcome)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            next_arrival = start
+            i = 0
+            while next_arrival - start < duration:
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(fire, targets[i % len(targets)], next_arrival)
+                i += 1
+                next_arrival += random.expovariate(rate) if poisson else 1.0 / rate
+        report.duration = time.perf_counter() - start
+    return report
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _InProcessService:
+    """
+    Runs the PingMe API with uvicorn in a background thread, configured through env vars to deliver to the stubs
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = None):
+        self.host = host
+        self.port = port or _free_port()
+        self._server = uvicorn.Server(
+            uvicorn.Config("pingme.api:app", host=self.host, port=self.port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+@call_parse
+def cli(
+    rate: float = 50.0,  # Arrivals per second (open loop)
+    duration: float = 10.0,  # Seconds to generate load for
+    concurrency: int = 32,  # Maximum in-flight requests from the load generator
+    endpoints: str = "webhook/simple",  # Comma separated API endpoints, e.g. webhook/simple,email/simple
+    channels: str = "default",  # Comma separated webhook channels to spread webhook requests over
+    poisson: bool = False,  # Poisson arrivals instead of a fixed interval
+    latency: float = 0.0,  # Stub webhook/SMTP latency in seconds
+    error_rate: float = 0.0,  # Fraction of stub webhook requests answered with 500
+    throttle_rate: float = 0.0,  # Fraction of stub webhook requests answered with 429
+    retry_after: int = 1,  # Retry-After seconds on stub 429 responses
+    url: str = None,  # Drive an already running service instead of starting one in-process with stubs
+    json_out: str = None,  # Write the summary as JSON to this path
+):
+    """
+    Load test the PingMe API. By default starts a stub webhook server, a stub SMTP server and the API in-process with every
+    webhook channel and the SMTP relay pointed at the stubs, then reports throughput, p50/p95/p99 latency and error
+    breakdowns per endpoint and channel.
+
+    Usage examples:
+    - pingme_loadtest --rate 200 --duration 30 --concurrency 64
+    - pingme_loadtest --endpoints webhook/simple,email/simple --channels default,ops --latency 0.2 --throttle_rate 0.05
+    """
+    channel_list = [c.strip() for c in channels.split(",") if c.strip()]
+    targets = []
+    for endpoint in (e.strip().strip("/") for e in endpoints.split(",") if e.strip()):
+        if endpoint.startswith("webhook"):
+            targets += [(endpoint, channel) for channel in channel_list]
+        else:
+            targets.append((endpoint, "-"))
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per request otherwise
+    if url is not None:
+        report = run_load(url, targets, rate, duration, concurrency, poisson)
+    else:
+        logging.getLogger("pingme").setLevel(logging.WARNING)  # per-send INFO logs would dominate the measurement
+        with tempfile.TemporaryDirectory() as cert_dir, StubWebhookServer(
+            latency=latency, error_rate=error_rate, throttle_rate=throttle_rate, retry_after=retry_after
+        ) as webhook_stub, StubSMTPServer(ssl_context=self_signed_context(cert_dir), latency=latency) as smtp_stub:
+            for channel in channel_list:
+                os.environ[f"PINGME_WEBHOOK_URL_{channel.upper()}"] = webhook_stub.url
+            os.environ["PINGME_EMAIL_FROM"] = os.environ["PINGME_EMAIL_TO"] = "loadtest@example.com"
+            os.environ["PINGME_EMAIL_SMTP_HOST"] = smtp_stub.host
+            os.environ["PINGME_EMAIL_SMTP_PORT"] = str(smtp_stub.port)
+            with _InProcessService() as service:
+                report = run_load(service.url, targets, rate, duration, concurrency, poisson)
+
+    report.print()
+    if json_out is not None:
+        with open(json_out, "w") as f:
+            json.dump(report.summary(), f, indent=2)
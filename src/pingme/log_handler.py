@@ -0,0 +1,173 @@
+import collections
+import logging
+import sys
+import threading
+import time
+
+from .pingme_class import Card
+from .services import NotificationService
+
+
+class PingMeHandler(logging.Handler):
+    """
+    Logging handler that turns log records into notifications, e.g. `logging.getLogger().addHandler(PingMeHandler())`
+    to get a webhook card for every ERROR. `emit` only appends to an in-memory buffer; a background thread groups the
+    records by logger, level and message template and sends one card per flush listing each group with its count.
+    A group that was notified less than `repeat_interval` seconds ago keeps counting and is reported once the interval
+    has passed, so an error logged in a hot loop becomes one card with a count instead of one HTTP call per record.
+    """
+
+    def __init__(
+        self,
+        level: int = logging.ERROR,
+        card: str = "default",
+        channel: str = None,
+        config_file: str = None,
+        transport: str = "webhook",
+        flush_interval: float = 5.0,
+        repeat_interval: float = 300.0,
+        capacity: int = 10000,
+        max_lines: int = 20,
+        send=None,
+    ):
+        """
+        Args:
+            level (int): minimum level of records to notify about
+            card (str): the card to send, its context gets title, text, severity and logger
+            channel (str): webhook channel, None for the default channel
+            config_file (str): config file to send with, None uses the active (tenant) config
+            transport (str): webhook, email or route
+            flush_interval (float): seconds between flushes
+            repeat_interval (float): minimum seconds between two notifications for the same group
+            capacity (int): records buffered between flushes, further records are counted as dropped
+            max_lines (int): groups listed per card, the rest are summarised in one line
+            send (callable): send(card) for the built card, defaults to NotificationService for the transport
+        """
+        super().__init__(level)
+        self.card = card
+        self.channel = channel
+        self.config_file = config_file
+        self.transport = transport
+        self.flush_interval = flush_interval
+        self.repeat_interval = repeat_interval
+        self.capacity = capacity
+        self.max_lines = max_lines
+        self.send = send or self._send
+        self._buffer = collections.deque()
+        self._dropped = 0
+        self._groups: dict = {}  # key -> group, records waiting to be reported
+        self._last_sent: dict = {}  # key -> time the group was last reported
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="pingme-log-handler", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Records from pingme itself or from the flush thread would feed back into the handler
+        if record.name.startswith("pingme") or threading.current_thread() is self._thread:
+            return
+        try:
+            if len(self._buffer) >= self.capacity:
+                self._dropped += 1
+                return
+            message = record.getMessage()
+            if record.exc_info and record.exc_info[1] is not None:
+                message = f"{message} ({type(record.exc_info[1]).__name__}: {record.exc_info[1]})"
+            # deque.append is atomic, no lock on the caller's path
+            self._buffer.append((record.name, record.levelno, str(record.msg), message, record.created))
+        except Exception:
+            self.handleError(record)
+
+    def _collect(self) -> None:
+        # Move buffered records into their groups, keyed by logger, level and unformatted message
+        while self._buffer:
+            name, levelno, template, message, created = self._buffer.popleft()
+            key = (name, levelno, template)
+            group = self._groups.get(key)
+            if group is None:
+                self._groups[key] = {"logger": name, "levelno": levelno, "count": 1, "message": message, "first": created}
+            else:
+                group["count"] += 1
+                group["message"] = message
+
+    def build_card(self, groups: list, dropped: int = 0) -> Card:
+        """
+        Args:
+            groups (list): groups to report, dicts with logger, levelno, count and the latest message
+            dropped (int): records dropped because the buffer was full
+
+        Returns:
+            Card: one card summarising the groups
+        """
+        total = sum(g["count"] for g in groups) + dropped
+        levelno = max(g["levelno"] for g in groups) if groups else logging.WARNING
+        loggers = sorted({g["logger"] for g in groups})
+        lines = [
+            f"{g['count']}x {logging.getLevelName(g['levelno'])} {g['logger']}: {g['message']}"
+            for g in sorted(groups, key=lambda g: (-g["levelno"], -g["count"]))[: self.max_lines]
+        ]
+        if len(groups) > self.max_lines:
+            lines.append(f"... and {len(groups) - self.max_lines} more")
+        if dropped:
+            lines.append(f"{dropped} records dropped, the handler buffer was full")
+        level = logging.getLevelName(levelno)
+        return Card(
+            name=self.card,
+            context={
+                "title": f"{total} {level} log record{'s' if total != 1 else ''} from {', '.join(loggers[:3]) or 'logging'}",
+                "text": "\n".join(lines),
+                "severity": level.lower(),
+                "logger": ", ".join(loggers),
+            },
+            priority="critical" if levelno >= logging.CRITICAL else "normal",
+        )
+
+    def _send(self, card: Card):
+        if self.transport == "email":
+            return NotificationService._deliver_email(card, config_file=self.config_file)
+        if self.transport == "route":
+            return NotificationService.send_routed_card(card, config_file=self.config_file)
+        return NotificationService._deliver_webhook(card, channel=self.channel, config_file=self.config_file)
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Send a card for the groups that are due
+
+        Args:
+            force (bool): also report groups still inside their repeat interval, e.g. on close
+        """
+        with self._flush_lock:
+            self._collect()
+            now = time.time()
+            due = [
+                key for key in self._groups if force or now - self._last_sent.get(key, 0.0) >= self.repeat_interval
+            ]
+            dropped, self._dropped = self._dropped, 0
+            if not due and not dropped:
+                return
+            groups = [self._groups.pop(key) for key in due]
+            for key in due:
+                self._last_sent[key] = now
+            for key in [k for k, sent in self._last_sent.items() if now - sent >= self.repeat_interval]:
+                del self._last_sent[key]
+            try:
+                self.send(self.build_card(groups, dropped))
+            except Exception as e:
+                # Logging the failure would come back to this handler, report it the way logging does
+                print(f"PingMeHandler could not send {len(groups)} log groups: {e!r}", file=sys.stderr)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Send what is buffered, including groups inside their repeat interval, and stop the flush thread"""
+        if not self._closed:
+            self._closed = True
+            self._wake.set()
+            self._thread.join()
+            self.flush(force=True)
+        super().close()
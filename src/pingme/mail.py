@@ -0,0 +1,305 @@
+import base64
+import email.message
+import email.policy
+import email.utils
+import functools
+import html
+import json
+import mimetypes
+import os
+import re
+import smtplib
+import uuid
+import zlib
+
+# Used for cards without an email_template
+DEFAULT_TEMPLATE = {
+    "subject": "${title}",
+    "text": "${title}\n\n${text}\n",
+    "html": '<html><body><h2>${title}</h2><div style="white-space: pre-wrap">${text}</div></body></html>\n',
+}
+
+_VARIABLE = re.compile(r"\$\{([^}]+)\}")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(source: str) -> tuple:
+    """
+    Split a template into its literal text and variable names once, rendering is then a single join
+
+    Args:
+        source (str): template text with ${name} variables
+
+    Returns:
+        tuple: alternating literals and variable names, starting and ending with a literal
+    """
+    return tuple(_VARIABLE.split(source))
+
+
+def render(source: str, context: dict, escape=None) -> str:
+    """
+    Args:
+        source (str): template text with ${name} variables
+        context (dict): the values to substitute
+        escape (callable): applied to every value, e.g. html.escape
+
+    Returns:
+        str: the rendered text
+
+    Raises:
+        ValueError: if a variable is not in the context
+    """
+    parts = compile_template(source)
+    out = list(parts)
+    for i in range(1, len(parts), 2):
+        if parts[i] not in context:
+            raise ValueError(f"Unresolved variable {parts[i]} in email template")
+        value = context[parts[i]]
+        value = value if isinstance(value, str) else str(value)
+        out[i] = escape(value) if escape is not None else value
+    return "".join(out)
+
+
+def render_parts(template: dict, context: dict) -> dict:
+    """
+    Render the subject, plain text and HTML parts of an email template, values are HTML escaped in the HTML part
+
+    Args:
+        template (dict): a card's email_template with subject, text and/or html, None uses DEFAULT_TEMPLATE
+        context (dict): the card context
+
+    Returns:
+        dict: the rendered subject, text and html, a part missing from the template is None
+    """
+    template = template or DEFAULT_TEMPLATE
+    return {
+        "subject": render(template["subject"], context) if template.get("subject") else None,
+        "text": render(template["text"], context) if template.get("text") else None,
+        "html": render(template["html"], context, escape=html.escape) if template.get("html") else None,
+    }
+
+
+def build_message(subject: str, from_: str, to: str, text: str = None, html_: str = None) -> email.message.EmailMessage:
+    """
+    Build the MIME message, multipart/alternative when there is both a plain text and an HTML part
+
+    Args:
+        subject (str): the subject
+        from_ (str): the sender
+        to (str): the recipients, comma separated
+        text (str): the plain text part
+        html_ (str): the HTML part
+
+    Returns:
+        EmailMessage: the message, serialize it with as_bytes()
+    """
+    msg = email.message.EmailMessage(policy=email.policy.SMTP)
+    msg["Subject"] = subject
+    msg["From"] = from_
+    msg["To"] = to
+    if text is not None:
+        msg.set_content(text)
+        if html_ is not None:
+            msg.add_alternative(html_, subtype="html")
+    elif html_ is not None:
+        msg.set_content(html_, subtype="html")
+    else:
+        msg.set_content("")
+    return msg
+
+
+def message_from_payload(payload, subject: str, from_: str, to: str) -> email.message.EmailMessage:
+    """
+    Args:
+        payload: an EmailMessage sent as is, a dict with rendered text and/or html parts, or any other JSON payload
+            which is sent as indented plain text
+        subject (str): the subject, used when the payload is not a message
+        from_ (str): the sender, used when the payload is not a message
+        to (str): the recipients, used when the payload is not a message
+
+    Returns:
+        EmailMessage: the message to send
+    """
+    if isinstance(payload, email.message.EmailMessage):
+        return payload
+    if isinstance(payload, dict) and (payload.get("text") is not None or payload.get("html") is not None):
+        return build_message(payload.get("subject") or subject, from_, to, payload.get("text"), payload.get("html"))
+    return build_message(subject, from_, to, text=json.dumps(payload, indent=2))
+
+
+# Attachments are read and base64 encoded this many bytes at a time, a multiple of 57 so every chunk encodes to
+# whole 76 character lines
+CHUNK_SIZE = 57 * 1024
+CRLF = b"\r\n"
+
+
+class AttachmentError(ValueError):
+    """An attachment is missing, outside the allowed directories or over a size limit"""
+
+
+class Attachment:
+    """A file attached to an email, streamed from disk when the email is sent"""
+
+    def __init__(self, path: str, name: str = None, gzip: bool = False):
+        """
+        Args:
+            path (str): the file to attach
+            name (str): file name shown in the email, defaults to the file's name
+            gzip (bool): compress the file while sending, ".gz" is added to the name
+        """
+        self.path = os.path.realpath(path)
+        self.name = name or os.path.basename(path)
+        self.gzip = gzip
+        if gzip:
+            self.name += ".gz"
+
+    def __repr__(self) -> str:
+        return f"Attachment({self.path!r}, name={self.name!r}, gzip={self.gzip})"
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def headers(self) -> bytes:
+        """
+        Returns:
+            bytes: the MIME headers of the attachment part, ending with the blank line
+        """
+        part = email.message.EmailMessage(policy=email.policy.SMTP)
+        part["Content-Type"] = "application/gzip" if self.gzip else mimetypes.guess_type(self.name)[0] or "application/octet-stream"
+        part["Content-Transfer-Encoding"] = "base64"
+        part.add_header("Content-Disposition", "attachment", filename=self.name)
+        return _header_bytes(part.items())
+
+    def _read(self):
+        with open(self.path, "rb") as file:
+            compressor = zlib.compressobj(wbits=31) if self.gzip else None  # wbits=31 writes a gzip container
+            while data := file.read(CHUNK_SIZE):
+                yield compressor.compress(data) if compressor is not None else data
+            if compressor is not None:
+                yield compressor.flush()
+
+    def chunks(self):
+        """
+        Yield the file's content base64 encoded in 76 character CRLF terminated lines, reading CHUNK_SIZE bytes at a
+        time and compressing on the fly if gzip is set, so memory use does not depend on the file size
+        """
+        pending = b""
+        for data in self._read():
+            pending = pending + data if pending else data
+            if len(pending) >= 57:
+                cut = len(pending) - len(pending) % 57
+                yield base64.encodebytes(pending[:cut]).replace(b"\n", CRLF)
+                pending = pending[cut:]
+        if pending:
+            yield base64.encodebytes(pending).replace(b"\n", CRLF)
+
+
+def _header_bytes(headers) -> bytes:
+    # Folded header lines and the blank line ending them
+    return b"".join(email.policy.SMTP.fold_binary(name, value) for name, value in headers) + CRLF
+
+
+def attachments_from(items: list, policy: dict = None) -> list:
+    """
+    Check the attachments of a card against the email attachments config before anything is sent
+
+    Args:
+        items (list): file paths, {"path", "name", "gzip"} dicts or Attachment objects
+        policy (dict): the email attachments section with allowed_dirs, max_bytes, max_total_bytes and gzip
+
+    Returns:
+        list: the Attachment objects
+
+    Raises:
+        AttachmentError: if a file is missing, outside allowed_dirs or over max_bytes/max_total_bytes
+    """
+    policy = policy or {}
+    allowed = [os.path.realpath(directory) for directory in policy.get("allowed_dirs") or []]
+    attachments = []
+    for item in items or []:
+        if isinstance(item, str):
+            item = Attachment(item, gzip=bool(policy.get("gzip")))
+        elif isinstance(item, dict):
+            item = Attachment(item["path"], item.get("name"), item.get("gzip", bool(policy.get("gzip"))))
+        if not any(os.path.commonpath([item.path, directory]) == directory for directory in allowed):
+            raise AttachmentError(f"Attachment {item.path} is not in an allowed directory")
+        if not os.path.isfile(item.path):
+            raise AttachmentError(f"Attachment {item.path} is not a file")
+        if policy.get("max_bytes") and item.size > policy["max_bytes"]:
+            raise AttachmentError(f"Attachment {item.path} is {item.size} bytes, over the {policy['max_bytes']} byte limit")
+        attachments.append(item)
+    total = sum(item.size for item in attachments)
+    if policy.get("max_total_bytes") and total > policy["max_total_bytes"]:
+        raise AttachmentError(f"Attachments are {total} bytes, over the {policy['max_total_bytes']} byte limit")
+    return attachments
+
+
+def stream_message(msg: email.message.EmailMessage, attachments: list):
+    """
+    Yield the message with its attachments as multipart/mixed, ready for the SMTP DATA command: CRLF line endings
+    and dot-stuffed. Only the body is serialized in memory, the attachments are streamed from disk.
+
+    Args:
+        msg (EmailMessage): the message with Subject, From and To headers and the body
+        attachments (list): Attachment objects
+    """
+    boundary = f"=====pingme-{uuid.uuid4().hex}====="
+    headers = [(name, msg[name]) for name in ("Subject", "From", "To") if msg[name] is not None]
+    headers += [
+        ("Date", email.utils.formatdate(localtime=True)),
+        ("MIME-Version", "1.0"),
+        ("Content-Type", f'multipart/mixed; boundary="{boundary}"'),
+    ]
+    yield _header_bytes(headers)
+
+    body = email.message.EmailMessage(policy=email.policy.SMTP)
+    for name, value in msg.items():
+        if name not in ("Subject", "From", "To", "MIME-Version"):
+            body[name] = value
+    body.set_payload(msg.get_payload())
+    yield b"--" + boundary.encode() + CRLF
+    # Base64 lines never start with a dot, only the body needs dot-stuffing
+    yield re.sub(rb"(?m)^\.", b"..", body.as_bytes()).rstrip(CRLF) + CRLF
+    for attachment in attachments:
+        yield b"--" + boundary.encode() + CRLF
+        yield attachment.headers()
+        yield from attachment.chunks()
+    yield b"--" + boundary.encode() + b"--" + CRLF
+
+
+def send_streaming(connection: smtplib.SMTP, from_: str, to, chunks) -> None:
+    """
+    Send a message to an open SMTP connection chunk by chunk instead of as one string like SMTP.sendmail does
+
+    Args:
+        connection (smtplib.SMTP): the connection, after EHLO/STARTTLS/login
+        from_ (str): the envelope sender
+        to (str | list): the envelope recipients
+        chunks (iterable): the message bytes, CRLF terminated and dot-stuffed, e.g. from stream_message
+
+    Raises:
+        smtplib.SMTPException: if the server refuses the sender, every recipient or the message
+    """
+    code, reply = connection.mail(from_)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, reply, from_)
+    recipients = [to] if isinstance(to, str) else list(to)
+    refused = {}
+    for recipient in recipients:
+        code, reply = connection.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, reply)
+    if len(refused) == len(recipients):
+        connection.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    connection.putcmd("data")
+    code, reply = connection.getreply()
+    if code != 354:
+        raise smtplib.SMTPDataError(code, reply)
+    for chunk in chunks:
+        connection.send(chunk)
+    connection.send(b"." + CRLF)
+    code, reply = connection.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, reply)
@@ -0,0 +1,134 @@
+import os
+
+# Prometheus instrumentation, ref: https://github.com/prometheus/client_python
+# When PROMETHEUS_MULTIPROC_DIR is set before import the client stores values in mmapped files so /metrics aggregates
+# across uvicorn workers, see https://prometheus.github.io/client_python/multiprocess/
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from . import hooks
+
+SENDS = Counter(
+    "pingme_sends_total", "Notifications handed to a transport", ["card", "channel", "transport"]
+)
+FAILURES = Counter(
+    "pingme_send_failures_total", "Notifications that raised or got an error response", ["card", "channel", "transport"]
+)
+RETRIES = Counter(
+    "pingme_send_retries_total", "Repeated delivery attempts of a notification", ["card", "channel", "transport"]
+)
+SUPPRESSIONS = Counter(
+    "pingme_send_suppressions_total", "Notifications deliberately not sent", ["card", "channel", "transport", "reason"]
+)
+# Adaptive per-host webhook concurrency, summed / maxed over worker processes in multiprocess mode
+WEBHOOK_CONCURRENCY_LIMIT = Gauge(
+    "pingme_webhook_concurrency_limit", "Adaptive in-flight limit per webhook host", ["host"], multiprocess_mode="livesum"
+)
+WEBHOOK_RTT_SECONDS = Gauge(
+    "pingme_webhook_rtt_seconds", "Smoothed round trip time per webhook host", ["host"], multiprocess_mode="livemax"
+)
+STAGE_SECONDS = Histogram(
+    "pingme_stage_duration_seconds",
+    "Time spent per stage of a send: config_load, template_render, transport, response_parse",
+    ["stage", "channel", "transport"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+# Hook stages that feed the latency histogram and the histogram stage they are reported as
+_HISTOGRAM_STAGES = {
+    "get_config": "config_load",
+    "resolved_payload": "template_render",
+    "render_email": "template_render",
+    "send_to_webhook": "transport",
+    "send_to_email": "transport",
+    "send_to_logfile": "transport",
+    "parse_webhook_response": "response_parse",
+    "parse_smtp_response": "response_parse",
+}
+
+
+def observe_stage(name: str, duration: float, attrs: dict) -> None:
+    """
+    Stage hook recording stage timings into the latency histogram, registered by enable()
+
+    Args:
+        name (str): hook stage name, see pingme.hooks.on_stage
+        duration (float): seconds spent in the stage
+        attrs (dict): stage attributes, channel and transport are used as labels
+    """
+    histogram_stage = _HISTOGRAM_STAGES.get(name)
+    if histogram_stage is not None:
+        STAGE_SECONDS.labels(histogram_stage, attrs.get("channel", ""), attrs.get("transport", "")).observe(duration)
+
+
+_enabled = False
+
+
+def enable() -> None:
+    """
+    Register observe_stage so stages feed the latency histogram. Called by the API, which serves /metrics; other
+    processes keep the no-op stage fast path unless they call it too. Calling it again does nothing.
+    """
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        hooks.on_stage(observe_stage)
+
+
+def record_send(card: str, channel: str, transport: str, success: bool = True) -> None:
+    """
+    Count a send and, if it was not successful, a failure
+
+    Args:
+        card (str): card name
+        channel (str): webhook channel, empty for email and logfile
+        transport (str): webhook, email or logfile
+        success (bool): if the transport reported success
+    """
+    SENDS.labels(card, channel, transport).inc()
+    if not success:
+        FAILURES.labels(card, channel, transport).inc()
+
+
+def record_retry(card: str, channel: str, transport: str) -> None:
+    RETRIES.labels(card, channel, transport).inc()
+
+
+def record_suppression(card: str, channel: str, transport: str, reason: str) -> None:
+    SUPPRESSIONS.labels(card, channel, transport, reason).inc()
+
+
+def mark_process_dead(pid: int = None) -> None:
+    """
+    Remove the live gauge files of an exited worker process so /metrics stops summing its values, a no-op outside
+    multiprocess mode
+
+    Args:
+        pid (int): the worker's process id, defaults to the current process
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def render() -> tuple:
+    """
+    Render all metrics in the Prometheus text format, aggregated over all worker processes in multiprocess mode
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
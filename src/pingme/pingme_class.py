@@ -1,6 +1,8 @@
 import os
 import json  # to manage json payloads
+import random  # response body sampling
 import re  # regular expression for parsing
+from typing import Mapping
 
 from fastcore.script import call_parse
 from fastcore.utils import patch
@@ -8,10 +10,10 @@ from fastcore.utils import patch
 # Project specific libraries
 from pydantic import BaseModel
 
-from pingme import core
+from pingme import adaptive, channels, config_model, core, hedging, hooks, mail, metrics, sizeguard, spool
+from pingme.limits import Overloaded
 import sys
 
-import email.mime.text  # to format emails
 import smtplib
 import datetime
 
@@ -21,6 +23,8 @@ from pydantic import BaseModel
 class Card(BaseModel):
     name: str
     context: dict
+    priority: str = "normal"  # limiter lane: critical, normal or bulk
+    attachments: list = []  # email attachments: file paths or {"path", "name", "gzip"} dicts
 
 
 @staticmethod
@@ -41,12 +45,63 @@ def resolved_payload(template: json, context: dict) -> dict:
     str_temp = json.dumps(template)  # convert payload to string
     for key in context.keys():
         # Substitute all variables in payload with values from payload_context, it can also be set up that their are no variables in the payload
-        str_temp = str_temp.replace("${" + key + "}", context[key])
+        value = context[key]
+        value = value if isinstance(value, str) else str(value)
+        # Escaped as a JSON string so quotes and line breaks in the value keep the payload valid
+        str_temp = str_temp.replace("${" + key + "}", json.dumps(value)[1:-1])
     if re.search(r"\$\{[^}]+\}", str_temp):
         # Check if there are any variables left, this is not allowed
         raise ValueError("Unresolved variables in payload")
     return json.loads(str_temp)
 
+class WebhookSendError(Exception):
+    """
+    Sends to some URLs of a channel group or some parts of a split card raised. The other sends were still made.
+    """
+
+    def __init__(self, errors: list, responses: list):
+        """
+        Args:
+            errors (list): (url, part, exception) of every send that raised, part is the index of the payload
+            responses (list): the responses of the sends that did not raise
+        """
+        super().__init__(
+            f"{len(errors)} of {len(errors) + len(responses)} webhook sends failed: "
+            + "; ".join(f"{url} part {part}: {e}" for url, part, e in errors)
+        )
+        self.errors = errors
+        self.responses = responses
+
+    @property
+    def failed(self) -> list:
+        """
+        Returns:
+            list: {"url", "part"} of the sends that raised or got an error response
+        """
+        return [{"url": url, "part": part} for url, part, _ in self.errors] + [
+            response.target for response in self.responses if not 200 <= response.status_code < 300
+        ]
+
+
+def failed_targets(result):
+    """
+    The targets to retry after a send to several URLs or of several parts, so a retry skips the ones that succeeded
+
+    Args:
+        result: what send_webhook returned or the WebhookSendError it raised
+
+    Returns:
+        list: {"url", "part"} of the failed sends, None if there was a single send or all of them failed
+    """
+    if isinstance(result, WebhookSendError):
+        failed, total = result.failed, len(result.errors) + len(result.responses)
+    elif isinstance(result, list):
+        failed, total = [r.target for r in result if not 200 <= r.status_code < 300], len(result)
+    else:
+        return None
+    return failed if 0 < len(failed) < total else None
+
+
 class PingMe:
     """
     PingMe class which notifies via either a webhook or email
@@ -60,37 +115,60 @@ class PingMe:
             config_file (str): str, the path to the config file
         """
 
-        # Resolve config variables from ENV vars
+        # A config file passed in wins, e.g. a tenant's, CORE_CONFIG_FILE is only the process default
         if config_file is None:
-            config_file = "./config/example.env"
-        config = core.get_config(os.environ.get("CORE_CONFIG_FILE", config_file))
-
-        if card.name not in config["pingme"]["cards"]:
-            raise ValueError(
-                f"Card name {card.name} not found in config file, check spelling"
-            )
-        self.card: dict = {}
-        self.card = config["pingme"]["cards"][card.name]
-        self.card["context"] = card.context
-
-        # Set default values for card variables if not provided in context
-        for item in self.card["variables"]:
-            if item not in self.card["context"]:
-                self.card["context"][item] = self.card["variables"][item]
+            config_file = os.environ.get("CORE_CONFIG_FILE", "./config/example.env")
+        # The config file sends are made with, kept so spooled sends and their dead letters use the same one
+        self.config_file: str = config_file
+        with hooks.stage("get_config", card=card.name):
+            config = core.get_config(self.config_file)
+
+        with hooks.stage("card_lookup", card=card.name):
+            model = config_model.model_of(config)
+            card_config = model.cards.get(card.name)
+            if card_config is None:
+                raise ValueError(
+                    f"Card name {card.name} not found in config file, check spelling"
+                )
+            self.name: str = card.name
+            self.priority: str = card.priority
+            # Fresh dict per send around the shared, validated card; variables fill in missing context values
+            self.card: dict = card_config.for_context(card.context)
 
         # Get title and text which are special variables
         self.title: str = self.card["context"].get("title", "")
         self.text: str = self.card["context"].get("text", "")
 
         # Set options
-        self.email: dict = config["pingme"]["options"]["email"]
-        self.webhook: dict = config["pingme"]["options"]["webhook"]
-        self.logfile: dict = config["pingme"]["options"]["logfile"]
+        options = model.options
+        self.email: config_model.EmailOptions = model.email
+        self.webhook: Mapping = options["webhook"]
+        self.logfile: config_model.LogfileOptions = model.logfile
+        self.spool: Mapping = options.get("spool") or {}
+        self.attachments: list = list(card.attachments)
 
         # Resolve payload variables from card.context, defined below
-        self.payload: json = resolved_payload(
-            self.card["template"], self.card["context"]
-        )
+        with hooks.stage("resolved_payload", card=self.name):
+            self.payload: json = resolved_payload(
+                self.card["template"], self.card["context"]
+            )
+
+    def fitted_payloads(self, channel: str) -> list:
+        """
+        Args:
+            channel (str): the resolved channel name, for its payload size limit
+
+        Returns:
+            list: the JSON payloads to send to the channel, one unless an oversized card was split
+        """
+        with hooks.stage("size_guard", card=self.name, channel=channel):
+            return sizeguard.fit(
+                lambda context: resolved_payload(self.card["template"], context),
+                self.card["context"],
+                json.dumps(self.payload),
+                channel,
+                self.webhook.get("payload_limit"),
+            )
 
     def __str__(self) -> str:
         return f"""PingMe object with:
@@ -103,11 +181,38 @@ class PingMe:
 
 
 import requests  # to send requests to webhooks
+import requests.adapters
+
+# One session for the whole process so keep-alive connections are pooled per host and shared by every config/tenant
+# posting to the same webhook host
+http_session = requests.Session()
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32))
+http_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32))
+
+# (connect, read) seconds, a hung receiver times out, which releases its slots and cuts its host's adaptive limit
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+
+def webhook_timeout(policy: dict) -> tuple:
+    """
+    Args:
+        policy (dict): the webhook timeout section, {"connect": 5, "read": 30}, may be None
+
+    Returns:
+        tuple: (connect, read) timeouts in seconds for requests
+    """
+    policy = policy or {}
+    connect, read = DEFAULT_TIMEOUT
+    return float(policy.get("connect") or connect), float(policy.get("read") or read)
 
 
 @staticmethod
 def send_to_webhook(
-    url: str, payload: json, header: json = {"Content-Type": "application/json"}
+    url: str,
+    payload: json,
+    header: json = {"Content-Type": "application/json"},
+    read_body: bool = True,
+    timeout: tuple = DEFAULT_TIMEOUT,
 ) -> json:
     """
     Sends a message to a webhook
@@ -116,6 +221,9 @@ def send_to_webhook(
         url (str): the webhook URL
         payload (json): the payload to be sent
         header (json): the header to be sent
+        read_body (bool): False only checks the status line of a 2xx response and discards the body undecoded,
+            the response then has `body_discarded = True`; error bodies are always read
+        timeout (tuple): (connect, read) timeouts in seconds
 
     Returns:
     json, the response from the webhook
@@ -123,20 +231,122 @@ def send_to_webhook(
     if url is None:
         raise Exception("Webhook URL not set")
     # Send message to webhook
+    # Concurrency per host adapts to how the receiver copes (AIMD), waiting here instead of piling onto a slow host
+    limiter = adaptive.limiter_for(url)
     try:
-        response = requests.post(url, data=payload, headers=header)
+        with limiter.slot() as slot:
+            if read_body:
+                response = http_session.post(url, data=payload, headers=header, timeout=timeout)
+            else:
+                response = http_session.post(url, data=payload, headers=header, stream=True, timeout=timeout)
+                if response.status_code < 300:
+                    discard_body(response)
+                else:
+                    response.content  # read now, the connection goes back to the pool
+            slot.status_code = response.status_code
+    except Overloaded:
+        raise
     except Exception as e:
         raise Exception(f"Error sending message to webhook: {e}")
     
     return response
 
 
+def discard_body(response) -> None:
+    """
+    Read and drop a streamed response body without decoding it, so the keep-alive connection returns to the pool.
+    Never raises: the status line already told the send succeeded, so a connection that breaks while draining is
+    closed instead of reused and the response is still returned.
+
+    Args:
+        response (requests.Response): a response requested with stream=True
+    """
+    try:
+        response.raw.drain_conn()
+    except Exception as e:
+        core.logger.debug(f"Closing webhook connection that failed while draining a {response.status_code} response: {e!r}")
+        response.close()
+    response._content = b""
+    response._content_consumed = True
+    response.body_discarded = True
+
+
+def read_response_body(policy: dict) -> bool:
+    """
+    Decide if a webhook response body is read and parsed
+
+    Args:
+        policy (dict): the webhook response section, {"body": "always" | "errors" | "sampled", "sample_rate": 0.01}
+
+    Returns:
+        bool: True to read the body, error bodies are read regardless
+    """
+    mode = (policy or {}).get("body") or "always"
+    if mode == "always":
+        return True
+    if mode == "sampled":
+        return random.random() < float(policy.get("sample_rate", 0.01))
+    return False
+
+
 @patch
-def send_webhook(self: PingMe, channel: str = None) -> dict:
-    
-    webhook_url = self.webhook["channels"].get(channel, self.webhook["channels"]["default"])
-    
-    return send_to_webhook(webhook_url, json.dumps(self.payload))
+def send_webhook(self: PingMe, channel: str = None, targets: list = None):
+    """
+    Send the payload to a webhook channel, alias or group
+
+    Args:
+        channel (str): channel, alias or group name, None sends to the default channel
+        targets (list): only send to these {"url", "part"} of the channel's URLs and the payload's parts, e.g. the
+            failed_targets of an earlier send. None sends to all.
+
+    Returns:
+        the webhook response, or a list of responses when the channel is a group of several URLs or an oversized
+        card was split into several
+
+    Raises:
+        UnknownChannel: if the channel is not configured and no fallback is set
+        PayloadTooLarge: if the payload is over the channel's size limit and cannot be shortened
+        WebhookSendError: if sends to some URLs or of some parts raised, after all the others were made. A single
+            send raises its own exception.
+    """
+    table = channels.table_for(self.webhook)
+    channel, urls = table.resolve(channel)
+    payloads = self.fitted_payloads(channel)
+    read_body = read_response_body(self.webhook.get("response"))
+    timeout = webhook_timeout(self.webhook.get("timeout"))
+    hedge = table.hedge_for(channel) if len(urls) == 1 else None
+
+    sends = [(url, i, payload) for url in urls for i, payload in enumerate(payloads)]
+    if targets is not None:
+        wanted = {(target["url"], target["part"]) for target in targets}
+        sends = [send for send in sends if send[:2] in wanted]
+        if not sends:
+            raise ValueError(f"None of the targets {targets} are URLs of webhook channel {channel}")
+    responses = []
+    errors = []
+    for webhook_url, part, payload in sends:
+        send = lambda url, payload=payload: send_to_webhook(url, payload, read_body=read_body, timeout=timeout)
+        with hooks.stage("send_to_webhook", card=self.name, channel=channel, transport="webhook"):
+            try:
+                if hedge is not None:
+                    response = hedging.hedged_send(
+                        send, webhook_url, hedge, channel, on_hedge=lambda: metrics.record_retry(self.name, channel, "webhook")
+                    )
+                else:
+                    response = hedging.timed(send, channel)(webhook_url)
+            except Exception as e:
+                # One failing group member or part must not keep the card from the others
+                metrics.record_send(self.name, channel, "webhook", success=False)
+                errors.append((webhook_url, part, e))
+                continue
+        metrics.record_send(self.name, channel, "webhook", success=response.status_code < 400)
+        response.target = {"url": webhook_url, "part": part}
+        responses.append(response)
+    if errors:
+        if len(sends) == 1:
+            raise errors[0][2]
+        raise WebhookSendError(errors, responses)
+    return responses[0] if len(responses) == 1 else responses
 
 
 @staticmethod
@@ -149,12 +359,14 @@ def send_to_email(
     port: int = 25,
     user=None,
     password=None,
+    attachments: list = None,
 ) -> dict:
     """
     Sends a message to an email address
 
     Args:
-        payload (json): the payload to be sent
+        payload: the rendered email parts from PingMe.email_parts, a prebuilt EmailMessage, or any JSON payload
+            which is sent as plain text
         subject (str): the subject of the email
         from_ (str): the sender of the email
         to (str): the recipient of the email
@@ -162,6 +374,7 @@ def send_to_email(
         port (int): the port of the email server
         user (str): the username of the email server
         password (str): the password of the email server
+        attachments (list): mail.Attachment objects, streamed from disk into the SMTP connection
 
     Returns:
         dict: the response from the email server
@@ -169,28 +382,17 @@ def send_to_email(
     # NOTE: Wondering if I should do something more like https://learn.microsoft.com/en-us/graph/api/user-sendmail?view=graph-rest-1.0&tabs=http
     """
     email_status = False
-    html_content = """
-
-
-
-
-
-
-            This is a sample body
-
-
-    """
-    msg = email.mime.text.MIMEText(html_content, "html")
-    msg["Subject"] = subject
-    msg["From"] = from_
-    msg["To"] = to
+    msg = mail.message_from_payload(payload, subject, from_, to)
     email_connection = smtplib.SMTP(host, port)
     try:
         email_connection.ehlo()
         email_connection.starttls()
         email_connection.ehlo() 
         # # email_connection.login(user, password)
-        email_connection.sendmail(from_, to, msg.as_string())
+        if attachments:
+            mail.send_streaming(email_connection, from_, to, mail.stream_message(msg, attachments))
+        else:
+            email_connection.sendmail(from_, to, msg.as_bytes())
         email_status = True
     except Exception:
         email_status = False
@@ -199,18 +401,64 @@ def send_to_email(
     return json.dumps({"response": email_status})
 
 
+@patch
+def email_parts(self: PingMe) -> dict:
+    """
+    Render the card's email_template, cards without one get a plain text and HTML version of their title and text
+
+    Returns:
+        dict: the rendered subject, text and html parts
+    """
+    with hooks.stage("render_email", card=self.name, transport="email"):
+        context = {"title": self.title, "text": self.text, **self.card["context"]}
+        return mail.render_parts(self.card.get("email_template"), context)
+
+
+@patch
+def attach(self: PingMe, path: str, name: str = None, gzip: bool = None) -> PingMe:
+    """
+    Attach a file to the email, it is read from disk when the email is sent
+
+    Args:
+        path (str): the file, must be under one of the email attachments allowed_dirs
+        name (str): file name shown in the email, defaults to the file's name
+        gzip (bool): compress the file while sending, None uses the config default
+
+    Returns:
+        PingMe: self, for chaining
+    """
+    attachment = {"path": path, "name": name}
+    if gzip is not None:
+        attachment["gzip"] = gzip
+    self.attachments.append(attachment)
+    return self
+
+
 @patch
 def send_email(self: PingMe) -> dict:
-    return send_to_email(
-        self.payload,
-        self.title,
-        self.email["from"],
-        self.email["to"],
-        self.email["smtp"]["host"],
-        self.email["smtp"]["port"],
-        self.email["smtp"]["user"],
-        self.email["smtp"]["password"],
-    )
+    parts = self.email_parts()
+    # The validated options, a dict assigned to self.email is validated here
+    options = config_model.EmailOptions.model_validate(self.email)
+    # Checked before connecting so a refused attachment never leaves a half sent email
+    attachments = mail.attachments_from(self.attachments, options.attachments)
+    with hooks.stage("send_to_email", card=self.name, transport="email"):
+        try:
+            response = send_to_email(
+                parts,
+                parts["subject"] or self.title,
+                options.from_,
+                options.to,
+                options.smtp.host,
+                options.smtp.port,
+                options.smtp.user,
+                options.smtp.password,
+                attachments,
+            )
+        except Exception:
+            metrics.record_send(self.name, "", "email", success=False)
+            raise
+    metrics.record_send(self.name, "", "email", success=json.loads(response)["response"] is True)
+    return response
 
 
 @staticmethod
@@ -239,7 +487,51 @@ def send_to_logfile(logfile: str, title: str, text: str) -> dict:
 # %% ../nbs/01_pingme_class.ipynb 26
 @patch
 def send_logfile(self: PingMe) -> dict:
-    return send_to_logfile(self.logfile["path"], self.title, self.text)
+    with hooks.stage("send_to_logfile", card=self.name, transport="logfile"):
+        try:
+            path = config_model.LogfileOptions.model_validate(self.logfile).path
+            response = send_to_logfile(path, self.title, self.text)
+        except Exception:
+            metrics.record_send(self.name, "", "logfile", success=False)
+            raise
+    metrics.record_send(self.name, "", "logfile")
+    return response
+
+@patch
+def send_spool(self: PingMe, channel: str = None) -> str:
+    """
+    Write the rendered webhook payload to the spool directory instead of sending it, `pingme_drain` sends it later.
+    Takes the network off the caller's path, use it on hosts with unreliable outbound connectivity.
+
+    Args:
+        channel (str): channel, alias or group name, None spools for the default channel
+
+    Returns:
+        str: path of the spooled file, the first one when an oversized card was split
+
+    Raises:
+        UnknownChannel: if the channel is not configured and no fallback is set
+    """
+    with hooks.stage("send_to_spool", card=self.name, channel=channel or "default", transport="spool"):
+        name, urls = channels.table_for(self.webhook).resolve(channel)
+        payloads = self.fitted_payloads(name)
+        paths = [
+            spool.write(
+                spool.spool_dir(self.spool),
+                {
+                    "card": {"name": self.name, "context": self.card["context"], "priority": self.priority},
+                    "channel": name,
+                    "config_file": self.config_file,
+                    "urls": list(urls),
+                    "payload": payload,
+                    "part": part,
+                    "parts": len(payloads),
+                },
+            )
+            for part, payload in enumerate(payloads)
+        ]
+        return paths[0]
+
 
 # %% ../nbs/01_pingme_class.ipynb 27
 # Make a CLI function using `call_parse` to handle arguments
@@ -250,6 +542,8 @@ def cli(
     webhook: bool = None,  # attempts to send to webhook
     email: bool = None,  # attempts to send to email
     logfile: bool = None,  # attempts to send to logfile
+    spool: bool = None,  # writes the webhook payload to the spool directory for pingme_drain to send
+    attach: str = None,  # comma separated files to attach to the email
     example: bool = None,  # Runs with example params, if it doesn't work config values haven't been set properly
     config_file: str = None,  # config file to set env vars from
 ):
@@ -266,12 +560,17 @@ def cli(
     """
     config = core.get_config(config_file)
 
-    card = Card
-    card.name = config["pingme"]["user_input"]["card"]["name"]
-    card.context = config["pingme"]["user_input"]["card"]["context"]
+    user_card = config["pingme"]["user_input"]["card"]
+    card_context = dict(user_card["context"])
+    if context:
+        card_context.update(json.loads(context))
+    card = Card(name=user_card["name"], context=card_context)
     pingme = PingMe(card, config_file)
+    for path in (attach or "").split(","):
+        if path:
+            pingme.attach(path.strip())
 
-    if not webhook and not email and not logfile:
+    if not webhook and not email and not logfile and not spool:
         print("No destination provided, exiting", file=sys.stderr)
         sys.exit(1)
     else:
@@ -284,6 +583,9 @@ def cli(
         if logfile:
             pingme.send_logfile()
             print("Sent to logfile", file=sys.stdout)
+        if spool:
+            pingme.send_spool()
+            print("Spooled for webhook", file=sys.stdout)
 
 # %% ../nbs/01_pingme_class.ipynb 29
 @call_parse
@@ -0,0 +1,127 @@
+import collections
+import threading
+
+
+class Decision(collections.namedtuple("Decision", ["rule", "webhook", "email", "logfile"])):
+    """
+    Where a card goes: the matching rule name (None for the default route), webhook channels and if it is emailed
+    and/or written to the logfile
+    """
+
+    def as_dict(self) -> dict:
+        return {"rule": self.rule, "webhook": list(self.webhook), "email": self.email, "logfile": self.logfile}
+
+
+def _as_set(value) -> frozenset:
+    # Accepts a list, a comma separated string or a single value, normalised to lower case
+    if value is None:
+        return frozenset()
+    if isinstance(value, str):
+        value = value.split(",")
+    return frozenset(str(v).strip().lower() for v in value if str(v).strip())
+
+
+class Router:
+    """
+    Routing rules compiled into a decision table. Rules are prefiltered per severity when compiled and the decision
+    for each (card, severity, tags) combination is memoised, so routing a send is a dict lookup after the first time.
+    The first matching rule wins.
+    """
+
+    max_memoised: int = 4096  # bound on remembered decisions, tags come from callers
+
+    def __init__(self, rules: list = None, default: dict = None):
+        """
+        Args:
+            rules (list): rules as dicts with name, match (severity, tags, cards) and the webhook, email, logfile actions
+            default (dict): actions when no rule matches, defaults to the default webhook channel only
+        """
+        self.rules = [self._compile_rule(i, rule) for i, rule in enumerate(rules or [])]
+        self.default = self._decision(None, default or {"webhook": ["default"]})
+        # severity -> rules that can match it, "*" holds rules without a severity condition
+        self._by_severity: dict = collections.defaultdict(list)
+        for rule in self.rules:
+            for severity in rule["severity"] or {"*"}:
+                self._by_severity[severity].append(rule)
+        for severity, rules_ in self._by_severity.items():
+            if severity != "*":
+                rules_.extend(self._by_severity.get("*", []))
+                rules_.sort(key=lambda r: r["order"])
+        self._memo: dict = {}
+        self._memo_lock = threading.Lock()
+
+    @staticmethod
+    def _decision(name, actions: dict) -> Decision:
+        webhook = actions.get("webhook") or []
+        if isinstance(webhook, str):
+            webhook = [webhook]
+        return Decision(name, tuple(webhook), bool(actions.get("email")), bool(actions.get("logfile")))
+
+    def _compile_rule(self, order: int, rule: dict) -> dict:
+        match = rule.get("match") or {}
+        return {
+            "order": order,
+            "severity": _as_set(match.get("severity")),
+            "tags": _as_set(match.get("tags")),
+            "cards": _as_set(match.get("cards")),
+            "decision": self._decision(rule.get("name", f"rule_{order}"), rule),
+        }
+
+    @classmethod
+    def from_config(cls, routing: dict):
+        """
+        Args:
+            routing (dict): the config["pingme"]["routing"] section, may be None
+        """
+        routing = routing or {}
+        return cls(routing.get("rules"), routing.get("default"))
+
+    def decide(self, card_name: str, context: dict) -> Decision:
+        """
+        Args:
+            card_name (str): the card name
+            context (dict): the card context, severity and tags (list or comma separated string) are used
+
+        Returns:
+            Decision: the decision of the first matching rule, or the default
+        """
+        severity = str(context.get("severity", "")).lower()
+        tags = _as_set(context.get("tags"))
+        key = (card_name.lower(), severity, tags)
+        decision = self._memo.get(key)
+        if decision is not None:
+            return decision
+
+        decision = self.default
+        candidates = self._by_severity.get(severity, self._by_severity.get("*", []))
+        for rule in candidates:
+            if rule["tags"] and not rule["tags"] & tags:
+                continue
+            if rule["cards"] and key[0] not in rule["cards"]:
+                continue
+            decision = rule["decision"]
+            break
+        with self._memo_lock:
+            if len(self._memo) < self.max_memoised:
+                self._memo[key] = decision
+        return decision
+
+
+def router_for(config: dict) -> Router:
+    """
+    The compiled router of a config, compiled and stored in the routing section on first use
+    (core.load_config compiles it up front for loaded configs)
+
+    Args:
+        config (dict): the config
+
+    Returns:
+        Router: the router
+    """
+    routing = config["pingme"].get("routing")
+    if routing is None:
+        routing = config["pingme"]["routing"] = {}
+    router = routing.get("table")
+    if router is None:
+        router = routing.setdefault("table", Router.from_config(routing))
+    return router
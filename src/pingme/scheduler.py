@@ -0,0 +1,288 @@
+import concurrent.futures
+import datetime
+import heapq  # timers are a min-heap on due time, the worker only ever looks at the earliest one
+import json
+import os
+import sqlite3  # local persistence so pending timers survive restarts
+import threading
+import time
+import uuid
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from .core import logger, settings
+from .pingme_class import Card
+from .services import NotificationService
+
+
+class ScheduleRequest(BaseModel):
+    card: Card
+    at: Optional[datetime.datetime] = None  # send at this time, naive times are local time
+    delay: Optional[float] = Field(None, ge=0)  # or send after this many seconds
+    every: Optional[float] = Field(None, gt=0)  # repeat every this many seconds after the first send
+    transport: str = "webhook"  # webhook, email, logfile or route
+    channel: Optional[str] = None  # webhook channel
+
+
+def deliver(spec: dict) -> dict:
+    """
+    Send a scheduled job through the existing transports
+
+    Args:
+        spec (dict): job spec with card, transport, channel and config_file
+
+    Returns:
+        dict: the parsed response of the transport
+    """
+    card = Card.model_validate(spec["card"])
+    config_file = spec.get("config_file")
+    transport = spec.get("transport", "webhook")
+    if transport == "webhook":
+        return NotificationService._deliver_webhook(card, channel=spec.get("channel"), config_file=config_file)
+    if transport == "email":
+        return NotificationService._deliver_email(card, config_file=config_file)
+    if transport == "logfile":
+        return NotificationService._deliver_logfile(card, config_file=config_file)
+    if transport == "route":
+        return NotificationService.send_routed_card(card, config_file=config_file)
+    raise ValueError(f"Unknown transport {transport}")
+
+
+class Scheduler:
+    """
+    Persistent timer scheduler. Pending jobs live in a dict and a min-heap of (due, id); rescheduled or cancelled jobs
+    leave stale heap entries that are skipped when they surface (lazy deletion), so scheduling, heartbeats and
+    cancelling are O(log n) and the worker thread sleeps until the earliest due time instead of polling all timers.
+    Jobs are stored in SQLite and reloaded with a single heapify on start.
+
+    Several processes (uvicorn workers) may run a scheduler on the same file. A due job is claimed in SQLite by
+    moving or deleting its row only if it still has the due time this process knows, so exactly one process sends it.
+    A process that loses the claim follows the row instead, which another process may have re-armed (a heartbeat) or
+    cancelled.
+    """
+
+    def __init__(self, path: str, deliver=deliver, max_workers: int = 4):
+        """
+        Args:
+            path (str): SQLite file to persist jobs in
+            deliver (callable): called with the job spec when a job is due
+            max_workers (int): concurrent deliveries, slow sends never hold up the timers
+        """
+        self.path = path
+        self.deliver = deliver
+        self.max_workers = max_workers
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, due REAL NOT NULL, spec TEXT NOT NULL)")
+        self._jobs: dict = {}  # id -> (due, spec)
+        for job_id, due, spec in self._db.execute("SELECT id, due, spec FROM jobs"):
+            self._jobs[job_id] = (due, json.loads(spec))
+        self._heap: list = [(due, job_id) for job_id, (due, _) in self._jobs.items()]
+        heapq.heapify(self._heap)
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._pool = None
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def start(self):
+        """Start the worker thread, returns self"""
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pingme-schedule")
+        self._thread = threading.Thread(target=self._run, name="pingme-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the worker thread, pending jobs stay persisted"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._pool.shutdown(wait=True)
+            self._thread = None
+        self._db.close()
+
+    def schedule(self, spec: dict, due: float, job_id: str = None) -> str:
+        """
+        Schedule or reschedule a job
+
+        Args:
+            spec (dict): job spec passed to deliver
+            due (float): unix time the job is due
+            job_id (str): id of the job, an existing job with this id is replaced
+
+        Returns:
+            str: the job id
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self._cond:
+            self._jobs[job_id] = (due, spec)
+            heapq.heappush(self._heap, (due, job_id))
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, due, spec) VALUES (?, ?, ?)", (job_id, due, json.dumps(spec))
+            )
+            self._compact()
+            if self._heap[0][1] == job_id:
+                self._cond.notify()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Args:
+            job_id (str): the job id
+
+        Returns:
+            bool: True if a pending job was cancelled, also when it was scheduled by another process
+        """
+        with self._cond:
+            self._jobs.pop(job_id, None)
+            return self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: the pending job as {"id", "due", "spec"} or None, also jobs scheduled by another process
+        """
+        with self._cond:
+            row = self._db.execute("SELECT due, spec FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": job_id, "due": row[0], "spec": json.loads(row[1])}
+
+    def heartbeat(self, key: str, timeout: float, spec: dict) -> float:
+        """
+        Dead-man switch: (re)arm a timer that sends spec if no further heartbeat for key arrives within timeout
+
+        Args:
+            key (str): heartbeat key, e.g. a pipeline name
+            timeout (float): seconds until the alert is sent
+            spec (dict): the alert job spec
+
+        Returns:
+            float: unix time the alert is due
+
+        Raises:
+            ValueError: if timeout is not positive
+        """
+        if not timeout > 0:
+            raise ValueError(f"Heartbeat timeout must be positive, got {timeout}")
+        due = time.time() + timeout
+        self.schedule(spec, due, job_id=f"heartbeat:{key}")
+        return due
+
+    def _compact(self) -> None:
+        # Rebuild the heap when stale entries dominate, e.g. after many heartbeats for the same keys
+        if len(self._heap) > 2 * len(self._jobs) + 1024:
+            self._heap = [(due, job_id) for job_id, (due, _) in self._jobs.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self):
+        # Called with the lock held, returns the spec of a due job, or waits until the next one is due
+        while self._heap:
+            due, job_id = self._heap[0]
+            job = self._jobs.get(job_id)
+            if job is None or job[0] != due:
+                heapq.heappop(self._heap)  # stale entry
+                continue
+            delay = due - time.time()
+            if delay > 0:
+                self._cond.wait(delay)
+                return None
+            heapq.heappop(self._heap)
+            spec = job[1]
+            every = spec.get("every")
+            # Claim the job: the row only changes if no other process has sent, re-armed or cancelled it
+            if every:
+                next_due = due + every * max(1, int((time.time() - due) // every) + 1)  # skip missed repeats
+                claimed = self._db.execute(
+                    "UPDATE jobs SET due = ? WHERE id = ? AND due = ?", (next_due, job_id, due)
+                ).rowcount
+            else:
+                next_due = None
+                claimed = self._db.execute("DELETE FROM jobs WHERE id = ? AND due = ?", (job_id, due)).rowcount
+            if not claimed:
+                self._follow(job_id)
+                continue
+            if next_due is not None:
+                self._jobs[job_id] = (next_due, spec)
+                heapq.heappush(self._heap, (next_due, job_id))
+            else:
+                del self._jobs[job_id]
+            return spec
+        self._cond.wait()
+        return None
+
+    def _follow(self, job_id: str) -> None:
+        # Called with the lock held after losing a claim, take over the job as it is stored now
+        row = self._db.execute("SELECT due, spec FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            self._jobs.pop(job_id, None)
+        else:
+            self._jobs[job_id] = (row[0], json.loads(row[1]))
+            heapq.heappush(self._heap, (row[0], job_id))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                spec = self._pop_due()
+            if spec is not None:
+                self._pool.submit(self._deliver, spec)
+
+    def _deliver(self, spec: dict) -> None:
+        try:
+            self.deliver(spec)
+        except Exception:
+            logger.exception(f"Scheduled delivery of card {spec.get('card', {}).get('name')} failed")
+
+
+def due_time(request: ScheduleRequest) -> float:
+    """
+    Args:
+        request (ScheduleRequest): the schedule request
+
+    Returns:
+        float: unix time the first send is due
+    """
+    if request.at is not None:
+        return request.at.timestamp()
+    return time.time() + (request.delay or 0.0)
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """
+    The process-wide scheduler persisted in settings.data_dir, started on first use
+
+    Returns:
+        Scheduler: the running scheduler
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                os.makedirs(settings.data_dir, exist_ok=True)
+                _scheduler = Scheduler(os.path.join(settings.data_dir, "schedule.sqlite")).start()
+    return _scheduler
+
+
+def stop_scheduler() -> None:
+    """Stop the process-wide scheduler if it was started"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
@@ -1,6 +1,17 @@
+import concurrent.futures
 import json
+import threading
+import time
+from typing import Optional
+from pydantic import BaseModel
+from . import channels, core, deadletter, hooks, idempotency, metrics, tenants
+from .channels import UnknownChannel
+from .sizeguard import PayloadTooLarge
+from .mail import AttachmentError
+from .routing import router_for
+from .limits import Overloaded, limiter_for
 from .core import settings, logger
-from .pingme_class import Card, PingMe
+from .pingme_class import Card, PingMe, failed_targets
 from fastcore.script import (
     call_parse,
 )  # for @call_parse, https://fastcore.fast.ai/script
@@ -15,126 +26,333 @@ def parse_smtp_response(response):
     Returns:
         dict: A dictionary with status_code and response message
     """ 
-    if json.loads(response).get("response") is True:
-        response_data = {"status_code": 200, "response": "Email sent successfully"}
-    else:
-        response_data = {"status_code": 500, "response": "Failed to send email"}
+    with hooks.stage("parse_smtp_response", transport="email"):
+        if json.loads(response).get("response") is True:
+            response_data = {"status_code": 200, "response": "Email sent successfully"}
+        else:
+            response_data = {"status_code": 500, "response": "Failed to send email"}
     return response_data
 
 def parse_webhook_response(response):
     """
     Parses the webhook response to determine if the message was sent successfully.
     The response should be a JSON string with a "status_code" key that is 200 if the message was sent successfully.
+    A list of responses (a send to a channel group) is reported with the worst status code and a list of responses.
 
     Args:
         response (str): The webhook response as a JSON string
     Returns:
         dict: A dictionary with status_code and response message
     """ 
-
-    try:
-        response_data = response.json()
-    except ValueError:
-        # Return text content if not JSON
-        response_data = {
-            "content": response.text if response.text else "No content"
+    if isinstance(response, list):
+        parsed = [parse_webhook_response(r) for r in response]
+        return {
+            "status_code": max(p["status_code"] for p in parsed),
+            "response": [p["response"] for p in parsed],
         }
+
+    if getattr(response, "body_discarded", False) is True:
+        # Success in fire-and-forget mode, the body was never read
+        return {"status_code": response.status_code, "response": {"content": "Not read"}}
+
+    with hooks.stage("parse_webhook_response", transport="webhook"):
+        try:
+            response_data = response.json()
+        except ValueError:
+            # Return text content if not JSON
+            response_data = {
+                "content": response.text if response.text else "No content"
+            }
     return {"status_code": response.status_code, "response": response_data}
 
+class Notification(BaseModel):
+    card: Card
+    transport: str = "webhook"  # webhook, email, logfile or route
+    channel: Optional[str] = None  # webhook channel
+    id: Optional[str] = None  # idempotency key, a notification retried with the same id is not sent twice
+
+
+_bulk_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_bulk_pool_lock = threading.Lock()
+
+
+def _bulk_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _bulk_pool
+    if _bulk_pool is None:
+        with _bulk_pool_lock:
+            if _bulk_pool is None:
+                _bulk_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="pingme-bulk")
+    return _bulk_pool
+
+
+def _log_delivery(card: Card, channel: str, transport: str, status_code: int, start: float) -> None:
+    # One structured record per send, the fields become keys with settings.log_format = "json"
+    latency_ms = (time.perf_counter() - start) * 1000
+    logger.info(
+        f"Delivered {transport} card {card.name} to {channel}: {status_code} in {latency_ms:.1f} ms",
+        extra={
+            "card": card.name,
+            "channel": channel,
+            "transport": transport,
+            "priority": card.priority,
+            "status_code": status_code,
+            "latency_ms": latency_ms,
+        },
+    )
+
 class NotificationService:
     @staticmethod
-    def send_default_card_to_webhook(channel: str = None):
+    def _deliver_webhook(
+        card: Card, channel: str = None, config_file: str = None, dead_letter: bool = True, targets: list = None
+    ):
+        # Single path for all webhook sends, the request stage spans config load to response parse.
+        # Failed sends are dead-lettered for replay unless dead_letter is False (the replay itself). When only some
+        # URLs of a group or parts of a split card fail, only those are dead-lettered and reported as failed_targets,
+        # targets limits a send to such a list
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        # Limits apply to the canonical channel, so case differences and aliases share one counter
+        slot_channel = channels.table_for(core.get_config(config_file)["pingme"]["options"]["webhook"]).resolve(channel)[0]
+        start = time.perf_counter()
+        with hooks.stage("request", card=card.name, channel=slot_channel, transport="webhook"):
+            try:
+                with limiter_for(config_file).slot(slot_channel, card.priority):
+                    notification = PingMe(
+                        card,
+                        config_file=config_file,
+                    )
+                    try:
+                        response = notification.send_webhook(channel=channel, targets=targets)
+                    except (UnknownChannel, PayloadTooLarge):
+                        raise  # replaying would fail the same way
+                    except Overloaded:
+                        raise  # a webhook host at its limit, not sent and the caller is told to retry
+                    except Exception as e:
+                        if dead_letter:
+                            deadletter.record(
+                                card, "webhook", channel, config_file, error=repr(e)[:2000], targets=failed_targets(e) or targets
+                            )
+                        raise
+            except Overloaded:
+                metrics.record_suppression(card.name, slot_channel, "webhook", "overloaded")
+                raise
+            # Handle response safely
+            result = parse_webhook_response(response)
+            failed = failed_targets(response)
+            if failed:
+                result["failed_targets"] = failed
+            _log_delivery(card, slot_channel, "webhook", result["status_code"], start)
+            if dead_letter and not 200 <= result["status_code"] < 300:
+                deadletter.record(
+                    card,
+                    "webhook",
+                    channel,
+                    config_file,
+                    error=str(result["response"])[:2000],
+                    status_code=result["status_code"],
+                    targets=failed or targets,
+                )
+            return result
+
+    @staticmethod
+    def _deliver_email(card: Card, config_file: str = None, dead_letter: bool = True):
+        # Single path for all email sends, the request stage spans config load to response parse
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        start = time.perf_counter()
+        with hooks.stage("request", card=card.name, transport="email"):
+            try:
+                with limiter_for(config_file).slot("email", card.priority):
+                    notification = PingMe(
+                        card,
+                        config_file=config_file,
+                    )
+                    try:
+                        response = notification.send_email()
+                    except AttachmentError:
+                        raise  # replaying would fail the same way
+                    except Exception as e:
+                        if dead_letter:
+                            deadletter.record(card, "email", None, config_file, error=repr(e))
+                        raise
+            except Overloaded:
+                metrics.record_suppression(card.name, "", "email", "overloaded")
+                raise
+            result = parse_smtp_response(response)
+            _log_delivery(card, "email", "email", result["status_code"], start)
+            if dead_letter and result["status_code"] != 200:
+                deadletter.record(card, "email", None, config_file, error=result["response"], status_code=result["status_code"])
+            return result
+
+    @staticmethod
+    def send_default_card_to_webhook(channel: str = None, config_file: str = None):
         # Handles all logic for processing notifications
-        logger.info("Sending default webhook card")
+        logger.debug("Sending default webhook card")
         card = Card.model_validate(
             {
                 "name": "default",
                 "context": {"title": "Default Title", "text": "Test Text"},
             }
         )
-        notification = PingMe(
-            card,
-            config_file=settings.config_file,
-        )
-        response = notification.send_webhook(channel=channel)
-       
-        return parse_webhook_response(response)
+        return NotificationService._deliver_webhook(card, channel=channel, config_file=config_file)
 
     @staticmethod
-    def send_simple_card_to_webhook(title: str, text: str, channel: str = None):
+    def send_simple_card_to_webhook(title: str, text: str, channel: str = None, config_file: str = None):
         # Handles all logic for processing notifications
-        logger.info("Sending simple webhook card")
+        logger.debug("Sending simple webhook card")
         card = Card.model_validate(
             {
                 "name": "default",
                 "context": {"title": title, "text": text},
             }
         )
-        notification = PingMe(
-            card,
-            config_file=settings.config_file,
-        )
-        response = notification.send_webhook(channel=channel)
-        # Handle response safely
-        return parse_webhook_response(response)
+        return NotificationService._deliver_webhook(card, channel=channel, config_file=config_file)
 
     @staticmethod
-    def send_card_to_webhook(card: Card, channel: str = None):
+    def send_card_to_webhook(card: Card, channel: str = None, config_file: str = None):
         # Handles all logic for processing notifications
-        logger.info("Sending webhook card")
-        notification = PingMe(
-            card,
-            config_file=settings.config_file,
-        )
-        response = notification.send_webhook(channel=channel)
-        # Handle response safely
-        return parse_webhook_response(response)
+        logger.debug("Sending webhook card")
+        return NotificationService._deliver_webhook(card, channel=channel, config_file=config_file)
 
 
     @staticmethod
-    def send_default_card_to_email():
+    def send_default_card_to_email(config_file: str = None):
         # Handles all logic for processing email notifications
-        logger.info("Sending default email card")
+        logger.debug("Sending default email card")
         card = Card.model_validate(
             {
                 "name": "default",
                 "context": {"title": "Default Title", "text": "Test Text"},
             }
         )
-        notification = PingMe(
-            card,
-            config_file=settings.config_file,
-        )
-        response = notification.send_email()
-        return parse_smtp_response(response)
+        return NotificationService._deliver_email(card, config_file=config_file)
 
     @staticmethod
-    def send_simple_card_to_email(title: str, text: str, channel: str = None):
+    def send_simple_card_to_email(title: str, text: str, channel: str = None, config_file: str = None):
         # Handles all logic for processing email notifications
-        logger.info("Sending simple email card")
+        logger.debug("Sending simple email card")
         card = Card.model_validate(
             {
                 "name": "default",
                 "context": {"title": title, "text": text},
             }
         )
-        notification = PingMe(
-            card,
-            config_file=settings.config_file,
-        )
-        response = notification.send_email()
-        return parse_smtp_response(response)
+        return NotificationService._deliver_email(card, config_file=config_file)
 
     @staticmethod
-    def send_card_to_email(card: Card, channel: str = None):
+    def send_card_to_email(card: Card, channel: str = None, config_file: str = None):
         # Handles all logic for processing email notifications
-        logger.info("Sending email card")
+        logger.debug("Sending email card")
+        return NotificationService._deliver_email(card, config_file=config_file)
+
+    @staticmethod
+    def send_card_to_spool(card: Card, channel: str = None, config_file: str = None):
+        # Writes the rendered webhook payload to the spool directory, pingme_drain sends it
+        if config_file is None:
+            config_file = tenants.active_config_file()
         notification = PingMe(
             card,
-            config_file=settings.config_file,
+            config_file=config_file,
+        )
+        return {"status_code": 202, "response": {"spooled": notification.send_spool(channel=channel)}}
+
+    @staticmethod
+    def _deliver_logfile(card: Card, config_file: str = None):
+        # Single path for all logfile sends
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        with hooks.stage("request", card=card.name, transport="logfile"):
+            notification = PingMe(
+                card,
+                config_file=config_file,
+            )
+            return json.loads(notification.send_logfile())
+
+    @staticmethod
+    def send_notification(notification: Notification, config_file: str = None) -> dict:
+        # Sends one notification of a bulk request, errors are reported in the result instead of raised
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        if notification.id is not None:
+            # Reserve the id before sending, a retry arriving meanwhile (in any worker) waits for this result
+            try:
+                result = idempotency.get_store().claim(config_file or "", notification.id)
+            except idempotency.StillSending as e:
+                return {"id": notification.id, "status_code": 503, "detail": str(e), "retry_after": 1}
+            if result is not None:
+                return dict(result, duplicate=True)
+        try:
+            result = NotificationService._send_notification(notification, config_file)
+        except BaseException:
+            if notification.id is not None:
+                idempotency.get_store().release(config_file or "", notification.id)
+            raise
+        if notification.id is not None:
+            if result.get("retry_after") is not None:
+                idempotency.get_store().release(config_file or "", notification.id)  # not sent, the caller may retry
+            else:
+                idempotency.get_store().complete(config_file or "", notification.id, result)
+        return result
+
+    @staticmethod
+    def _send_notification(notification: Notification, config_file: str) -> dict:
+        card, transport = notification.card, notification.transport
+        try:
+            if transport == "webhook":
+                result = NotificationService._deliver_webhook(card, channel=notification.channel, config_file=config_file)
+            elif transport == "email":
+                result = NotificationService._deliver_email(card, config_file=config_file)
+            elif transport == "logfile":
+                result = {"status_code": 200, "response": NotificationService._deliver_logfile(card, config_file=config_file)}
+            elif transport == "route":
+                result = {"status_code": 200, "response": NotificationService.send_routed_card(card, config_file=config_file)}
+            else:
+                result = {"status_code": 400, "detail": f"Unknown transport {transport}"}
+        except UnknownChannel as e:
+            result = {"status_code": 404, "detail": e.args[0]}
+        except PayloadTooLarge as e:
+            result = {"status_code": 413, "detail": str(e)}
+        except AttachmentError as e:
+            result = {"status_code": 400, "detail": str(e)}
+        except Overloaded as e:
+            # Not sent, so not remembered: the caller may retry it
+            return {"id": notification.id, "status_code": e.status_code, "detail": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            result = {"status_code": 500, "detail": str(e)}
+        return {"id": notification.id, **result}
+
+    @staticmethod
+    def send_bulk(notifications: list, config_file: str = None) -> list:
+        # Sends many notifications concurrently, results are in the order of the notifications
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        logger.debug(f"Sending {len(notifications)} notifications in bulk")
+        return list(
+            _bulk_executor().map(lambda n: NotificationService.send_notification(n, config_file=config_file), notifications)
         )
-        response = notification.send_email()
-        return parse_smtp_response(response)
+
+    @staticmethod
+    def explain_route(card: Card, config_file: str = None):
+        # Which routing rule matches the card and where it would be sent, without sending
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        return router_for(core.get_config(config_file)).decide(card.name, card.context).as_dict()
+
+    @staticmethod
+    def send_routed_card(card: Card, config_file: str = None):
+        # Handles all logic for sending a card wherever the routing rules send it
+        if config_file is None:
+            config_file = tenants.active_config_file()
+        decision = router_for(core.get_config(config_file)).decide(card.name, card.context)
+        logger.info(f"Routing card {card.name} by rule {decision.rule}")
+        result = {"rule": decision.rule, "webhook": {}, "email": None, "logfile": None}
+        for channel in decision.webhook:
+            result["webhook"][channel] = NotificationService._deliver_webhook(card, channel=channel, config_file=config_file)
+        if decision.email:
+            result["email"] = NotificationService._deliver_email(card, config_file=config_file)
+        if decision.logfile:
+            result["logfile"] = NotificationService._deliver_logfile(card, config_file=config_file)
+        return result
 
 # Make a CLI function using `call_parse` to handle arguments
 @call_parse
@@ -149,10 +367,7 @@ def pingme_send_default_card_to_webhook(
         config_file: str = None: Path to the config file
         channel: str = None: Channel to send the webhook to, if not set uses default channel
     """
-    # Override settings if provided
-    if config_file:
-        settings.config_file = config_file
-    NotificationService.send_default_card_to_webhook(channel=channel)
+    NotificationService.send_default_card_to_webhook(channel=channel, config_file=config_file or None)
 
 
 # Make a CLI function using `call_parse` to handle arguments
@@ -170,10 +385,7 @@ def pingme_send_simple_card_to_webhook(
         text (str): Text of the card
         config_file (str): Path to the config file, none uses default
     """
-    # Override settings if provided
-    if config_file:
-        settings.config_file = config_file
-    NotificationService.send_simple_card_to_webhook(title, text)
+    NotificationService.send_simple_card_to_webhook(title, text, config_file=config_file or None)
 
 
 @call_parse
@@ -188,10 +400,7 @@ def pingme_send_card_to_webhook(
         card (Card): Card object to send
         config_file (str): Path to the config file, none uses default
     """
-    # Override settings if provided
-    if config_file:
-        settings.config_file = config_file
-    NotificationService.send_card_to_webhook(card)
+    NotificationService.send_card_to_webhook(card, config_file=config_file or None)
 
 
 # Make a CLI function using `call_parse` to handle arguments
@@ -205,10 +414,7 @@ def pingme_send_default_card_to_email(
     Args:
         config_file (str): Path to the config file, none uses default
     """
-    # Override settings if provided
-    if config_file:
-        settings.config_file = config_file
-    NotificationService.send_default_card_to_email()
+    NotificationService.send_default_card_to_email(config_file=config_file or None)
 
 
 # Make a CLI function using `call_parse` to handle arguments
@@ -226,10 +432,7 @@ def pingme_send_simple_card_to_email(
         text (str): Text of the email
         config_file (str): Path to the config file, none uses default
     """
-    # Override settings if provided
-    if config_file:
-        settings.config_file = config_file
-    NotificationService.send_simple_card_to_email(title, text)
+    NotificationService.send_simple_card_to_email(title, text, config_file=config_file or None)
 
 
 @call_parse
@@ -244,7 +447,4 @@ def pingme_send_card_to_email(
         card (Card): Card object to send
         config_file (str): Path to the config file, none uses default
     """
-    # Override settings if provided
-    if config_file:
-        settings.config_file = config_file
-    NotificationService.send_card_to_email(card)
+    NotificationService.send_card_to_email(card, config_file=config_file or None)
@@ -0,0 +1,166 @@
+import json
+import os
+import time
+import uuid
+
+from .core import logger, settings
+
+# Teams and most chat webhooks reject bodies around 28 KB, with an unhelpful 400/413
+DEFAULT_MAX_BYTES = 28000
+OVERSIZE_ACTIONS = ("truncate", "split", "reject")
+TRUNCATED_NOTE = "\n\n... truncated, full text ({size} bytes): {ref}"
+
+
+class PayloadTooLarge(ValueError):
+    """A payload is over its channel's size limit and cannot be shrunk by shortening the text"""
+
+
+def encoded_size(payload: str) -> int:
+    """
+    Returns:
+        int: size of the payload on the wire in bytes, UTF-8
+    """
+    return len(payload) if payload.isascii() else len(payload.encode("utf-8"))
+
+
+def _escaped_size(text: str) -> int:
+    # Size of the text once substituted into the JSON payload
+    return len(json.dumps(text)) - 2
+
+
+def _budget(render, context: dict, limit: int) -> int:
+    """Bytes left for the text once everything else in the card is accounted for, per use of ${text}"""
+    empty = encoded_size(json.dumps(render({**context, "text": ""})))
+    uses = encoded_size(json.dumps(render({**context, "text": "x"}))) - empty
+    return (limit - empty) // uses if uses else 0
+
+
+def max_bytes(policy: dict, channel: str) -> int:
+    """
+    Args:
+        policy (dict): the webhook payload_limit section, may be None
+        channel (str): the resolved channel name
+
+    Returns:
+        int: the channel's payload size limit in bytes, 0 means unlimited
+    """
+    policy = policy or {}
+    limits = policy.get("channels") or {}
+    if channel in limits:
+        return int(limits[channel] or 0)
+    value = policy.get("max_bytes", DEFAULT_MAX_BYTES)
+    return DEFAULT_MAX_BYTES if value is None else int(value)
+
+
+def _cut(text: str, budget: int) -> int:
+    """Length of the longest prefix of text that fits budget bytes once escaped, preferring a line break"""
+    end = min(len(text), budget)  # a character is at least one byte
+    while end > 0 and _escaped_size(text[:end]) > budget:
+        end = int(end * budget / _escaped_size(text[:end])) if end > 1 else 0
+    if end < len(text):
+        newline = text.rfind("\n", int(end * 0.8), end)
+        if newline > 0:
+            end = newline + 1
+    return end
+
+
+def spill_path(spill_dir: str = None) -> str:
+    """
+    Args:
+        spill_dir (str): directory to write to, None uses <DATA_DIR>/spill
+
+    Returns:
+        str: a new path for a spill file, nothing is written yet
+    """
+    spill_dir = spill_dir or os.path.join(settings.data_dir, "spill")
+    return os.path.join(spill_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:12]}.txt")
+
+
+def spill(text: str, spill_dir: str = None, path: str = None) -> str:
+    """
+    Write the full text of a truncated card to a local file
+
+    Args:
+        text (str): the full text
+        spill_dir (str): directory to write to, None uses <DATA_DIR>/spill
+        path (str): the file to write, from spill_path, None picks a new one in spill_dir
+
+    Returns:
+        str: path of the written file
+    """
+    path = path or spill_path(spill_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+    return path
+
+
+def fit(render, context: dict, payload: str, channel: str, policy: dict = None) -> list:
+    """
+    Keep a rendered webhook payload under its channel's size limit by shortening the card's `text`. Payloads under
+    the limit are returned as is, measuring them is the only cost. Oversized ones are handled per the policy's
+    `oversize` action:
+        truncate: the text is cut to fit and the full text is written to a spill file referenced from the card
+        split: the text is sent as several cards titled "<title> (i/n)"
+        reject: PayloadTooLarge is raised before anything is sent
+
+    Args:
+        render (callable): render(context) returning the payload dict for a context
+        context (dict): the card context the payload was rendered from
+        payload (str): the rendered payload, JSON
+        channel (str): the resolved channel name, for per channel limits
+        policy (dict): the webhook payload_limit section, may be None
+
+    Returns:
+        list: the payloads to send in order, JSON strings
+
+    Raises:
+        PayloadTooLarge: if the payload is too large even without text, or the action is reject
+    """
+    policy = policy or {}
+    limit = max_bytes(policy, channel)
+    size = encoded_size(payload)
+    if not limit or size <= limit:
+        return [payload]
+
+    action = policy.get("oversize", "truncate")
+    if action not in OVERSIZE_ACTIONS:
+        raise ValueError(f"Unknown oversize action {action}, use one of {', '.join(OVERSIZE_ACTIONS)}")
+    text = context.get("text", "")
+    text = text if isinstance(text, str) else str(text)
+    if action == "reject" or not text:
+        raise PayloadTooLarge(f"Payload of {size} bytes is over the {limit} byte limit of channel {channel}")
+    title = context.get("title", "")
+    budget = _budget(render, {**context, "title": f"{title} (99/99)"} if action == "split" else context, limit)
+    if budget <= 0:
+        raise PayloadTooLarge(f"Payload of {size} bytes is over the {limit} byte limit of channel {channel}")
+
+    if action == "truncate":
+        path = ref = spill_path(policy.get("spill_dir"))
+        if policy.get("spill_url"):
+            ref = f"{policy['spill_url'].rstrip('/')}/{os.path.basename(path)}"
+        note = TRUNCATED_NOTE.format(size=encoded_size(text), ref=ref)
+        kept = text[: _cut(text, budget - _escaped_size(note))]
+        payloads = [json.dumps(render({**context, "text": kept + note}))]
+    else:
+        parts = []
+        while text:
+            end = _cut(text, budget)
+            if end == 0:
+                raise PayloadTooLarge(f"Payload of {size} bytes cannot be split under the {limit} byte limit of channel {channel}")
+            parts.append(text[:end])
+            text = text[end:]
+        payloads = [
+            json.dumps(render({**context, "title": f"{title} ({i}/{len(parts)})", "text": part}))
+            for i, part in enumerate(parts, 1)
+        ]
+        logger.warning(f"Split a {size} byte payload for channel {channel} into {len(payloads)} cards")
+
+    for part in payloads:
+        if encoded_size(part) > limit:
+            raise PayloadTooLarge(f"Payload of {size} bytes cannot be fitted under the {limit} byte limit of channel {channel}")
+    if action == "truncate":
+        # Written only once the card is known to fit, a rejected card leaves no file behind
+        spill(text, path=path)
+        logger.warning(f"Truncated a {size} byte payload for channel {channel}, full text in {ref}")
+    return payloads
@@ -0,0 +1,346 @@
+import concurrent.futures
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+from fastcore.script import call_parse
+
+from . import core, deadletter, limits, metrics
+from .core import logger, settings
+
+SUFFIX = ".json"
+TMP_PREFIX = "."  # files still being written, never picked up by the drainer
+CLAIMED_SUFFIX = ".sending"  # files a drainer is delivering, renamed back to SUFFIX if it died while sending
+
+
+def spool_dir(spool: dict = None) -> str:
+    """
+    Args:
+        spool (dict): the config["pingme"]["options"]["spool"] section, may be None
+
+    Returns:
+        str: the configured spool directory, or <DATA_DIR>/spool
+    """
+    return (spool or {}).get("directory") or os.path.join(settings.data_dir, "spool")
+
+
+def _write_tmp(directory: str, name: str, entry: dict) -> str:
+    # Write the entry under a hidden temporary name, returns its path
+    tmp = os.path.join(directory, TMP_PREFIX + name)
+    data = json.dumps(entry).encode()
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileNotFoundError:
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+    return tmp
+
+
+def _name(due: float = None) -> str:
+    # Names sort in spool order: the nanosecond time the entry is due, then a random part for entries due in the same
+    # nanosecond
+    due_ns = time.time_ns() if due is None else int(due * 1e9)
+    return f"{due_ns:020d}-{uuid.uuid4().hex[:12]}{SUFFIX}"
+
+
+def _due_ns(name: str) -> int:
+    try:
+        return int(name.partition("-")[0])
+    except ValueError:
+        return 0
+
+
+def write(directory: str, entry: dict) -> str:
+    """
+    Atomically add an entry to the spool: the file is written under a hidden temporary name and renamed into place,
+    so the drainer only ever sees complete files. No network and no fsync, this is a local write of a few KB.
+
+    Args:
+        directory (str): the spool directory, created if missing
+        entry (dict): the spool entry, see PingMe.send_spool
+
+    Returns:
+        str: path of the spooled file
+    """
+    name = _name()
+    path = os.path.join(directory, name)
+    os.replace(_write_tmp(directory, name, entry), path)
+    return path
+
+
+def requeue(path: str, entry: dict, due: float) -> str:
+    """
+    Replace a spool file with an updated entry that is not due before a later time. The file is renamed to sort by
+    its new due time, so entries backing off do not hold up newer ones.
+
+    Args:
+        path (str): the spool file
+        entry (dict): the updated entry
+        due (float): unix time of the next attempt
+
+    Returns:
+        str: the new path of the file
+    """
+    directory = os.path.dirname(path)
+    name = _name(due)
+    # Update in place first, then rename: a crash in between leaves the updated entry under its old name
+    os.replace(_write_tmp(directory, name, entry), path)
+    new_path = os.path.join(directory, name)
+    os.rename(path, new_path)
+    return new_path
+
+
+def pending(directory: str, limit: int = None, due: bool = False) -> list:
+    """
+    Args:
+        directory (str): the spool directory
+        limit (int): at most this many files
+        due (bool): only files whose next attempt is due now
+
+    Returns:
+        list: paths of complete spool files, oldest first
+    """
+    try:
+        names = sorted(
+            entry.name for entry in os.scandir(directory) if entry.name.endswith(SUFFIX) and not entry.name.startswith(TMP_PREFIX)
+        )
+    except FileNotFoundError:
+        return []
+    if due:
+        now_ns = time.time_ns()
+        names = [name for name in names if _due_ns(name) <= now_ns]
+    return [os.path.join(directory, name) for name in names[:limit]]
+
+
+def claim(path: str):
+    """
+    Take a spool file for delivery by renaming it, only one of several drainers sharing a directory can succeed
+
+    Args:
+        path (str): a spool file from pending()
+
+    Returns:
+        str: the claimed file's path, None if another drainer took the file first
+    """
+    claimed = path[: -len(SUFFIX)] + CLAIMED_SUFFIX
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    os.utime(claimed)  # the claim's age, see recover()
+    return claimed
+
+
+def recover(directory: str, lease: float) -> int:
+    """
+    Return files claimed more than lease seconds ago to the spool, their drainer died while sending them
+
+    Args:
+        directory (str): the spool directory
+        lease (float): seconds a drainer may take to deliver a claimed file
+
+    Returns:
+        int: number of files returned
+    """
+    recovered = 0
+    expired = time.time() - lease
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(CLAIMED_SUFFIX)]
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < expired:
+                os.rename(entry.path, entry.path[: -len(CLAIMED_SUFFIX)] + SUFFIX)
+                recovered += 1
+        except FileNotFoundError:
+            pass  # delivered or recovered by another drainer meanwhile
+    return recovered
+
+
+def _retryable(status_code: int) -> bool:
+    # Server errors, throttling and timeouts are worth another try, other client errors will not get better
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class Drainer:
+    """
+    Sends spooled webhook payloads in batches over the pooled HTTP session and removes the files once delivered.
+    Entries that fail with a retryable error stay in the spool for the next pass, other failures are moved to the
+    dead-letter store. The directory is polled, an empty spool costs one scandir per interval.
+
+    Each entry is sent under the in-flight limits of the config file it was spooled with, and is dead-lettered with
+    that config file so a replay uses the same tenant.
+
+    Several drainers may share a directory: a file is claimed by renaming it before it is sent, so it is sent by one
+    of them only. Files claimed by a drainer that died are returned to the spool after `lease` seconds.
+
+    An entry that is kept records its attempts and the URLs that are done in the file. It is renamed to sort by its
+    next attempt, which backs off exponentially, so it is skipped until then instead of blocking newer entries, and
+    the next attempt only goes to the URLs that failed.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        batch: int = 64,
+        concurrency: int = 8,
+        interval: float = 1.0,
+        post=None,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        lease: float = 600.0,
+    ):
+        """
+        Args:
+            directory (str): the spool directory
+            batch (int): files picked up per pass
+            concurrency (int): sends in flight at once
+            interval (float): seconds between passes when nothing was sent
+            post (callable): post(url, data, headers) returning a response, defaults to the pooled session with
+                the webhook default timeouts
+            backoff (float): seconds before the first retry of a kept entry, doubled on every further attempt
+            max_backoff (float): upper bound of the seconds between attempts
+            lease (float): seconds after which a file claimed but not finished is sent again
+        """
+        from .pingme_class import DEFAULT_TIMEOUT, http_session
+
+        self.directory = directory
+        self.batch = batch
+        self.concurrency = concurrency
+        self.interval = interval
+        self.post = post or functools.partial(http_session.post, timeout=DEFAULT_TIMEOUT)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self._recovered_at = 0.0
+        self._stop = threading.Event()
+
+    def _send(self, path: str) -> bool:
+        # Returns True when the file was handled (delivered or dead-lettered) and removed
+        path = claim(path)
+        if path is None:
+            return True  # another drainer took it
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except ValueError:
+            logger.error(f"Removing unreadable spool file {path}")
+            os.remove(path)
+            return True
+
+        card, channel = entry["card"], entry.get("channel") or "default"
+        # Entries spooled before the config file was recorded use the default config
+        config_file = entry.get("config_file") or settings.config_file
+        done = set(entry.get("done") or [])  # URLs delivered or dead-lettered in earlier attempts
+        retry, failed = [], []  # (url, error, status_code) to try again and to dead-letter
+        try:
+            with limits.limiter_for(config_file).slot(channel, card.get("priority", "normal")):
+                for url in entry["urls"]:
+                    if url in done:
+                        continue
+                    try:
+                        response = self.post(url, data=entry["payload"], headers={"Content-Type": "application/json"})
+                    except Exception as e:
+                        metrics.record_send(card["name"], channel, "spool", success=False)
+                        retry.append((url, repr(e), None))
+                        continue
+                    metrics.record_send(card["name"], channel, "spool", success=response.status_code < 400)
+                    if response.status_code < 300:
+                        done.add(url)
+                    elif _retryable(response.status_code):
+                        retry.append((url, response.text[:2000], response.status_code))
+                    else:
+                        failed.append((url, response.text[:2000], response.status_code))
+        except limits.Overloaded as e:
+            metrics.record_suppression(card["name"], channel, "spool", "overloaded")
+            retry = [(url, repr(e), None) for url in entry["urls"] if url not in done]
+
+        if failed:
+            from .pingme_class import Card
+
+            _, error, status_code = failed[-1]
+            # Only the failed URLs of this part are replayed, unless the card was a single part that failed entirely
+            targets = [{"url": url, "part": entry.get("part", 0)} for url, _, _ in failed]
+            if len(failed) == len(entry["urls"]) and entry.get("parts", 1) == 1:
+                targets = None
+            deadletter.record(Card.model_validate(card), "webhook", entry.get("channel"), config_file, error, status_code, targets)
+            done.update(url for url, _, _ in failed)
+        if retry:
+            attempts = entry.get("attempts", 0) + 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+            requeue(path, {**entry, "done": sorted(done), "attempts": attempts}, time.time() + delay)
+            logger.warning(
+                f"Spooled card {card['name']} not delivered to {len(retry)} URLs, retrying in {delay:g}s "
+                f"(attempt {attempts}): {retry[-1][1]}"
+            )
+            return False
+        os.remove(path)
+        return True
+
+    def drain_once(self) -> dict:
+        """
+        Send one batch
+
+        Returns:
+            dict: counts of sent (handled) and kept (to retry) files
+        """
+        if time.monotonic() - self._recovered_at > self.lease / 2:
+            self._recovered_at = time.monotonic()
+            recover(self.directory, self.lease)
+        paths = pending(self.directory, self.batch, due=True)
+        if not paths:
+            return {"sent": 0, "kept": 0}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.concurrency, len(paths)), thread_name_prefix="pingme-drain") as pool:
+            handled = list(pool.map(self._send, paths))
+        return {"sent": sum(handled), "kept": len(handled) - sum(handled)}
+
+    def run(self) -> None:
+        """Drain until stop() is called"""
+        while not self._stop.is_set():
+            # Kept entries wait for their next attempt on their own, only an idle pass sleeps
+            if not self.drain_once()["sent"]:
+                self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+@call_parse
+def cli(
+    config_file: str = None,  # Config file whose spool directory is drained, defaults to the default config
+    directory: str = None,  # Spool directory, overrides the config's spool.directory
+    once: bool = False,  # Drain what is spooled now and exit instead of watching the directory
+    batch: int = 64,  # Files picked up per pass
+    concurrency: int = 8,  # Sends in flight at once
+    interval: float = 1.0,  # Seconds between polls of an empty spool
+):
+    """
+    Send notifications spooled with `pingme --spool` (PingMe.send_spool) and remove them once delivered. Run it on a host
+    with reliable outbound connectivity that shares the spool directory, or next to the producer. Several drainers
+    can share a directory.
+    """
+    if directory is None:
+        config = core.get_config(settings.config_file if config_file is None else config_file)
+        directory = spool_dir(config["pingme"]["options"].get("spool"))
+    drainer = Drainer(directory, batch=batch, concurrency=concurrency, interval=interval)
+    if once:
+        total = {"sent": 0, "kept": 0}
+        while True:
+            counts = drainer.drain_once()
+            total = {k: total[k] + counts[k] for k in total}
+            if not counts["sent"]:
+                break
+        print(f"Sent {total['sent']} spooled notifications, {total['kept']} kept for retry")
+        return
+    try:
+        drainer.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,225 @@
+import abc
+import http.server  # stub webhook endpoint
+import os
+import random
+import shutil
+import socketserver  # stub SMTP relay
+import ssl
+import subprocess
+import threading
+import time
+
+
+class _StubServer(abc.ABC):
+    """
+    Shared start/stop plumbing for the local stub servers, each one runs in a daemon thread on an ephemeral port
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.requests: int = 0  # number of requests/messages received
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _make_server(self):
+        """Returns the socketserver to run, with its stub attribute set to self"""
+
+    def _count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        """Start serving in a background thread, returns self so it can be chained"""
+        self._server = self._make_server()
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and release the port"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class _WebhookHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive so pooled clients can reuse connections
+
+    def do_POST(self):
+        stub = self.server.stub
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        stub._count()
+        if stub.latency:
+            time.sleep(stub.latency)
+        roll = random.random()
+        if roll < stub.throttle_rate:
+            status, body = 429, b'{"error": "Too Many Requests"}'
+        elif roll < stub.throttle_rate + stub.error_rate:
+            status, body = 500, b'{"error": "Internal Server Error"}'
+        else:
+            status, body = 200, b'{"success": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", str(stub.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark and test output clean
+
+
+class StubWebhookServer(_StubServer):
+    """
+    Minimal local HTTP server that accepts webhook POSTs and answers 200 with a small JSON body, used for benchmarks and load tests.
+    Latency, a 500 error rate and a 429 throttle rate (with Retry-After) can be configured to mimic a slow or overloaded endpoint.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+    ):
+        """
+        Args:
+            host (str): Host to bind to
+            port (int): Port to bind to, 0 picks a free port
+            latency (float): Seconds to wait before answering each request
+            error_rate (float): Fraction of requests answered with 500
+            throttle_rate (float): Fraction of requests answered with 429
+            retry_after (int): Retry-After value in seconds sent with 429 responses
+        """
+        super().__init__(host, port)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/webhook"
+
+    def _make_server(self):
+        server = http.server.ThreadingHTTPServer((self.host, self.port), _WebhookHandler)
+        server.stub = self
+        return server
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def _starttls(self) -> None:
+        self.connection = self.server.stub.ssl_context.wrap_socket(self.connection, server_side=True)
+        self.rfile = self.connection.makefile("rb")
+        self.wfile = self.connection.makefile("wb", buffering=0)
+
+    def handle(self):
+        stub = self.server.stub
+        tls_active = False
+        self._reply("220 pingme stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                self._reply("250-pingme stub")
+                if stub.ssl_context is not None and not tls_active:
+                    self._reply("250-STARTTLS")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif verb == b"STAR" and stub.ssl_context is not None:
+                self._reply("220 Ready to start TLS")
+                self._starttls()
+                tls_active = True
+            elif verb == b"DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                stub._count()
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self._reply("250 OK queued")
+            elif verb == b"AUTH":
+                self._reply("235 Authentication successful")
+            elif verb == b"QUIT":
+                self._reply("221 Bye")
+                return
+            elif verb in (b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                self._reply("250 OK")
+            else:
+                self._reply("502 Command not implemented")
+
+
+class StubSMTPServer(_StubServer):
+    """
+    Minimal local SMTP relay that accepts and discards messages, STARTTLS is only advertised when an ssl_context is given
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ssl_context: ssl.SSLContext = None,
+        latency: float = 0.0,
+    ):
+        """
+        Args:
+            host (str): Host to bind to
+            port (int): Port to bind to, 0 picks a free port
+            ssl_context (ssl.SSLContext): Server side TLS context, enables STARTTLS
+            latency (float): Seconds to wait before accepting each message
+        """
+        super().__init__(host, port)
+        self.ssl_context = ssl_context
+        self.latency = latency
+
+    def _make_server(self):
+        server = socketserver.ThreadingTCPServer((self.host, self.port), _SMTPHandler)
+        server.stub = self
+        return server
+
+
+def self_signed_context(directory: str) -> ssl.SSLContext:
+    """
+    Create a throwaway self-signed certificate with the openssl CLI and return a server side TLS context for StubSMTPServer,
+    needed because send_to_email always issues STARTTLS
+
+    Args:
+        directory (str): Directory to write cert.pem and key.pem to
+
+    Returns:
+        ssl.SSLContext: the server context, or None if openssl is not available
+    """
+    if shutil.which("openssl") is None:
+        return None
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True,
+        capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
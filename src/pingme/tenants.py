@@ -0,0 +1,97 @@
+import contextlib
+import contextvars  # per-request tenant, propagated into the threadpool running sync endpoints
+
+from starlette.responses import JSONResponse
+
+from .core import settings
+
+TENANT_HEADER = b"x-pingme-tenant"
+PATH_PREFIX = "/tenant/"
+
+_active_config_file = contextvars.ContextVar("pingme_active_config_file", default=None)
+
+
+class UnknownTenant(KeyError):
+    """Raised when a tenant is not registered in settings.tenants"""
+
+
+def config_file_for(tenant: str) -> str:
+    """
+    Args:
+        tenant (str): tenant name
+
+    Returns:
+        str: the config file registered for the tenant
+
+    Raises:
+        UnknownTenant: if the tenant is not registered
+    """
+    try:
+        return settings.tenants[tenant]
+    except KeyError:
+        raise UnknownTenant(f"Tenant {tenant} is not registered") from None
+
+
+def active_config_file() -> str:
+    """
+    Returns:
+        str: the config file of the tenant selected for the current request, or settings.config_file
+    """
+    config_file = _active_config_file.get()
+    return settings.config_file if config_file is None else config_file
+
+
+@contextlib.contextmanager
+def use_tenant(tenant: str):
+    """
+    Select a tenant's config file for the enclosed block, e.g. for sending from Python code on behalf of a tenant
+
+    Args:
+        tenant (str): tenant name
+    """
+    token = _active_config_file.set(config_file_for(tenant))
+    try:
+        yield
+    finally:
+        _active_config_file.reset(token)
+
+
+class TenantMiddleware:
+    """
+    ASGI middleware selecting the tenant from the `/tenant/{name}/...` path prefix or the X-PingMe-Tenant header.
+    The prefix is stripped so every endpoint is available per tenant, unknown tenants get a 404.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tenant = None
+        path = scope["path"]
+        if path.startswith(PATH_PREFIX):
+            tenant, _, rest = path[len(PATH_PREFIX):].partition("/")
+            scope = dict(scope, path="/" + rest, raw_path=("/" + rest).encode())
+        else:
+            for name, value in scope["headers"]:
+                if name == TENANT_HEADER:
+                    tenant = value.decode("latin-1")
+                    break
+
+        if tenant is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            config_file = config_file_for(tenant)
+        except UnknownTenant as e:
+            await JSONResponse({"detail": e.args[0]}, status_code=404)(scope, receive, send)
+            return
+        token = _active_config_file.set(config_file)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _active_config_file.reset(token)
@@ -2,6 +2,17 @@
 import os
 import pytest
 from pathlib import Path
+from pingme import deadletter, idempotency
+from pingme.core import settings
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Keep local state such as dead letters out of the project output directory."""
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    yield str(tmp_path)
+    deadletter.close_store()
+    idempotency.close_store()
 
 
 @pytest.fixture
@@ -0,0 +1,135 @@
+"""Unit tests for adaptive per-host webhook concurrency."""
+import socket
+import time
+import pytest
+import requests
+from unittest.mock import patch
+from pingme import adaptive
+from pingme.adaptive import AIMDLimiter
+from pingme.limits import Overloaded
+from pingme.pingme_class import Card, PingMe
+
+
+def send(limiter, status_code=200, delay=0.0):
+    with limiter.slot() as slot:
+        time.sleep(delay)
+        slot.status_code = status_code
+
+
+class TestAIMDLimiter:
+    """Tests for AIMDLimiter."""
+
+    def test_grows_additively_when_healthy(self):
+        """Test a full window of healthy responses raises the limit by about one."""
+        limiter = AIMDLimiter(initial=4, name="grow")
+        for _ in range(4):
+            send(limiter)
+
+        assert 4.9 < limiter.limit < 5.0
+
+    def test_never_exceeds_max(self):
+        """Test the limit is capped at max_limit."""
+        limiter = AIMDLimiter(initial=2, max_limit=3, name="cap")
+        for _ in range(100):
+            send(limiter)
+
+        assert limiter.limit == 3
+
+    def test_throttling_halves_once_per_round_trip(self):
+        """Test a burst of 429s within one round trip cuts the limit once."""
+        limiter = AIMDLimiter(initial=16, name="throttle")
+        send(limiter, delay=0.05)  # learn a round trip time
+        limit = limiter.limit
+        for _ in range(5):
+            send(limiter, 429)
+
+        assert limiter.limit == pytest.approx(limit / 2)
+
+    def test_timeout_cuts_limit(self):
+        """Test a timeout counts as an overload signal."""
+        limiter = AIMDLimiter(initial=8, name="timeout")
+        with pytest.raises(requests.Timeout):
+            with limiter.slot():
+                raise requests.Timeout()
+
+        assert limiter.limit == 4
+        assert limiter.in_flight == 0
+
+    def test_latency_spike_cuts_limit(self):
+        """Test round trips well above the long-term average cut the limit."""
+        limiter = AIMDLimiter(initial=8, latency_tolerance=2.0, name="spike")
+        for _ in range(10):
+            send(limiter, delay=0.001)
+        before = limiter.limit
+        for _ in range(5):
+            send(limiter, delay=0.05)
+
+        assert limiter.limit < before
+
+    def test_waits_then_refuses_at_limit(self):
+        """Test a send over the limit waits and then raises Overloaded (503)."""
+        limiter = AIMDLimiter(initial=1, queue_timeout=0.01, name="full")
+        with limiter.slot():
+            with pytest.raises(Overloaded) as excinfo:
+                with limiter.slot():
+                    pass
+
+        assert excinfo.value.status_code == 503
+
+    def test_snapshot(self):
+        """Test the snapshot exposes the limit and round trip times."""
+        limiter = AIMDLimiter(initial=4, name="snapshot")
+        send(limiter, delay=0.01)
+        snapshot = limiter.snapshot()
+
+        assert snapshot["in_flight"] == 0
+        assert snapshot["limit"] > 4
+        assert snapshot["rtt_ms"] >= 10
+
+
+class TestHostLimiters:
+    """Tests for the per-host limiters used by send_to_webhook."""
+
+    def test_shared_per_host(self):
+        """Test URLs on the same host share a limiter."""
+        assert adaptive.limiter_for("https://hooks.example.org/a") is adaptive.limiter_for("https://HOOKS.example.org/b")
+        assert adaptive.limiter_for("https://hooks.example.org/a") is not adaptive.limiter_for("https://other.example.org/a")
+
+    def test_hung_receiver_times_out_and_cuts_limit(self):
+        """Test a receiver that never answers times out, frees its slot and cuts its host's limit."""
+        from pingme.pingme_class import send_to_webhook
+
+        listener = socket.create_server(("127.0.0.1", 0))  # accepts connections, never answers
+        url = f"http://127.0.0.1:{listener.getsockname()[1]}/hook"
+        limiter = adaptive.limiter_for(url)
+        before = limiter.limit
+        try:
+            with pytest.raises(Exception, match="timed out"):
+                send_to_webhook(url, "{}", timeout=(1.0, 0.1))
+        finally:
+            listener.close()
+
+        assert limiter.limit == pytest.approx(before / 2)
+        assert limiter.in_flight == 0
+
+    def test_send_webhook_uses_configured_timeout(self, mock_card_data, mock_webhook_response):
+        """Test the webhook timeout section reaches the HTTP request."""
+        notification = PingMe(Card(**mock_card_data))
+        notification.webhook = {**notification.webhook, "timeout": {"connect": 2, "read": 7}}
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            notification.send_webhook()
+
+        assert post.call_args.kwargs["timeout"] == (2.0, 7.0)
+
+    def test_send_to_webhook_reports_status(self, mock_webhook_response):
+        """Test send_to_webhook goes through the host's limiter."""
+        from pingme.pingme_class import send_to_webhook
+
+        limiter = adaptive.limiter_for("http://adaptive-test.local/hook")
+        before = limiter.limit
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response):
+            send_to_webhook("http://adaptive-test.local/hook", "{}")
+
+        assert limiter.limit > before
+        assert "adaptive-test.local" in adaptive.snapshot()
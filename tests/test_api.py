@@ -4,6 +4,8 @@ from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 from pingme.api import app
 from pingme.pingme_class import Card
+from pingme.limits import Overloaded
+from pingme.channels import UnknownChannel
 
 
 client = TestClient(app)
@@ -36,6 +38,26 @@ class TestWebhookEndpoints:
         assert response.status_code == 500
         assert "Connection error" in response.json()["detail"]
     
+    @patch('pingme.services.NotificationService.send_default_card_to_webhook')
+    def test_webhook_card_default_overloaded(self, mock_send):
+        """Test overload is reported as 429 with Retry-After."""
+        mock_send.side_effect = Overloaded("Too many in-flight sends", retry_after=5)
+        
+        response = client.post("/webhook/default")
+        
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "5"
+    
+    @patch('pingme.services.NotificationService.send_default_card_to_webhook')
+    def test_webhook_card_default_unknown_channel(self, mock_send):
+        """Test unknown channels are reported as 404."""
+        mock_send.side_effect = UnknownChannel("Webhook channel nope is not configured")
+        
+        response = client.post("/webhook/default", params={"channel": "nope"})
+        
+        assert response.status_code == 404
+        assert "nope" in response.json()["detail"]
+    
     @patch('pingme.services.NotificationService.send_simple_card_to_webhook')
     def test_webhook_card_simple_success(self, mock_send):
         """Test simple webhook endpoint with parameters."""
@@ -0,0 +1,111 @@
+"""Unit tests for the webhook channel routing table."""
+import pytest
+from unittest.mock import patch, MagicMock
+from pingme.channels import ChannelTable, UnknownChannel, table_for
+from pingme.pingme_class import Card, PingMe, WebhookSendError
+from pingme.services import parse_webhook_response
+
+
+@pytest.fixture
+def table():
+    """A table with channels, an alias, a group and a pattern."""
+    return ChannelTable(
+        {"default": "https://example.com/default", "ops": "https://example.com/ops"},
+        aliases={"alerts": "ops", "pager": "oncall"},
+        groups={"oncall": ["default", "alerts", "https://example.com/extra"]},
+        patterns={"lab-*": "ops"},
+    )
+
+
+class TestChannelTable:
+    """Tests for ChannelTable."""
+
+    def test_none_is_default(self, table):
+        """Test no channel resolves to the default channel."""
+        assert table.resolve(None) == ("default", ("https://example.com/default",))
+
+    def test_case_insensitive(self, table):
+        """Test channel names are case-insensitive."""
+        assert table.resolve("OPS") == ("ops", ("https://example.com/ops",))
+
+    def test_alias(self, table):
+        """Test an alias resolves to its channel."""
+        assert table.resolve("alerts") == ("ops", ("https://example.com/ops",))
+
+    def test_group_and_alias_to_group(self, table):
+        """Test a group resolves to all member URLs, also through an alias."""
+        urls = ("https://example.com/default", "https://example.com/ops", "https://example.com/extra")
+
+        assert table.resolve("oncall") == ("oncall", urls)
+        assert table.resolve("pager") == ("oncall", urls)
+
+    def test_pattern_is_memoised(self, table):
+        """Test pattern matches resolve to the target and are remembered."""
+        assert table.resolve("lab-kma") == ("ops", ("https://example.com/ops",))
+        assert "lab-kma" in table._memo
+
+    def test_unknown_channel_raises(self, table):
+        """Test unknown channels raise without a fallback."""
+        with pytest.raises(UnknownChannel, match="nope"):
+            table.resolve("nope")
+
+    def test_fallback(self):
+        """Test unknown channels use the fallback when configured."""
+        table = ChannelTable({"default": "https://example.com/default"}, fallback="default")
+
+        assert table.resolve("nope") == ("default", ("https://example.com/default",))
+
+    def test_alias_to_unknown_channel_fails_at_compile(self):
+        """Test misconfigured aliases fail when the table is compiled."""
+        with pytest.raises(ValueError, match="unknown channel"):
+            ChannelTable({"default": "https://example.com"}, aliases={"alerts": "missing"})
+
+    def test_alias_cycle_fails_at_compile(self):
+        """Test alias cycles are detected."""
+        with pytest.raises(ValueError, match="cycle"):
+            ChannelTable({"default": "https://example.com"}, aliases={"a": "b", "b": "a"})
+
+    def test_table_for_compiles_once(self):
+        """Test table_for stores the compiled table in the webhook section."""
+        webhook = {"channels": {"default": "https://example.com"}}
+
+        assert table_for(webhook) is table_for(webhook)
+
+
+class TestGroupSend:
+    """Tests for sending to a channel group."""
+
+    @patch('pingme.pingme_class.send_to_webhook')
+    def test_group_send_posts_to_every_url(self, mock_send):
+        """Test a group send posts once per URL and parses to the worst status."""
+        mock_send.side_effect = [
+            MagicMock(status_code=200, json=MagicMock(return_value={})),
+            MagicMock(status_code=502, json=MagicMock(return_value={})),
+        ]
+        notification = PingMe(Card(name="default", context={"title": "t", "text": "t"}))
+        notification.webhook = {"channels": {"a": "https://example.com/a", "b": "https://example.com/b"},
+                                "groups": {"both": ["a", "b"]}}
+
+        result = parse_webhook_response(notification.send_webhook(channel="both"))
+
+        assert mock_send.call_count == 2
+        assert result["status_code"] == 502
+        assert len(result["response"]) == 2
+
+    @patch('pingme.pingme_class.send_to_webhook')
+    def test_group_send_continues_after_a_failing_url(self, mock_send):
+        """Test a URL that raises does not keep the card from the other URLs of the group."""
+        mock_send.side_effect = [
+            Exception("Error sending message to webhook: timeout"),
+            MagicMock(status_code=200, json=MagicMock(return_value={})),
+        ]
+        notification = PingMe(Card(name="default", context={"title": "t", "text": "t"}))
+        notification.webhook = {"channels": {"a": "https://example.com/a", "b": "https://example.com/b"},
+                                "groups": {"both": ["a", "b"]}}
+
+        with pytest.raises(WebhookSendError) as excinfo:
+            notification.send_webhook(channel="both")
+
+        assert mock_send.call_count == 2
+        assert [(url, part) for url, part, _ in excinfo.value.errors] == [("https://example.com/a", 0)]
+        assert len(excinfo.value.responses) == 1
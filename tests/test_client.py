@@ -0,0 +1,164 @@
+"""Unit tests for the PingMe client library and the /bulk endpoint."""
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from pingme.api import app
+from pingme.client import AsyncPingMeClient, PingMeClient
+from pingme.services import Notification, NotificationService
+
+
+@pytest.fixture
+def api():
+    return TestClient(app)
+
+
+@pytest.fixture
+def requests_seen():
+    """Bulk requests that reached the service, as lists of notifications."""
+    return []
+
+
+@pytest.fixture
+def service_transport(api, requests_seen):
+    """An httpx transport forwarding to the API in-process."""
+    def handler(request):
+        requests_seen.append(request)
+        response = api.post(request.url.path, content=request.content, headers={"Content-Type": "application/json"})
+        return httpx.Response(response.status_code, headers=response.headers, content=response.content)
+    return httpx.MockTransport(handler)
+
+
+class TestBulkEndpoint:
+    """Tests for /bulk."""
+
+    def test_bulk_sends_each_notification(self, api, mock_webhook_response):
+        """Test every notification is sent and results keep their order."""
+        notifications = [
+            {"card": {"name": "default", "context": {"title": "a", "text": "a"}}, "id": "1"},
+            {"card": {"name": "default", "context": {"title": "b", "text": "b"}}, "channel": "nope", "id": "2"},
+        ]
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            response = api.post("/bulk", json=notifications)
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["id"] for r in results] == ["1", "2"]
+        assert results[0]["status_code"] == 200
+        assert results[1]["status_code"] == 404
+        post.assert_called_once()
+
+    def test_retried_id_is_not_sent_twice(self, mock_webhook_response):
+        """Test a notification with an id that was already sent returns the earlier result."""
+        notification = Notification(card={"name": "default", "context": {"title": "a", "text": "a"}}, id="retry-me")
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            first = NotificationService.send_notification(notification)
+            second = NotificationService.send_notification(notification)
+
+        post.assert_called_once()
+        assert second["status_code"] == first["status_code"]
+        assert second["duplicate"] is True
+
+
+class TestPingMeClient:
+    """Tests for PingMeClient."""
+
+    def test_batches_by_size(self, service_transport, requests_seen, mock_webhook_response):
+        """Test buffered notifications are sent in batches of batch_size."""
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response):
+            with PingMeClient(batch_size=2, flush_interval=3600, transport=service_transport) as client:
+                futures = [client.send("default", {"title": f"t{i}", "text": "x"}) for i in range(3)]
+                results = [f.result(timeout=5) for f in futures[:2]]
+            results.append(futures[2].result(timeout=5))
+
+        assert [r["status_code"] for r in results] == [200, 200, 200]
+        assert len(requests_seen) == 2
+
+    def test_retries_unavailable_service_with_same_ids(self, service_transport, requests_seen, mock_webhook_response):
+        """Test a 503 from the service is retried with the same notification ids."""
+        calls = []
+
+        def handler(request):
+            calls.append(request.content)
+            if len(calls) == 1:
+                return httpx.Response(503, headers={"Retry-After": "0"})
+            return service_transport.handle_request(request)
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response):
+            with PingMeClient(flush_interval=3600, backoff=0, transport=httpx.MockTransport(handler)) as client:
+                future = client.send("default", {"title": "t", "text": "x"})
+                client.flush()
+
+        assert future.result(timeout=5)["status_code"] == 200
+        assert calls[0] == calls[1]
+
+    def test_falls_back_to_in_process(self, mock_webhook_response):
+        """Test notifications are sent in-process when the service is unreachable."""
+        def handler(request):
+            raise httpx.ConnectError("refused")
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            with PingMeClient(retries=1, backoff=0, flush_interval=3600, transport=httpx.MockTransport(handler)) as client:
+                future = client.send({"name": "default", "context": {"title": "t", "text": "x"}})
+
+        assert future.result(timeout=5)["status_code"] == 200
+        post.assert_called_once()
+
+    def test_read_timeout_does_not_fall_back(self, mock_webhook_response):
+        """Test a timeout after the request was sent fails the futures instead of sending in-process as well."""
+        def handler(request):
+            raise httpx.ReadTimeout("slow")
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            with PingMeClient(retries=0, flush_interval=3600, transport=httpx.MockTransport(handler)) as client:
+                future = client.send("default", {"title": "t", "text": "x"})
+
+            with pytest.raises(httpx.ReadTimeout):
+                future.result(timeout=5)
+        post.assert_not_called()
+
+    def test_earlier_read_timeout_prevents_fallback(self, mock_webhook_response):
+        """Test a batch that may have reached the service is not sent in-process after later connect errors."""
+        errors = iter([httpx.ReadTimeout("slow"), httpx.ConnectError("refused")])
+
+        def handler(request):
+            raise next(errors)
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            with PingMeClient(retries=1, backoff=0, flush_interval=3600, transport=httpx.MockTransport(handler)) as client:
+                future = client.send("default", {"title": "t", "text": "x"})
+
+            with pytest.raises(httpx.ConnectError):
+                future.result(timeout=5)
+        post.assert_not_called()
+
+    def test_no_fallback_raises(self):
+        """Test without fallback an unreachable service fails the futures."""
+        def handler(request):
+            raise httpx.ConnectError("refused")
+
+        with PingMeClient(retries=0, fallback=False, flush_interval=3600, transport=httpx.MockTransport(handler)) as client:
+            future = client.send("default", {"title": "t", "text": "x"})
+
+        with pytest.raises(httpx.ConnectError):
+            future.result(timeout=5)
+
+
+class TestAsyncPingMeClient:
+    """Tests for AsyncPingMeClient."""
+
+    def test_send_and_flush(self, mock_webhook_response):
+        """Test the async client sends a batch through the service."""
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with AsyncPingMeClient(flush_interval=3600, transport=transport) as client:
+                futures = [await client.send("default", {"title": f"t{i}", "text": "x"}) for i in range(3)]
+                await client.flush()
+                return [await f for f in futures]
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            results = asyncio.run(run())
+
+        assert [r["status_code"] for r in results] == [200, 200, 200]
+        assert post.call_count == 3
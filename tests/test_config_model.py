@@ -0,0 +1,126 @@
+"""Unit tests for the validated config model."""
+import os
+import pydantic
+import pytest
+from unittest.mock import patch
+from pingme import core
+from pingme.config_model import CardConfig, EmailOptions, PingMeConfig, model_of
+from pingme.pingme_class import Card, PingMe
+
+
+@pytest.fixture
+def env_file(tmp_path):
+    """Write a config .env file and return its path."""
+    def write(**values):
+        path = tmp_path / "config.env"
+        path.write_text("".join(f"{k}={v}\n" for k, v in values.items()))
+        return str(path)
+    return write
+
+
+class TestCardConfig:
+    """Tests for CardConfig."""
+
+    def test_template_is_required(self):
+        """Test a card without a template is rejected."""
+        with pytest.raises(pydantic.ValidationError):
+            CardConfig(variables={"title": "t"}, template=None)
+
+    def test_email_template_parts_are_strings(self):
+        """Test an email_template needs string parts."""
+        with pytest.raises(pydantic.ValidationError):
+            CardConfig(template={}, email_template={"subject": ["not", "a", "string"]})
+        with pytest.raises(pydantic.ValidationError):
+            CardConfig(template={}, email_template={})
+
+    def test_for_context_applies_defaults(self):
+        """Test variables fill in missing context values without touching the shared card."""
+        card = CardConfig(variables={"title": "Default", "text": "Default text"}, template={"t": "${title}"})
+
+        resolved = card.for_context({"title": "Given"})
+
+        assert resolved["context"] == {"title": "Given", "text": "Default text"}
+        assert card.variables == {"title": "Default", "text": "Default text"}
+
+    def test_for_context_copies_template(self):
+        """Test each send gets its own template, changing it leaves the shared card as it was."""
+        card = CardConfig(template={"sections": [{"text": "${text}"}]})
+
+        first = card.for_context({})
+        first["template"]["sections"][0]["text"] = "changed"
+
+        assert card.for_context({})["template"] == {"sections": [{"text": "${text}"}]}
+
+    def test_frozen(self):
+        """Test the model cannot be modified after validation."""
+        card = CardConfig(template={})
+
+        with pytest.raises(pydantic.ValidationError):
+            card.template = {"other": True}
+
+
+class TestLoadedModel:
+    """Tests for the model compiled by core.load_config."""
+
+    def test_compiled_on_load(self):
+        """Test the default config carries a validated model."""
+        config = core.load_config("")
+        model = config["pingme"]["model"]
+
+        assert isinstance(model, PingMeConfig)
+        assert "default" in model.cards
+        assert model_of(config) is model
+
+    def test_nested_sections_are_frozen(self):
+        """Test the shared options and card sections cannot be changed through the model."""
+        model = core.load_config("")["pingme"]["model"]
+
+        with pytest.raises(TypeError):
+            model.options["webhook"]["channels"]["new"] = "https://example.com"
+        with pytest.raises(TypeError):
+            model.cards["default"].variables["title"] = "changed"
+
+    def test_smtp_port_is_an_int(self, env_file):
+        """Test the SMTP port read from the environment is validated into a number."""
+        config = core.load_config(env_file(
+            PINGME_EMAIL_FROM="a@example.org", PINGME_EMAIL_TO="b@example.org",
+            PINGME_EMAIL_SMTP_HOST="smtp.example.org", PINGME_EMAIL_SMTP_PORT="2525",
+        ))
+
+        assert config["pingme"]["model"].email.smtp.port == 2525
+
+    def test_invalid_port_fails_on_load(self, env_file):
+        """Test an SMTP port that is not a number fails when the config is loaded."""
+        with pytest.raises(pydantic.ValidationError):
+            core.load_config(env_file(PINGME_EMAIL_SMTP_PORT="twenty-five"))
+
+    def test_host_without_addresses_fails_on_load(self):
+        """Test an SMTP host without from/to addresses is rejected."""
+        with pytest.raises(pydantic.ValidationError):
+            EmailOptions(smtp={"host": "smtp.example.org", "port": 25})
+
+    def test_hand_built_config_gets_channel_table(self, tmp_path, mock_card_data):
+        """Test a config assembled by hand can send, its frozen webhook section carries a compiled channel table."""
+        config = {
+            "pingme": {
+                "cards": {"default": {"template": {"text": "${text}"}}},
+                "options": {
+                    "webhook": {"channels": {"default": "http://hook"}},
+                    "email": {},
+                    "logfile": {},
+                    "spool": {"directory": str(tmp_path)},
+                },
+            }
+        }
+
+        with patch('pingme.pingme_class.core.get_config', return_value=config):
+            path = PingMe(Card(**mock_card_data)).send_spool()
+
+        assert os.path.dirname(path) == str(tmp_path)
+        assert "table" not in config["pingme"]["options"]["webhook"]
+
+    def test_unresolved_variables_are_reported(self):
+        """Test options still holding a ${VARIABLE} are listed."""
+        config = {"pingme": {"cards": {}, "options": {"logfile": {"path": "${UNSET_PATH}"}, "email": {}}}}
+
+        assert model_of(config).unresolved == ("logfile.path",)
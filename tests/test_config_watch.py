@@ -0,0 +1,114 @@
+"""Unit tests for config hot reloading."""
+import os
+import time
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from pingme import config_watch, core
+from pingme.api import app
+
+
+@pytest.fixture
+def env_file(tmp_path):
+    """Write a config .env file, bumping its mtime so every rewrite is seen as a change."""
+    path = tmp_path / "watched.env"
+
+    def write(**values):
+        path.write_text("".join(f"{k}={v}\n" for k, v in values.items()))
+        stamp = time.time_ns() + write.count * 1_000_000_000
+        write.count += 1
+        os.utime(path, ns=(stamp, stamp))
+        return str(path)
+
+    write.count = 1
+    yield write
+    core.clear_config_cache()
+
+
+class TestReloadChangedConfigs:
+    """Tests for core.reload_changed_configs."""
+
+    def test_swaps_changed_config(self, env_file):
+        """Test a changed file is rebuilt and swapped in while the old config stays intact."""
+        path = env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v1")
+        old = core.get_config(path)
+        generation = core.config_generation
+
+        env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v2")
+        assert path in core.reload_changed_configs()
+
+        assert core.get_config(path)["pingme"]["options"]["webhook"]["channels"]["ops"] == "http://ops.v2"
+        assert old["pingme"]["options"]["webhook"]["channels"]["ops"] == "http://ops.v1"
+        assert core.config_generation == generation + 1
+
+    def test_unchanged_config_is_kept(self, env_file):
+        """Test nothing is reloaded when no file changed."""
+        path = env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v1")
+        core.get_config(path)
+
+        assert path not in core.reload_changed_configs()
+
+    def test_broken_config_keeps_previous(self, env_file):
+        """Test a change that fails validation keeps the previous config serving."""
+        path = env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v1")
+        old = core.get_config(path)
+
+        env_file(PINGME_EMAIL_SMTP_PORT="not-a-port")
+        assert path not in core.reload_changed_configs()
+
+        core._cache_trusted = True
+        try:
+            assert core.get_config(path) is old
+        finally:
+            core._cache_trusted = False
+
+    def test_failing_check_does_not_stop_other_reloads(self, env_file, tmp_path):
+        """Test a config whose files cannot be checked is skipped and the other configs still reload."""
+        broken = tmp_path / "broken.env"
+        broken.write_text("PINGME_WEBHOOK_URL_OPS=http://broken\n")
+        core.get_config(str(broken))
+        path = env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v1")
+        core.get_config(path)
+        env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v2")
+        stamp = core._config_stamp
+
+        def failing_stamp(config_path):
+            if config_path == str(broken):
+                raise RuntimeError("cannot stat")
+            return stamp(config_path)
+
+        with patch("pingme.core._config_stamp", side_effect=failing_stamp):
+            assert core.reload_changed_configs() == [path]
+
+
+class TestConfigWatcher:
+    """Tests for the background watcher."""
+
+    def test_reloads_in_background(self, env_file):
+        """Test the watcher swaps in a changed config without a request triggering it."""
+        path = env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v1")
+        core.get_config(path)
+        watcher = config_watch.ConfigWatcher(interval=0.02).start()
+        try:
+            env_file(PINGME_WEBHOOK_URL_OPS="http://ops.v2")
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if core.get_config(path)["pingme"]["options"]["webhook"]["channels"]["ops"] == "http://ops.v2":
+                    break
+                time.sleep(0.02)
+        finally:
+            watcher.stop()
+
+        assert core.get_config(path)["pingme"]["options"]["webhook"]["channels"]["ops"] == "http://ops.v2"
+        assert core._cache_trusted is False
+
+
+class TestHealth:
+    """Tests for /health."""
+
+    def test_reports_generation(self):
+        """Test /health answers with the config generation."""
+        response = TestClient(app).get("/health")
+
+        assert response.status_code == 200
+        assert response.json()["config_generation"] == core.config_generation
@@ -0,0 +1,153 @@
+"""Unit tests for config resolution and logging setup in core."""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import pytest
+from pingme import core
+
+
+@pytest.fixture
+def env_file(tmp_path):
+    """Write a config .env file and return a function to (re)write it."""
+    def write(name="a.env", **values):
+        path = tmp_path / name
+        path.write_text("".join(f"{k}={v}\n" for k, v in values.items()))
+        return str(path)
+    return write
+
+
+class TestGetConfig:
+    """Tests for get_config."""
+
+    def test_does_not_modify_environ(self, env_file, monkeypatch):
+        """Test loading a config does not leak its values into os.environ."""
+        monkeypatch.delenv("PINGME_WEBHOOK_URL_LEAK", raising=False)
+        path = env_file(PINGME_WEBHOOK_URL_LEAK="https://example.com/leak")
+
+        config = core.get_config(path)
+
+        assert config["pingme"]["options"]["webhook"]["channels"]["leak"] == "https://example.com/leak"
+        assert "PINGME_WEBHOOK_URL_LEAK" not in os.environ
+
+    def test_configs_are_isolated(self, env_file):
+        """Test two config files resolve to their own values, also when loaded concurrently."""
+        a = env_file("a.env", PINGME_WEBHOOK_URL_DEFAULT="https://example.com/a")
+        b = env_file("b.env", PINGME_WEBHOOK_URL_DEFAULT="https://example.com/b")
+        results = {}
+
+        def load(path):
+            core.clear_config_cache()
+            results[path] = core.get_config(path)["pingme"]["options"]["webhook"]["channels"]["default"]
+
+        threads = [threading.Thread(target=load, args=(p,)) for p in (a, b) * 5]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == {a: "https://example.com/a", b: "https://example.com/b"}
+
+    def test_interpolates_from_default_env(self, env_file):
+        """Test config values can reference variables from the default env file."""
+        path = env_file(PINGME_EMAIL_FROM="${PINGME_USER_INPUT_NAME}@example.com")
+
+        config = core.get_config(path)
+
+        assert config["pingme"]["options"]["email"]["from"] == "Kim@example.com"
+
+    def test_interpolation_defaults(self, env_file, monkeypatch):
+        """Test ${VAR:-default} uses the default for unset variables and unset ${VAR} becomes empty."""
+        monkeypatch.delenv("PINGME_UNSET", raising=False)
+        path = env_file(PINGME_EMAIL_FROM="${PINGME_UNSET:-ops}@example.com${PINGME_UNSET}")
+
+        config = core.get_config(path)
+
+        assert config["pingme"]["options"]["email"]["from"] == "ops@example.com"
+
+    def test_environment_beats_default_env(self, monkeypatch):
+        """Test environment variables take precedence over the default env file."""
+        monkeypatch.setenv("PINGME_USER_INPUT_NAME", "FromEnv")
+
+        assert core.get_config("")["example"]["input"]["name"] == "FromEnv"
+
+    def test_is_cached(self, env_file):
+        """Test repeated loads return the cached config."""
+        path = env_file(PINGME_WEBHOOK_URL_DEFAULT="https://example.com/a")
+
+        assert core.get_config(path) is core.get_config(path)
+
+    def test_file_change_invalidates_cache(self, env_file):
+        """Test rewriting the .env file is picked up."""
+        path = env_file(PINGME_WEBHOOK_URL_DEFAULT="https://example.com/old")
+        core.get_config(path)
+        os.utime(path, ns=(0, 0))
+
+        env_file(PINGME_WEBHOOK_URL_DEFAULT="https://example.com/new")
+
+        assert core.get_config(path)["pingme"]["options"]["webhook"]["channels"]["default"] == "https://example.com/new"
+
+    def test_environment_change_invalidates_cache(self, monkeypatch):
+        """Test changing the environment is picked up."""
+        core.get_config("")
+        monkeypatch.setenv("PINGME_WEBHOOK_URL_DEFAULT", "https://example.com/env")
+
+        assert core.get_config("")["pingme"]["options"]["webhook"]["channels"]["default"] == "https://example.com/env"
+
+    def test_cache_is_bounded_lru(self, env_file, monkeypatch):
+        """Test the least recently used config is evicted past config_cache_size."""
+        monkeypatch.setattr(core.settings, "config_cache_size", 2)
+        core.clear_config_cache()
+        a, b, c = (env_file(f"{n}.env", PINGME_TEST=n) for n in "abc")
+
+        config_a = core.get_config(a)
+        core.get_config(b)
+        core.get_config(a)  # a is now most recently used
+        core.get_config(c)
+
+        assert len(core._config_cache) == 2
+        assert core.get_config(a) is config_a
+        assert (b, True) not in core._config_cache
+
+
+class TestSetupLogging:
+    """Tests for setup_logging."""
+
+    @pytest.fixture(autouse=True)
+    def restore_logging(self):
+        level = logging.getLogger().level
+        yield
+        core.setup_logging()
+        logging.getLogger().setLevel(level)
+
+    def test_idempotent(self):
+        """Test repeated setup leaves a single queue handler on the root logger."""
+        core.setup_logging()
+        core.setup_logging()
+
+        queue_handlers = [h for h in logging.getLogger().handlers if isinstance(h, logging.handlers.QueueHandler)]
+        assert len(queue_handlers) == 1
+
+    def test_records_are_written_by_listener_thread(self, capsys):
+        """Test records go through the queue and are written by the listener."""
+        core.setup_logging(logging.INFO)
+        logging.getLogger("pingme.test").info("queued message")
+        core._listener.stop()  # flushes the queue
+        core._listener.start()
+
+        assert "queued message" in capsys.readouterr().out
+
+    def test_json_format(self, capsys):
+        """Test JSON records carry structured fields passed with extra."""
+        core.setup_logging(logging.INFO, log_format="json")
+        logging.getLogger("pingme.test").info("sent", extra={"channel": "alerts", "latency_ms": 1.5})
+        core._listener.stop()
+        core._listener.start()
+
+        line = [l for l in capsys.readouterr().out.splitlines() if '"sent"' in l][-1]
+        entry = json.loads(line)
+        assert entry["message"] == "sent"
+        assert entry["level"] == "INFO"
+        assert entry["channel"] == "alerts"
+        assert entry["latency_ms"] == 1.5
@@ -0,0 +1,208 @@
+"""Unit tests for the dead-letter store and replay."""
+import copy
+import sqlite3
+import time
+import pytest
+from unittest.mock import patch
+from pingme import deadletter
+from pingme.deadletter import DeadLetterStore, replay
+from pingme.channels import ChannelTable
+from pingme.limits import Overloaded
+from pingme.pingme_class import Card, WebhookSendError
+from pingme.services import NotificationService
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A dead-letter store in a temporary file."""
+    s = DeadLetterStore(str(tmp_path / "deadletter.sqlite"))
+    yield s
+    s.close()
+
+
+def card(name="default"):
+    return {"name": name, "context": {"title": "t", "text": "t"}, "priority": "normal"}
+
+
+class TestDeadLetterStore:
+    """Tests for DeadLetterStore."""
+
+    def test_add_and_query(self, store):
+        """Test a letter keeps the card, channel, error and attempt count."""
+        store.add(card(), "webhook", "alerts", "config.env", error="boom", status_code=500)
+
+        [letter] = store.query()
+        assert letter["card"] == card()
+        assert letter["channel"] == "alerts"
+        assert letter["config_file"] == "config.env"
+        assert letter["error"] == "boom"
+        assert letter["status_code"] == 500
+        assert letter["attempts"] == 1
+
+    def test_query_filters(self, store):
+        """Test filtering by time range, channel, card and transport."""
+        store.add(card("default"), "webhook", None)
+        cutoff = time.time()
+        time.sleep(0.01)
+        store.add(card("other"), "webhook", "alerts")
+        store.add(card("other"), "email")
+
+        assert len(store.query(since=cutoff)) == 2
+        assert len(store.query(until=cutoff)) == 1
+        assert [l["card"]["name"] for l in store.query(channel="default", transport="webhook")] == ["default"]
+        assert len(store.query(card="other")) == 2
+        assert len(store.query(transport="email")) == 1
+        assert len(store.query(limit=2)) == 2
+
+    def test_persists(self, tmp_path):
+        """Test letters survive reopening the store."""
+        path = str(tmp_path / "deadletter.sqlite")
+        s = DeadLetterStore(path)
+        s.add(card(), "webhook")
+        s.close()
+
+        assert len(DeadLetterStore(path)) == 1
+
+    def test_opens_store_without_targets_column(self, tmp_path):
+        """Test a store written before targets were kept gets the column added."""
+        path = str(tmp_path / "deadletter.sqlite")
+        db = sqlite3.connect(path)
+        db.execute(
+            "CREATE TABLE letters (id INTEGER PRIMARY KEY, failed_at REAL NOT NULL, last_attempt REAL NOT NULL, "
+            "card TEXT NOT NULL, card_name TEXT NOT NULL, transport TEXT NOT NULL, channel TEXT, config_file TEXT, "
+            "error TEXT, status_code INTEGER, attempts INTEGER NOT NULL)"
+        )
+        db.close()
+        s = DeadLetterStore(path)
+
+        s.add(card(), "webhook", targets=[{"url": "https://example.com/a", "part": 1}])
+
+        assert s.query()[0]["targets"] == [{"url": "https://example.com/a", "part": 1}]
+        s.close()
+
+
+class TestReplay:
+    """Tests for replay."""
+
+    def test_delivered_letters_are_removed(self, store):
+        """Test successful replays are removed and failures count another attempt."""
+        store.add(card("default"), "webhook")
+        store.add(card("other"), "webhook")
+
+        def send(letter):
+            ok = letter["card"]["name"] == "default"
+            return {"status_code": 200 if ok else 502, "response": "ok" if ok else "bad gateway"}
+
+        counts = replay(store, store.query(), send=send)
+
+        assert counts == {"replayed": 1, "failed": 1}
+        [letter] = store.query()
+        assert letter["card"]["name"] == "other"
+        assert letter["attempts"] == 2
+        assert letter["status_code"] == 502
+
+    def test_exception_counts_as_failure(self, store):
+        """Test a send that raises keeps the letter."""
+        store.add(card(), "webhook")
+
+        def send(letter):
+            raise ConnectionError("down")
+
+        assert replay(store, store.query(), send=send) == {"replayed": 0, "failed": 1}
+        assert "down" in store.query()[0]["error"]
+
+    def test_rate_limit(self, store):
+        """Test replays are paced to the rate."""
+        for _ in range(5):
+            store.add(card(), "webhook")
+
+        start = time.monotonic()
+        replay(store, store.query(), concurrency=5, rate=50, send=lambda letter: {"status_code": 200, "response": ""})
+
+        assert time.monotonic() - start >= 4 / 50
+        assert len(store) == 0
+
+
+class TestDeadLettering:
+    """Tests for dead-lettering failed sends in NotificationService."""
+
+    def test_failed_webhook_is_dead_lettered(self, mock_failed_webhook_response):
+        """Test a non-2xx webhook response is stored."""
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_failed_webhook_response):
+            result = NotificationService.send_simple_card_to_webhook("Title", "Text")
+
+        assert result["status_code"] == 500
+        [letter] = deadletter.get_store().query()
+        assert letter["card"]["context"] == {"title": "Title", "text": "Text"}
+        assert letter["transport"] == "webhook"
+        assert letter["status_code"] == 500
+
+    def test_raising_webhook_is_dead_lettered(self):
+        """Test a webhook send that raises is stored and the error still propagates."""
+        with patch('pingme.pingme_class.http_session.post', side_effect=ConnectionError("down")):
+            with pytest.raises(Exception):
+                NotificationService.send_default_card_to_webhook()
+
+        [letter] = deadletter.get_store().query()
+        assert "down" in letter["error"]
+        assert letter["status_code"] is None
+
+    def test_overloaded_webhook_is_not_dead_lettered(self):
+        """Test a send refused by a webhook host's limit is not stored, the caller is told to retry it instead."""
+        with patch('pingme.pingme_class.http_session.post', side_effect=Overloaded("host at its limit", 1, 503)):
+            with pytest.raises(Overloaded):
+                NotificationService.send_default_card_to_webhook()
+
+        assert len(deadletter.get_store()) == 0
+
+    def test_successful_webhook_is_not_dead_lettered(self, mock_webhook_response):
+        """Test a 2xx webhook response is not stored."""
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response):
+            NotificationService.send_default_card_to_webhook()
+
+        assert len(deadletter.get_store()) == 0
+
+    def test_replay_sends_through_webhook(self, mock_failed_webhook_response, mock_webhook_response):
+        """Test a replayed letter goes through the normal send path and is not stored twice."""
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_failed_webhook_response):
+            NotificationService.send_card_to_webhook(Card(**card()))
+        store = deadletter.get_store()
+
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_failed_webhook_response):
+            assert replay(store, store.query()) == {"replayed": 0, "failed": 1}
+        assert len(store) == 1
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            assert replay(store, store.query()) == {"replayed": 1, "failed": 0}
+        post.assert_called_once()
+        assert len(store) == 0
+
+    def test_partial_group_failure_replays_only_failed_urls(self, mock_failed_webhook_response, mock_webhook_response):
+        """Test only the group URLs that failed are dead-lettered and replayed."""
+        table = ChannelTable(
+            {"a": "https://example.com/a", "b": "https://example.com/b", "c": "https://example.com/c"},
+            groups={"all": ["a", "b", "c"]},
+        )
+
+        def post(url, **kwargs):
+            if url.endswith("/a"):
+                raise ConnectionError("down")
+            return copy.copy(mock_failed_webhook_response if url.endswith("/b") else mock_webhook_response)
+
+        with patch("pingme.channels.table_for", return_value=table):
+            with patch('pingme.pingme_class.http_session.post', side_effect=post):
+                with pytest.raises(WebhookSendError):
+                    NotificationService.send_card_to_webhook(Card(**card()), channel="all")
+            store = deadletter.get_store()
+            [letter] = store.query()
+            assert letter["targets"] == [{"url": "https://example.com/a", "part": 0}, {"url": "https://example.com/b", "part": 0}]
+
+            with patch('pingme.pingme_class.http_session.post', side_effect=post) as mock_post:
+                assert replay(store, store.query()) == {"replayed": 0, "failed": 1}
+            assert [c.args[0] for c in mock_post.call_args_list] == ["https://example.com/a", "https://example.com/b"]
+            assert store.query()[0]["targets"] == letter["targets"]
+
+            with patch('pingme.pingme_class.http_session.post', side_effect=lambda url, **kwargs: copy.copy(
+                mock_failed_webhook_response if url.endswith("/b") else mock_webhook_response
+            )):
+                assert replay(store, store.query()) == {"replayed": 0, "failed": 1}
+            assert store.query()[0]["targets"] == [{"url": "https://example.com/b", "part": 0}]
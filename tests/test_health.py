@@ -0,0 +1,142 @@
+"""Unit tests for the health and readiness endpoints."""
+import socket
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from pingme import health, limits
+from pingme.api import app
+from pingme.limits import InFlightLimiter
+from pingme.pingme_class import send_to_webhook
+from pingme.stubs import StubWebhookServer
+
+
+@pytest.fixture
+def api():
+    return TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def no_probes(monkeypatch):
+    """Start every test without probe results or a spool count from an earlier refresh."""
+    monkeypatch.setattr(health, "_probes", {})
+    monkeypatch.setattr(health, "_spool_pending", None)
+
+
+@pytest.fixture
+def saturated_limiter():
+    """A limiter at its limit with no queue, registered as if a config had sent through it."""
+    limiter = InFlightLimiter(in_flight=1, queue_depth=0)
+    limits._limiters["saturated-test"] = limiter
+    yield limiter
+    del limits._limiters["saturated-test"]
+
+
+class TestHealth:
+    """Tests for /health."""
+
+    def test_reports_connection_pools(self, api):
+        """Test webhook connection pool use is reported per host."""
+        with StubWebhookServer() as server:
+            send_to_webhook(server.url, "{}")
+            pools = api.get("/health").json()["http_pools"]
+
+        pool = pools[f"http://{server.host}:{server.port}"]
+        assert pool == {"in_use": 0, "idle": 1, "size": 32}
+
+    def test_reports_in_flight(self, api, saturated_limiter):
+        """Test in-flight sends per config and channel are reported."""
+        with saturated_limiter.slot("ops"):
+            snapshot = api.get("/health").json()["limits"]["saturated-test"]
+
+        assert snapshot["in_flight"] == 1
+        assert snapshot["channels"] == {"ops": 1}
+        assert snapshot["saturated"] is True
+
+
+class TestReady:
+    """Tests for /ready."""
+
+    def test_ready(self, api):
+        """Test an idle instance with a loadable config is ready."""
+        response = api.get("/ready")
+
+        assert response.status_code == 200
+        assert response.json()["failures"] == []
+
+    def test_saturated_is_not_ready(self, api, saturated_limiter):
+        """Test a saturated limiter makes the instance not ready so traffic goes elsewhere."""
+        with saturated_limiter.slot("default"):
+            response = api.get("/ready")
+
+        assert response.status_code == 503
+        assert response.json()["failures"] == ["limits saturated-test: saturated"]
+
+    def test_saturated_channel_is_not_ready(self, api):
+        """Test a channel at its own limit with a full queue is reported even when the global limit has room."""
+        limiter = InFlightLimiter(in_flight=10, channels={"ops": 1}, queue_depth=0)
+        limits._limiters["channel-test"] = limiter
+        try:
+            with limiter.slot("ops"):
+                response = api.get("/ready")
+        finally:
+            del limits._limiters["channel-test"]
+
+        assert response.status_code == 503
+        assert response.json()["failures"] == ["limits channel-test: channel ops saturated"]
+
+    def test_reserved_lanes_count_towards_saturation(self):
+        """Test normal sends are saturated once the unreserved part of the limit is used up."""
+        limiter = InFlightLimiter(in_flight=2, queue_depth=0, reserved={"critical": 0.5})
+
+        with limiter.slot("default"):
+            assert limiter.snapshot()["saturated"] is True
+
+    def test_probe_failure_is_not_ready(self, api, monkeypatch):
+        """Test an unreachable webhook host fails readiness once it was probed."""
+        monkeypatch.setattr(health, "probe", lambda host, port: "ConnectionRefusedError()")
+        health.refresh()
+
+        response = api.get("/ready", params={"probe": True})
+
+        assert response.status_code == 503
+        assert response.json()["probes"]
+        assert all(value == "ConnectionRefusedError()" for value in response.json()["probes"].values())
+
+    def test_ready_never_probes(self, api, monkeypatch):
+        """Test /ready reports hosts not probed yet as pending instead of connecting to them."""
+        def connect(*args, **kwargs):
+            raise AssertionError("/ready opened a connection")
+
+        monkeypatch.setattr(health, "probe", connect)
+
+        response = api.get("/ready", params={"probe": True})
+
+        assert response.status_code == 200
+        assert set(response.json()["probes"].values()) == {"pending"}
+
+
+class TestRefresh:
+    """Tests for the background probes."""
+
+    def test_probe(self):
+        """Test a probe reports a listening host as reachable and a closed port as an error."""
+        listener = socket.create_server(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        try:
+            assert health.probe("127.0.0.1", port) is None
+        finally:
+            listener.close()
+        assert health.probe("127.0.0.1", port) is not None
+
+    def test_refresher_runs_in_background(self, monkeypatch):
+        """Test the refresher probes on start and stops cleanly."""
+        probed = threading.Event()
+        monkeypatch.setattr(health, "probe", lambda host, port: probed.set())
+
+        refresher = health.ProbeRefresher(interval=60).start()
+        try:
+            assert probed.wait(5)
+        finally:
+            refresher.stop()
+
+        assert not refresher._thread.is_alive()
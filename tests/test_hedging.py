@@ -0,0 +1,166 @@
+"""Unit tests for hedged webhook requests."""
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from pingme import core, hedging
+from pingme.channels import ChannelTable
+from pingme.hedging import HedgePolicy, LatencyWindow, hedged_send
+from pingme.pingme_class import Card, PingMe
+
+
+class Response:
+    def __init__(self, status_code=200, url=None):
+        self.status_code = status_code
+        self.url = url
+        self.text = ""
+
+    def json(self):
+        return {}
+
+
+def fake_send(latencies: dict, status: dict = None):
+    """send(url) sleeping latencies[url] seconds, raising if the status is an exception."""
+    def send(url):
+        time.sleep(latencies.get(url, 0))
+        result = (status or {}).get(url, 200)
+        if isinstance(result, Exception):
+            raise result
+        return Response(result, url)
+    return send
+
+
+class TestLatencyWindow:
+    """Tests for LatencyWindow and HedgePolicy thresholds."""
+
+    def test_quantile(self):
+        """Test the nearest-rank percentile of the window."""
+        latencies = LatencyWindow()
+        for ms in range(1, 101):
+            latencies.observe(ms / 1000)
+
+        assert latencies.quantile(95) == 0.095
+        assert LatencyWindow().quantile(95) is None
+
+    def test_threshold_follows_percentile_after_min_samples(self):
+        """Test the fixed delay is used until enough latencies are known."""
+        policy = HedgePolicy(("http://backup",), after="p95", delay=2.0, min_samples=10)
+        channel = "threshold-test"
+
+        assert policy.threshold(channel) == 2.0
+        for _ in range(10):
+            hedging.observe(channel, 0.2)
+        assert policy.threshold(channel) == 0.2
+
+    def test_fixed_threshold(self):
+        """Test a number of seconds as after is used as is."""
+        assert HedgePolicy(("http://backup",), after=0.3).threshold("fixed-test") == 0.3
+
+
+class TestHedgedSend:
+    """Tests for hedged_send."""
+
+    def test_fast_primary_is_not_hedged(self):
+        """Test no backup request is made when the primary answers in time."""
+        hedges = []
+        response = hedged_send(fake_send({}), "http://primary", HedgePolicy(("http://backup",), after=1.0), "fast", hedges.append)
+
+        assert response.url == "http://primary"
+        assert hedges == []
+
+    def test_slow_primary_returns_backup(self):
+        """Test the backup answer is returned when the primary is slower than the threshold."""
+        hedges = []
+        start = time.perf_counter()
+        response = hedged_send(
+            fake_send({"http://primary": 1.0}),
+            "http://primary",
+            HedgePolicy(("http://backup",), after=0.05),
+            "slow",
+            lambda: hedges.append(True),
+        )
+
+        assert response.url == "http://backup"
+        assert time.perf_counter() - start < 0.5
+        assert hedges == [True]
+
+    def test_failed_primary_hedges_immediately(self):
+        """Test a primary that raises is hedged without waiting for the threshold."""
+        send = fake_send({}, {"http://primary": ConnectionError("down")})
+        start = time.perf_counter()
+        response = hedged_send(send, "http://primary", HedgePolicy(("http://backup",), after=5.0), "failing")
+
+        assert response.url == "http://backup"
+        assert time.perf_counter() - start < 1.0
+
+    def test_all_failing_raises_primary_error(self):
+        """Test the primary's exception is raised when no request succeeds."""
+        send = fake_send({}, {"http://primary": ConnectionError("down"), "http://backup": Exception("also down")})
+
+        with pytest.raises(ConnectionError):
+            hedged_send(send, "http://primary", HedgePolicy(("http://backup",), after=0.05), "down")
+
+
+class TestHedgedChannels:
+    """Tests for hedged channels in the webhook config."""
+
+    def test_channel_with_hedge(self):
+        """Test a channel dict with a hedge section resolves its URL and backup."""
+        table = ChannelTable(
+            {
+                "critical": {"url": "http://primary", "hedge": {"backup": "default", "after": "p99"}},
+                "default": "http://default",
+            }
+        )
+
+        assert table.resolve("critical") == ("critical", ("http://primary",))
+        policy = table.hedge_for("critical")
+        assert policy.backup_urls == ("http://default",)
+        assert policy.quantile == 99
+        assert table.hedge_for("default") is None
+
+    def test_environment_url_keeps_hedge(self, tmp_path):
+        """Test a PINGME_WEBHOOK_URL_<NAME> variable sets the URL of a hedged channel without dropping its hedge."""
+        default_yaml = open(f"{core.PACKAGE_DIR}/config/config.default.yaml").read()
+        yaml_file = tmp_path / "config.yaml"
+        yaml_file.write_text(default_yaml.replace(
+            "default: ${PINGME_WEBHOOK_URL_DEFAULT}",
+            "default: ${PINGME_WEBHOOK_URL_DEFAULT}\n                critical: {url: \"http://yaml\", hedge: {backup: default, after: p95}}",
+            1,
+        ))
+        env_file = tmp_path / "config.env"
+        env_file.write_text(f"CORE_YAML_CONFIG_FILE={yaml_file}\nPINGME_WEBHOOK_URL_CRITICAL=http://primary\n")
+
+        table = core.load_config(str(env_file))["pingme"]["options"]["webhook"]["table"]
+
+        assert table.resolve("critical") == ("critical", ("http://primary",))
+        assert table.hedge_for("critical") is not None
+
+    def test_hedge_without_backup_is_rejected(self):
+        """Test a hedge section needs a backup."""
+        with pytest.raises(ValueError):
+            ChannelTable({"critical": {"url": "http://primary", "hedge": {"after": 1}}})
+
+    def test_send_webhook_hedges_slow_channel(self, mock_card_data):
+        """Test PingMe.send_webhook sends the same payload to the backup when the primary is slow."""
+        notification = PingMe(Card(**mock_card_data))
+        notification.webhook = {
+            "channels": {
+                "critical": {"url": "http://primary", "hedge": {"backup": "http://backup", "after": 0.05}},
+            }
+        }
+        posted = []
+        lock = threading.Lock()
+
+        def post(url, data, headers, timeout):
+            with lock:
+                posted.append((url, data))
+            time.sleep(1.0 if url == "http://primary" else 0)
+            return Response(200, url)
+
+        with patch('pingme.pingme_class.http_session.post', side_effect=post):
+            response = notification.send_webhook("critical")
+
+        assert response.url == "http://backup"
+        assert {url for url, _ in posted} == {"http://primary", "http://backup"}
+        assert posted[0][1] == posted[1][1]
@@ -0,0 +1,104 @@
+"""Unit tests for stage timing hooks."""
+import logging
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch, MagicMock
+from pingme import hooks
+from pingme.pingme_class import Card
+from pingme.services import NotificationService
+
+
+@pytest.fixture
+def recorded():
+    """Register a hook recording (name, attrs) for the duration of a test."""
+    calls = []
+
+    def hook(name, duration, attrs):
+        calls.append((name, attrs))
+
+    hooks.on_stage(hook)
+    yield calls
+    hooks.remove_hook(hook)
+
+
+class TestStage:
+    """Tests for hooks.stage."""
+
+    def test_noop_without_hooks(self):
+        """Test stage is a shared no-op when nothing is registered."""
+        with patch.object(hooks, "_stage_hooks", ()):
+            assert hooks.stage("request") is hooks.stage("other", card="x")
+
+    def test_library_import_keeps_noop(self):
+        """Test importing the library registers no hooks, only the API enables the metrics hook."""
+        code = (
+            "from pingme import hooks, pingme_class, services\n"
+            "assert hooks.stage('request') is hooks._NOOP\n"
+            "from pingme import api\n"
+            "assert hooks.stage('request') is not hooks._NOOP\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+    def test_hook_receives_name_duration_attrs(self, recorded):
+        """Test a registered hook is called with the stage name and attributes."""
+        with hooks.stage("send_to_webhook", channel="ops"):
+            pass
+
+        assert ("send_to_webhook", {"channel": "ops"}) in recorded
+
+    def test_failing_hook_does_not_break_send(self, recorded):
+        """Test exceptions raised by hooks are swallowed and logged."""
+        def broken(name, duration, attrs):
+            raise RuntimeError("hook failure")
+
+        hooks.on_stage(broken)
+        try:
+            with hooks.stage("request"):
+                pass
+        finally:
+            hooks.remove_hook(broken)
+
+        assert ("request", {}) in recorded
+
+    @patch('pingme.services.PingMe')
+    def test_request_stage_wraps_service_send(self, mock_pingme_class, recorded):
+        """Test NotificationService fires a request stage per send."""
+        mock_instance = MagicMock()
+        mock_instance.send_email.return_value = '{"response": true}'
+        mock_pingme_class.return_value = mock_instance
+
+        NotificationService.send_card_to_email(Card(name="default", context={}))
+
+        names = [name for name, _ in recorded]
+        assert "request" in names
+        assert "parse_smtp_response" in names
+
+
+class TestBuiltinHooks:
+    """Tests for the built-in hooks."""
+
+    def test_log_hook_threshold(self, caplog):
+        """Test LogHook only logs stages above its threshold."""
+        hook = hooks.LogHook(threshold=0.5)
+
+        with caplog.at_level(logging.INFO, logger="pingme.stages"):
+            hook("request", 0.1, {"card": "fast"})
+            hook("request", 1.0, {"card": "slow"})
+
+        assert len(caplog.records) == 1
+        assert caplog.records[0].card == "slow"
+        assert "duration_ms=1000.000" in caplog.records[0].getMessage()
+
+    def test_slow_request_profiler_dumps_slow_requests(self, tmp_path):
+        """Test sampled slow requests are dumped as .prof files."""
+        profiler = hooks.SlowRequestProfiler(str(tmp_path), threshold=0.0, sample_rate=1.0)
+
+        hooks.on_stage(profiler)
+        try:
+            with hooks.stage("request", card="default", transport="webhook"):
+                sum(range(1000))
+        finally:
+            hooks.remove_hook(profiler)
+
+        assert len(list(tmp_path.glob("webhook-default-*.prof"))) == 1
@@ -0,0 +1,79 @@
+"""Unit tests for the idempotency store."""
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from pingme.idempotency import IdempotencyStore, StillSending
+from pingme.services import Notification, NotificationService
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "idempotency.sqlite")
+
+
+class TestIdempotencyStore:
+    """Tests for IdempotencyStore."""
+
+    def test_claim_complete_and_duplicate(self, path):
+        """Test the first claim reserves the id and later claims get its result."""
+        store = IdempotencyStore(path)
+
+        assert store.claim("a.env", "1") is None
+        store.complete("a.env", "1", {"status_code": 200})
+
+        assert store.claim("a.env", "1") == {"status_code": 200}
+        assert store.claim("b.env", "1") is None  # ids are per config
+        store.close()
+
+    def test_other_process_waits_for_reservation(self, path):
+        """Test a claim from another process waits for the sending one and gets its result."""
+        first, second = IdempotencyStore(path), IdempotencyStore(path)
+        first.claim("", "1")
+
+        with pytest.raises(StillSending):
+            second.claim("", "1", wait=0.05)
+        threading.Timer(0.05, first.complete, ("", "1", {"status_code": 200})).start()
+
+        assert second.claim("", "1", wait=5) == {"status_code": 200}
+        first.close()
+        second.close()
+
+    def test_released_and_abandoned_reservations_can_be_claimed(self, path):
+        """Test a released id, or one reserved longer than the lease, is reserved again."""
+        store = IdempotencyStore(path, lease=0.05)
+        store.claim("", "released")
+        store.release("", "released")
+        store.claim("", "abandoned")
+        time.sleep(0.1)
+
+        assert store.claim("", "released", wait=0) is None
+        assert store.claim("", "abandoned", wait=0) is None
+        store.close()
+
+
+class TestSendNotification:
+    """Tests for idempotent sends of NotificationService.send_notification."""
+
+    def test_concurrent_retry_is_not_sent_twice(self, mock_webhook_response):
+        """Test a retry arriving while the first attempt is still sending waits for its result."""
+        notification = Notification(card={"name": "default", "context": {"title": "a", "text": "a"}}, id="slow")
+        results = []
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.2)
+            return mock_webhook_response
+
+        with patch('pingme.pingme_class.http_session.post', side_effect=slow_post) as post:
+            threads = [
+                threading.Thread(target=lambda: results.append(NotificationService.send_notification(notification)))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        post.assert_called_once()
+        assert [r["status_code"] for r in results] == [200, 200, 200]
+        assert sum(1 for r in results if r.get("duplicate")) == 2
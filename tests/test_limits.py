@@ -0,0 +1,266 @@
+"""Unit tests for in-flight limits (backpressure)."""
+import os
+import threading
+import pytest
+from unittest.mock import patch
+from pingme.limits import InFlightLimiter, Overloaded, limiter_for
+
+
+class TestInFlightLimiter:
+    """Tests for InFlightLimiter."""
+
+    def test_unlimited_by_default(self):
+        """Test a limiter without limits never refuses."""
+        limiter = InFlightLimiter()
+
+        with limiter.slot("default"), limiter.slot("default"):
+            assert limiter.snapshot()["in_flight"] == 2
+
+    def test_global_limit_refuses_with_429(self):
+        """Test the global limit refuses immediately when there is no queue."""
+        limiter = InFlightLimiter(in_flight=1, retry_after=3)
+
+        with limiter.slot("default"):
+            with pytest.raises(Overloaded) as excinfo:
+                with limiter.slot("other"):
+                    pass
+
+        assert excinfo.value.status_code == 429
+        assert excinfo.value.retry_after == 3
+
+    def test_channel_limit_is_per_channel(self):
+        """Test a channel limit does not affect other channels."""
+        limiter = InFlightLimiter(channels={"slow": 1})
+
+        with limiter.slot("slow"):
+            with limiter.slot("fast"):
+                assert limiter.snapshot()["channels"] == {"slow": 1, "fast": 1}
+            with pytest.raises(Overloaded):
+                with limiter.slot("slow"):
+                    pass
+
+    def test_released_channels_are_pruned(self):
+        """Test counters of channels without sends in flight are removed."""
+        limiter = InFlightLimiter(channels={"slow": 1})
+
+        for i in range(100):
+            with limiter.slot(f"channel-{i}"):
+                pass
+
+        assert limiter._per_channel == {}
+        assert limiter.snapshot()["channels"] == {}
+        assert limiter.snapshot()["lanes"] == {}
+
+    def test_queue_timeout_gives_503(self):
+        """Test a queued caller that times out gets 503."""
+        limiter = InFlightLimiter(in_flight=1, queue_depth=1, queue_timeout=0.01)
+
+        with limiter.slot("default"):
+            with pytest.raises(Overloaded) as excinfo:
+                with limiter.slot("default"):
+                    pass
+
+        assert excinfo.value.status_code == 503
+        assert limiter.snapshot()["queued"] == 0
+
+    def test_queued_caller_gets_released_slot(self):
+        """Test a queued caller proceeds once a slot is released."""
+        limiter = InFlightLimiter(in_flight=1, queue_depth=1, queue_timeout=5)
+        done = []
+
+        def waiter():
+            with limiter.slot("default"):
+                done.append(True)
+
+        with limiter.slot("default"):
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            while limiter.snapshot()["queued"] == 0:
+                pass
+        thread.join(timeout=5)
+
+        assert done == [True]
+        assert limiter.snapshot()["in_flight"] == 0
+
+    def test_channel_with_room_is_not_held_up_by_queue(self):
+        """Test a send to a channel with room goes ahead while its lane's queue waits for a full channel."""
+        limiter = InFlightLimiter(channels={"slow": 1}, queue_depth=1, queue_timeout=5)
+
+        def wait():
+            with limiter.slot("slow"):
+                pass
+
+        with limiter.slot("slow"):
+            thread = threading.Thread(target=wait)
+            thread.start()
+            while limiter.snapshot()["queued"] == 0:
+                pass
+
+            with limiter.slot("fast"):
+                assert limiter.snapshot()["channels"] == {"slow": 1, "fast": 1}
+        thread.join(timeout=5)
+
+        assert limiter.snapshot()["in_flight"] == 0
+
+    def test_dispatch_skips_waiters_of_full_channels(self):
+        """Test a freed slot goes to the first waiter that can use it, not only the head of the queue."""
+        limiter = InFlightLimiter(in_flight=2, channels={"slow": 1}, queue_depth=2, queue_timeout=5)
+        granted = []
+
+        def wait(channel):
+            with limiter.slot(channel):
+                granted.append(channel)
+
+        slow = limiter.slot("slow")
+        slow.__enter__()
+        other = limiter.slot("other")
+        other.__enter__()
+        threads = [threading.Thread(target=wait, args=(channel,)) for channel in ("slow", "fast")]
+        for i, thread in enumerate(threads, 1):
+            thread.start()
+            while limiter.snapshot()["queued"] < i:
+                pass
+
+        other.__exit__(None, None, None)
+        threads[1].join(timeout=5)
+        assert granted == ["fast"]
+
+        slow.__exit__(None, None, None)
+        threads[0].join(timeout=5)
+        assert granted == ["fast", "slow"]
+
+    def test_from_config(self):
+        """Test building a limiter from the limits config section."""
+        limiter = InFlightLimiter.from_config({"in_flight": 4, "channels": {"default": 2}, "queue_depth": 1})
+
+        assert limiter.in_flight == 4
+        assert limiter.channels == {"default": 2}
+        assert limiter.queue_depth == 1
+
+    def test_default_config_has_limits(self):
+        """Test the shipped config defines bounded limits."""
+        assert limiter_for("").in_flight > 0
+
+    def test_reserved_capacity_admits_critical(self):
+        """Test bulk sends cannot use the capacity reserved for the critical lane."""
+        limiter = InFlightLimiter(in_flight=4, reserved={"critical": 0.25})
+
+        with limiter.slot("default", "bulk"), limiter.slot("default", "bulk"), limiter.slot("default", "bulk"):
+            with pytest.raises(Overloaded):
+                with limiter.slot("default", "bulk"):
+                    pass
+            with limiter.slot("default", "critical"):
+                assert limiter.snapshot()["lanes"] == {"bulk": 3, "critical": 1}
+
+    def test_reserved_capacity_applies_per_channel(self):
+        """Test channel limits also keep a reservation for the critical lane."""
+        limiter = InFlightLimiter(channels={"slow": 2}, reserved={"critical": 0.5})
+
+        with limiter.slot("slow", "normal"):
+            with pytest.raises(Overloaded):
+                with limiter.slot("slow", "bulk"):
+                    pass
+            with limiter.slot("slow", "critical"):
+                pass
+
+    def test_unknown_priority_uses_normal_lane(self):
+        """Test an unknown priority is scheduled in the normal lane."""
+        limiter = InFlightLimiter()
+
+        with limiter.slot("default", "urgent!"):
+            assert limiter.snapshot()["lanes"] == {"normal": 1}
+
+    def test_weighted_fair_release_order(self):
+        """Test freed slots go to waiting lanes by weight, FIFO within a lane."""
+        limiter = InFlightLimiter(in_flight=1, queue_depth=4, queue_timeout=5, weights={"critical": 2, "bulk": 1})
+        order = []
+
+        def waiter(lane, i):
+            with limiter.slot("default", lane):
+                order.append(f"{lane}{i}")
+
+        threads = []
+        with limiter.slot("default"):
+            for lane in ("bulk", "critical"):
+                for i in range(3):
+                    threads.append(threading.Thread(target=waiter, args=(lane, i)))
+                    threads[-1].start()
+                    while limiter.snapshot()["queued"] < len(threads):
+                        pass
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert order == ["critical0", "critical1", "bulk0", "critical2", "bulk1", "bulk2"]
+
+    def test_card_priority_reaches_limiter(self):
+        """Test NotificationService schedules a card in the lane of its priority."""
+        from pingme.pingme_class import Card
+        from pingme.services import NotificationService
+
+        limiter = InFlightLimiter()
+        lanes = []
+
+        def send_webhook(self, channel=None, targets=None):
+            lanes.append(limiter.snapshot()["lanes"])
+            return type("Response", (), {"status_code": 200, "text": "", "json": lambda self: {}})()
+
+        card = Card(name="default", context={"title": "t", "text": "t"}, priority="critical")
+        with patch("pingme.services.limiter_for", return_value=limiter), patch(
+            "pingme.services.PingMe.send_webhook", send_webhook
+        ):
+            NotificationService._deliver_webhook(card)
+
+        assert lanes == [{"critical": 1}]
+
+    def test_limits_apply_to_canonical_channel(self):
+        """Test case variants of a channel name share the channel's limit."""
+        from pingme.pingme_class import Card
+        from pingme.services import NotificationService
+
+        limiter = InFlightLimiter()
+        channels = []
+
+        def send_webhook(self, channel=None, targets=None):
+            channels.append(limiter.snapshot()["channels"])
+            return type("Response", (), {"status_code": 200, "text": "", "json": lambda self: {}})()
+
+        card = Card(name="default", context={"title": "t", "text": "t"})
+        with patch("pingme.services.limiter_for", return_value=limiter), patch(
+            "pingme.services.PingMe.send_webhook", send_webhook
+        ):
+            NotificationService._deliver_webhook(card, channel="DEFAULT")
+            NotificationService._deliver_webhook(card, channel="Default")
+
+        assert channels == [{"default": 1}, {"default": 1}]
+
+
+class TestLimiterFor:
+    """Tests for the process-wide limiter of a config file."""
+
+    def test_rebuilt_when_limits_change(self, tmp_path):
+        """Test a reload that changes the limits section builds a new limiter, other reloads keep it."""
+        from pingme import core
+
+        default_yaml = open(f"{core.PACKAGE_DIR}/config/config.default.yaml").read()
+        yaml_file = tmp_path / "config.yaml"
+        env_file = tmp_path / "config.env"
+        env_file.write_text(f"CORE_YAML_CONFIG_FILE={yaml_file}\n")
+
+        def write(in_flight, stamp):
+            yaml_file.write_text(default_yaml.replace("in_flight: 32", f"in_flight: {in_flight}"))
+            os.utime(yaml_file, ns=(stamp, stamp))
+
+        try:
+            write(4, 1_000_000_000)
+            limiter = limiter_for(str(env_file))
+            assert limiter.snapshot()["limit"] == 4
+
+            write(4, 2_000_000_000)
+            core.reload_changed_configs()
+            assert limiter_for(str(env_file)) is limiter
+
+            write(8, 3_000_000_000)
+            core.reload_changed_configs()
+            assert limiter_for(str(env_file)).snapshot()["limit"] == 8
+        finally:
+            core.clear_config_cache()
@@ -0,0 +1,70 @@
+"""Unit tests for the load testing harness and stub servers."""
+import pytest
+import requests
+from unittest.mock import MagicMock
+from pingme.loadtest import LoadReport, outcome_of, percentile
+from pingme.stubs import StubWebhookServer
+
+
+class TestPercentile:
+    """Tests for percentile helper."""
+
+    def test_empty_list(self):
+        """Test percentile of no samples is zero."""
+        assert percentile([], 99) == 0.0
+
+    def test_nearest_rank(self):
+        """Test nearest-rank percentiles on 1..100."""
+        values = list(range(1, 101))
+
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+
+
+class TestLoadReport:
+    """Tests for LoadReport aggregation."""
+
+    def test_summary_groups_by_endpoint_and_channel(self):
+        """Test summary rows are split per endpoint/channel with error breakdown."""
+        report = LoadReport()
+        report.record(("webhook/simple", "default"), 0.010, 200)
+        report.record(("webhook/simple", "default"), 0.020, 429)
+        report.record(("webhook/simple", "ops"), 0.030, 200)
+        report.duration = 1.0
+
+        rows = {(r["endpoint"], r["channel"]): r for r in report.summary()}
+
+        assert rows[("webhook/simple", "default")]["count"] == 2
+        assert rows[("webhook/simple", "default")]["errors"] == {"429": 1}
+        assert rows[("webhook/simple", "ops")]["errors"] == {}
+        assert rows[("webhook/simple", "ops")]["p99_ms"] == pytest.approx(30.0)
+
+    def test_outcome_uses_delivery_status(self):
+        """Test the delivery status in the body takes precedence over the API status."""
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"status_code": 429, "response": {}}
+
+        assert outcome_of(response) == 429
+
+
+class TestStubWebhookServer:
+    """Tests for the stub webhook server."""
+
+    def test_answers_success(self):
+        """Test the stub answers 200 and counts requests."""
+        with StubWebhookServer() as server:
+            response = requests.post(server.url, data="{}")
+
+        assert response.status_code == 200
+        assert server.requests == 1
+
+    def test_throttles_with_retry_after(self):
+        """Test the stub answers 429 with Retry-After when throttling."""
+        with StubWebhookServer(throttle_rate=1.0, retry_after=7) as server:
+            response = requests.post(server.url, data="{}")
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
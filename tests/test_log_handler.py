@@ -0,0 +1,127 @@
+"""Unit tests for the logging handler sending notifications."""
+import logging
+import time
+import pytest
+from unittest.mock import patch
+from pingme.log_handler import PingMeHandler
+
+
+@pytest.fixture
+def sent():
+    """Collect sent cards."""
+    return []
+
+
+@pytest.fixture
+def log(sent):
+    """A logger with a PingMeHandler that only flushes when asked to."""
+    handler = PingMeHandler(flush_interval=3600, repeat_interval=3600, send=sent.append)
+    logger = logging.getLogger("pipeline.test")
+    logger.addHandler(handler)
+    yield logger, handler
+    logger.removeHandler(handler)
+    handler.close()
+
+
+class TestPingMeHandler:
+    """Tests for PingMeHandler."""
+
+    def test_emit_does_not_send(self, log, sent):
+        """Test logging only buffers, sending happens on flush."""
+        logger, handler = log
+        logger.error("sample %s failed", "S1")
+
+        assert sent == []
+        handler.flush()
+        assert len(sent) == 1
+
+    def test_below_level_is_ignored(self, log, sent):
+        """Test records below the handler level are not notified."""
+        logger, handler = log
+        logger.warning("just a warning")
+        handler.flush()
+
+        assert sent == []
+
+    def test_repeated_records_are_aggregated(self, log, sent):
+        """Test records with the same template become one line with a count."""
+        logger, handler = log
+        for i in range(1000):
+            logger.error("sample %s failed", i)
+        logger.error("disk full")
+        handler.flush()
+
+        [card] = sent
+        assert card.context["title"] == "1001 ERROR log records from pipeline.test"
+        assert card.context["text"].splitlines() == [
+            "1000x ERROR pipeline.test: sample 999 failed",
+            "1x ERROR pipeline.test: disk full",
+        ]
+        assert card.context["severity"] == "error"
+
+    def test_repeat_interval_holds_back_groups(self, log, sent):
+        """Test a group reported recently keeps counting until its repeat interval passes."""
+        logger, handler = log
+        logger.error("sample %s failed", 1)
+        handler.flush()
+        logger.error("sample %s failed", 2)
+        logger.error("sample %s failed", 3)
+        handler.flush()
+
+        assert len(sent) == 1
+        handler.repeat_interval = 0
+        handler.flush()
+        assert len(sent) == 2
+        assert sent[1].context["text"] == "2x ERROR pipeline.test: sample 3 failed"
+
+    def test_critical_is_critical_priority(self, log, sent):
+        """Test CRITICAL records are sent in the critical lane."""
+        logger, handler = log
+        logger.critical("pipeline crashed")
+        handler.flush()
+
+        assert sent[0].priority == "critical"
+
+    def test_capacity_drops_are_reported(self, sent):
+        """Test records over capacity are dropped and counted."""
+        handler = PingMeHandler(capacity=2, flush_interval=3600, send=sent.append)
+        record = logging.LogRecord("pipeline", logging.ERROR, __file__, 1, "boom", (), None)
+        for _ in range(5):
+            handler.emit(record)
+        handler.close()
+
+        assert "3 records dropped" in sent[0].context["text"]
+
+    def test_background_flush(self, sent):
+        """Test the flush thread sends without an explicit flush."""
+        handler = PingMeHandler(flush_interval=0.01, send=sent.append)
+        handler.emit(logging.LogRecord("pipeline", logging.ERROR, __file__, 1, "boom", (), None))
+        deadline = time.time() + 5
+        while not sent and time.time() < deadline:
+            time.sleep(0.01)
+        handler.close()
+
+        assert len(sent) == 1
+
+    def test_sends_through_notification_service(self, mock_webhook_response):
+        """Test the default send path posts a webhook card."""
+        handler = PingMeHandler(flush_interval=3600)
+        handler.emit(logging.LogRecord("pipeline", logging.ERROR, __file__, 1, "boom", (), None))
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            handler.close()
+
+        post.assert_called_once()
+        assert "boom" in post.call_args.kwargs["data"]
+
+    def test_multi_group_card_with_quotes_is_sent(self, mock_webhook_response):
+        """Test a card of several groups, joined by line breaks, with quoted messages renders valid JSON."""
+        handler = PingMeHandler(flush_interval=3600)
+        handler.emit(logging.LogRecord("pipeline", logging.ERROR, __file__, 1, 'sample "S1" failed', (), None))
+        handler.emit(logging.LogRecord("pipeline.qc", logging.ERROR, __file__, 2, "disk full", (), None))
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            handler.close()
+
+        post.assert_called_once()
+        data = post.call_args.kwargs["data"]
+        assert 'sample \\"S1\\" failed' in data
+        assert "disk full" in data
@@ -0,0 +1,174 @@
+"""Unit tests for email rendering."""
+import email
+import email.policy
+import gzip
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+from pingme import mail
+from pingme.pingme_class import Card, PingMe
+
+
+class TestRender:
+    """Tests for compiled email templates."""
+
+    def test_compiled_once(self):
+        """Test a template is compiled once and reused."""
+        source = "Hello ${name}, $5 is not a variable"
+
+        assert mail.compile_template(source) is mail.compile_template(source)
+        assert mail.render(source, {"name": "Kim"}) == "Hello Kim, $5 is not a variable"
+
+    def test_unresolved_variable(self):
+        """Test a variable missing from the context raises ValueError."""
+        with pytest.raises(ValueError):
+            mail.render("${missing}", {})
+
+    def test_html_part_is_escaped(self):
+        """Test values are escaped in the HTML part only."""
+        template = {"subject": "${title}", "text": "${text}", "html": "<p>${text}</p>"}
+
+        parts = mail.render_parts(template, {"title": "t", "text": "<b>a & b</b>"})
+
+        assert parts["text"] == "<b>a & b</b>"
+        assert parts["html"] == "<p>&lt;b&gt;a &amp; b&lt;/b&gt;</p>"
+
+
+class TestBuildMessage:
+    """Tests for MIME message building."""
+
+    def test_multipart_alternative(self):
+        """Test text and HTML parts become multipart/alternative."""
+        msg = mail.build_message("s", "from@test.com", "to@test.com", text="plain", html_="<p>html</p>")
+
+        assert msg.get_content_type() == "multipart/alternative"
+        assert [part.get_content_type() for part in msg.iter_parts()] == ["text/plain", "text/html"]
+
+    def test_html_only(self):
+        """Test a single HTML part is sent as text/html."""
+        msg = mail.build_message("s", "from@test.com", "to@test.com", html_="<p>html</p>")
+
+        assert msg.get_content_type() == "text/html"
+
+
+class TestSendEmail:
+    """Tests for PingMe.send_email with email templates."""
+
+    @patch('smtplib.SMTP')
+    def test_sends_rendered_card(self, mock_smtp, mock_card_data):
+        """Test the card's title and text are sent instead of a fixed body."""
+        connection = MagicMock()
+        mock_smtp.return_value = connection
+        mock_card_data["context"]["text"] = "Run <42> finished"
+        notification = PingMe(Card(**mock_card_data))
+        notification.email = {
+            "from": "from@test.com",
+            "to": "to@test.com",
+            "smtp": {"host": "smtp.test.com", "port": 25, "user": None, "password": None},
+        }
+
+        notification.send_email()
+
+        message = email.message_from_bytes(connection.sendmail.call_args.args[2], policy=email.policy.default)
+        assert message["Subject"] == "Test Title"
+        assert "Run <42> finished" in message.get_body("plain").get_content()
+        assert "Run &lt;42&gt; finished" in message.get_body("html").get_content()
+
+    @patch('smtplib.SMTP')
+    def test_uses_validated_options(self, mock_smtp, mock_card_data, tmp_path, monkeypatch):
+        """Test the email options come from the validated model, with the port as a number."""
+        config_file = tmp_path / "config.env"
+        config_file.write_text(
+            "PINGME_EMAIL_FROM=from@test.com\nPINGME_EMAIL_TO=to@test.com\n"
+            "PINGME_EMAIL_SMTP_HOST=smtp.test.com\nPINGME_EMAIL_SMTP_PORT=2525\n"
+        )
+        monkeypatch.delenv("CORE_CONFIG_FILE", raising=False)
+        mock_smtp.return_value = MagicMock()
+
+        PingMe(Card(**mock_card_data), config_file=str(config_file)).send_email()
+
+        mock_smtp.assert_called_once_with("smtp.test.com", 2525)
+
+
+@pytest.fixture
+def report(tmp_path):
+    """A binary file larger than one read chunk in an attachments directory."""
+    directory = tmp_path / "reports"
+    directory.mkdir()
+    path = directory / "qc.bin"
+    path.write_bytes(os.urandom(3 * mail.CHUNK_SIZE + 17))
+    return path
+
+
+def parse(chunks):
+    return email.message_from_bytes(b"".join(chunks).replace(b"\r\n..", b"\r\n."), policy=email.policy.default)
+
+
+class TestAttachments:
+    """Tests for streamed email attachments."""
+
+    def test_outside_allowed_dirs_is_refused(self, report, tmp_path):
+        """Test only files under allowed_dirs can be attached."""
+        with pytest.raises(mail.AttachmentError):
+            mail.attachments_from([str(report)], {"allowed_dirs": [str(tmp_path / "other")]})
+        with pytest.raises(mail.AttachmentError):
+            mail.attachments_from([str(report.parent / ".." / ".." / "etc")], {"allowed_dirs": [str(report.parent)]})
+
+    def test_size_caps(self, report):
+        """Test max_bytes and max_total_bytes are checked before sending."""
+        size = report.stat().st_size
+        policy = {"allowed_dirs": [str(report.parent)]}
+
+        with pytest.raises(mail.AttachmentError):
+            mail.attachments_from([str(report)], {**policy, "max_bytes": size - 1})
+        with pytest.raises(mail.AttachmentError):
+            mail.attachments_from([str(report), str(report)], {**policy, "max_bytes": size, "max_total_bytes": size + 1})
+
+    def test_streamed_message_round_trips(self, report):
+        """Test the streamed multipart/mixed message carries the body and the exact file content."""
+        msg = mail.build_message("s", "from@test.com", "to@test.com", text=".starts with a dot", html_="<p>html</p>")
+        attachments = mail.attachments_from(
+            [str(report), {"path": str(report), "name": "qc.bin", "gzip": True}],
+            {"allowed_dirs": [str(report.parent)]},
+        )
+
+        message = parse(mail.stream_message(msg, attachments))
+        files = list(message.iter_attachments())
+
+        assert message.get_content_type() == "multipart/mixed"
+        assert message.get_body("plain").get_content().startswith(".starts with a dot")
+        assert [part.get_filename() for part in files] == ["qc.bin", "qc.bin.gz"]
+        assert files[0].get_content() == report.read_bytes()
+        assert gzip.decompress(files[1].get_content()) == report.read_bytes()
+
+    def test_chunks_are_bounded(self, report):
+        """Test the file is encoded a chunk at a time rather than in one piece."""
+        chunks = list(mail.Attachment(str(report)).chunks())
+
+        assert len(chunks) == 4
+        assert max(len(chunk) for chunk in chunks) <= mail.CHUNK_SIZE * 4 // 3 + mail.CHUNK_SIZE // 57 * 2
+
+    @patch('smtplib.SMTP')
+    def test_send_email_streams_attachments(self, mock_smtp, mock_card_data, report):
+        """Test PingMe.send_email writes attachments to the SMTP data stream instead of using sendmail."""
+        connection = MagicMock()
+        connection.mail.return_value = (250, b"OK")
+        connection.rcpt.return_value = (250, b"OK")
+        connection.getreply.side_effect = [(354, b"Go ahead"), (250, b"Queued")]
+        mock_smtp.return_value = connection
+        notification = PingMe(Card(**mock_card_data)).attach(str(report), name="report.bin")
+        notification.email = {
+            "from": "from@test.com",
+            "to": "to@test.com",
+            "smtp": {"host": "smtp.test.com", "port": 25, "user": None, "password": None},
+            "attachments": {"allowed_dirs": [str(report.parent)]},
+        }
+
+        response = notification.send_email()
+
+        assert '"response": true' in response
+        connection.sendmail.assert_not_called()
+        sent = [call.args[0] for call in connection.send.call_args_list]
+        assert sent[-1] == b".\r\n"
+        message = parse(sent[:-1])
+        assert next(message.iter_attachments()).get_content() == report.read_bytes()
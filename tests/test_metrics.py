@@ -0,0 +1,81 @@
+"""Unit tests for Prometheus metrics."""
+import pytest
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from pingme import hooks, metrics
+from pingme.api import app
+from pingme.pingme_class import Card, PingMe
+
+
+client = TestClient(app)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestRecordSend:
+    """Tests for send/failure counters."""
+
+    def test_failure_counts_send_and_failure(self):
+        """Test an unsuccessful send increments both counters."""
+        labels = {"card": "metrics_test", "channel": "ops", "transport": "webhook"}
+        sends, failures = sample("pingme_sends_total", **labels), sample("pingme_send_failures_total", **labels)
+
+        metrics.record_send("metrics_test", "ops", "webhook", success=False)
+
+        assert sample("pingme_sends_total", **labels) == sends + 1
+        assert sample("pingme_send_failures_total", **labels) == failures + 1
+
+    def test_stage_records_on_exception(self):
+        """Test stage timing is recorded even when the block raises."""
+        labels = {"stage": "transport", "channel": "boom", "transport": "webhook"}
+        before = sample("pingme_stage_duration_seconds_count", **labels)
+
+        with pytest.raises(RuntimeError):
+            with hooks.stage("send_to_webhook", channel="boom", transport="webhook"):
+                raise RuntimeError("boom")
+
+        assert sample("pingme_stage_duration_seconds_count", **labels) == before + 1
+
+    def test_mark_process_dead_removes_live_gauge_files(self, tmp_path, monkeypatch):
+        """Test an exited worker's live gauge files are removed and other workers' files kept."""
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        (tmp_path / "gauge_livesum_123.db").write_bytes(b"")
+        (tmp_path / "gauge_livesum_456.db").write_bytes(b"")
+        (tmp_path / "counter_123.db").write_bytes(b"")
+
+        metrics.mark_process_dead(123)
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["counter_123.db", "gauge_livesum_456.db"]
+
+
+class TestPingMeInstrumentation:
+    """Tests for instrumentation of PingMe sends."""
+
+    @patch('pingme.pingme_class.send_to_webhook')
+    def test_webhook_error_status_counts_failure(self, mock_send):
+        """Test a 5xx webhook response is counted as a failure on the default channel."""
+        mock_send.return_value = MagicMock(status_code=500)
+        labels = {"card": "default", "channel": "default", "transport": "webhook"}
+        failures = sample("pingme_send_failures_total", **labels)
+
+        PingMe(Card(name="default", context={"title": "t", "text": "t"})).send_webhook()
+
+        assert sample("pingme_send_failures_total", **labels) == failures + 1
+
+
+class TestMetricsEndpoint:
+    """Tests for the /metrics endpoint."""
+
+    def test_metrics_endpoint_exposes_counters(self):
+        """Test /metrics serves the Prometheus text format."""
+        metrics.record_send("default", "default", "webhook")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "pingme_sends_total" in response.text
+        assert "pingme_stage_duration_seconds_bucket" in response.text
@@ -2,6 +2,7 @@
 import pytest
 import json
 from unittest.mock import patch, MagicMock
+from pingme import core
 from pingme.pingme_class import Card, resolved_payload, PingMe, send_to_webhook, send_to_email
 
 
@@ -90,12 +91,21 @@ class TestResolvedPayload:
         result = resolved_payload(template, context)
         
         assert result["static"] == "value"
+    
+    def test_values_are_json_escaped(self):
+        """Test quotes and line breaks in values keep the payload valid."""
+        template = {"message": "${text}"}
+        context = {"text": 'line "one"\nline two'}
+        
+        result = resolved_payload(template, context)
+        
+        assert result["message"] == 'line "one"\nline two'
 
 
 class TestSendToWebhook:
     """Tests for send_to_webhook function."""
     
-    @patch('requests.post')
+    @patch('pingme.pingme_class.http_session.post')
     def test_successful_webhook_post(self, mock_post):
         """Test successful webhook POST request."""
         mock_response = MagicMock()
@@ -111,7 +121,7 @@ class TestSendToWebhook:
         assert response.status_code == 200
         mock_post.assert_called_once()
     
-    @patch('requests.post')
+    @patch('pingme.pingme_class.http_session.post')
     def test_webhook_with_custom_headers(self, mock_post):
         """Test webhook with custom headers."""
         mock_response = MagicMock()
@@ -132,7 +142,7 @@ class TestSendToWebhook:
         with pytest.raises(Exception, match="Webhook URL not set"):
             send_to_webhook(None, '{}')
     
-    @patch('requests.post')
+    @patch('pingme.pingme_class.http_session.post')
     def test_webhook_connection_error(self, mock_post):
         """Test webhook handles connection errors."""
         mock_post.side_effect = ConnectionError("Network error")
@@ -141,6 +151,68 @@ class TestSendToWebhook:
             send_to_webhook("https://example.com/webhook", '{}')
 
 
+class TestResponseBodyHandling:
+    """Tests for reading webhook response bodies only when needed."""
+
+    def test_discarded_body_on_success(self):
+        """Test a 2xx body is drained unread and reported with the same response keys."""
+        from pingme.services import parse_webhook_response
+        from pingme.stubs import StubWebhookServer
+
+        with StubWebhookServer() as server:
+            response = send_to_webhook(server.url + "/hook", "{}", read_body=False)
+
+        assert response.status_code == 200
+        assert response.body_discarded is True
+        assert parse_webhook_response(response) == {"status_code": 200, "response": {"content": "Not read"}}
+
+    @patch('pingme.pingme_class.http_session.post')
+    def test_drain_error_keeps_success(self, mock_post):
+        """Test a connection failing while the body of a 2xx is drained still reports the send as delivered."""
+        response = MagicMock(status_code=200)
+        response.raw.drain_conn.side_effect = ConnectionResetError("reset")
+        mock_post.return_value = response
+
+        assert send_to_webhook("https://example.com/webhook", "{}", read_body=False) is response
+
+        assert response.body_discarded is True
+        response.close.assert_called_once()
+
+    def test_error_body_is_read(self):
+        """Test error bodies are read and parsed even when bodies are not read."""
+        from pingme.services import parse_webhook_response
+        from pingme.stubs import StubWebhookServer
+
+        with StubWebhookServer(error_rate=1.0) as server:
+            response = send_to_webhook(server.url + "/hook", "{}", read_body=False)
+
+        assert response.status_code == 500
+        assert not getattr(response, "body_discarded", False)
+        assert parse_webhook_response(response)["response"] != {"content": "Not read"}
+
+    def test_read_response_body_modes(self):
+        """Test the always, errors and sampled modes."""
+        from pingme.pingme_class import read_response_body
+
+        assert read_response_body(None) is True
+        assert read_response_body({"body": "always"}) is True
+        assert read_response_body({"body": "errors"}) is False
+        assert read_response_body({"body": "sampled", "sample_rate": 1.0}) is True
+        assert read_response_body({"body": "sampled", "sample_rate": 0.0}) is False
+
+    @patch('pingme.pingme_class.http_session.post')
+    def test_send_webhook_streams_in_errors_mode(self, mock_post, mock_card_data):
+        """Test PingMe.send_webhook requests a streamed response when bodies are only read for errors."""
+        mock_post.return_value = MagicMock(status_code=200)
+        notification = PingMe(Card(**mock_card_data))
+        notification.webhook = dict(notification.webhook, response={"body": "errors"})
+
+        response = notification.send_webhook()
+
+        assert mock_post.call_args[1]["stream"] is True
+        assert response.body_discarded is True
+
+
 class TestSendToEmail:
     """Tests for send_to_email function."""
     
@@ -264,6 +336,15 @@ class TestPingMeClass:
         with pytest.raises(ValueError, match="Card name nonexistent not found"):
             PingMe(card)
     
+    def test_config_file_beats_environment(self, monkeypatch):
+        """Test a config file passed in is used over CORE_CONFIG_FILE, which only applies when none is given."""
+        monkeypatch.setenv("CORE_CONFIG_FILE", "process.env")
+        card = Card(name="default", context={})
+
+        with patch('pingme.pingme_class.core.get_config', return_value=core.load_config("")):
+            assert PingMe(card, config_file="tenant.env").config_file == "tenant.env"
+            assert PingMe(card).config_file == "process.env"
+
     @patch('pingme.pingme_class.core.get_config')
     def test_pingme_uses_default_variables(self, mock_get_config):
         """Test PingMe uses default variable values when not provided."""
@@ -294,3 +375,20 @@ class TestPingMeClass:
         assert pingme.card["context"]["title"] == "Custom"
         assert pingme.card["context"]["text"] == "Default Text"
         assert pingme.card["context"]["extra"] == "Extra Value"
+
+
+class TestCli:
+    """Tests for the pingme command line."""
+
+    def test_sends_to_logfile(self, tmp_path, monkeypatch):
+        """Test the CLI builds its card and sends it, with --context overriding the configured context."""
+        from pingme.pingme_class import cli
+
+        logfile = tmp_path / "pingme.log"
+        config_file = tmp_path / "config.env"
+        config_file.write_text(f"PROJECTNAME_LOGFILE_PATH={logfile}\n")
+        monkeypatch.delenv("CORE_CONFIG_FILE", raising=False)
+
+        cli(config_file=str(config_file), logfile=True, context='{"title": "CLI title"}')
+
+        assert "CLI title\tAn example of text" in logfile.read_text()
@@ -0,0 +1,95 @@
+"""Unit tests for rule-based routing."""
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from pingme.api import app
+from pingme.pingme_class import Card
+from pingme.routing import Router
+from pingme.services import NotificationService
+
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def router():
+    """A router with a critical rule, a tag rule and a default."""
+    return Router(
+        rules=[
+            {"name": "critical", "match": {"severity": ["critical", "error"]}, "webhook": ["oncall"], "email": True},
+            {"name": "qc", "match": {"tags": ["qc"]}, "webhook": "lab", "logfile": True},
+            {"name": "crash", "match": {"severity": "error", "tags": "crash"}, "webhook": ["never"]},
+        ],
+        default={"webhook": ["default"]},
+    )
+
+
+class TestRouter:
+    """Tests for Router decisions."""
+
+    def test_severity_rule(self, router):
+        """Test a severity rule matches case-insensitively."""
+        decision = router.decide("default", {"severity": "CRITICAL"})
+
+        assert decision.rule == "critical"
+        assert decision.webhook == ("oncall",)
+        assert decision.email is True
+
+    def test_first_match_wins(self, router):
+        """Test an earlier rule wins over a later, more specific one."""
+        assert router.decide("default", {"severity": "error", "tags": ["crash"]}).rule == "critical"
+
+    def test_tag_rule_with_comma_separated_tags(self, router):
+        """Test tags can be given as a comma separated string."""
+        decision = router.decide("default", {"severity": "info", "tags": "run, qc"})
+
+        assert decision.rule == "qc"
+        assert decision.logfile is True
+
+    def test_default_route(self, router):
+        """Test unmatched cards take the default route."""
+        decision = router.decide("default", {"title": "no severity"})
+
+        assert decision.rule is None
+        assert decision.webhook == ("default",)
+
+    def test_decisions_are_memoised(self, router):
+        """Test repeated lookups are served from the decision table."""
+        first = router.decide("default", {"severity": "critical"})
+
+        assert router.decide("default", {"severity": "critical"}) is first
+        assert len(router._memo) == 1
+
+    def test_card_condition(self):
+        """Test rules can be limited to card names."""
+        router = Router(rules=[{"name": "only_qc", "match": {"cards": ["qc_report"]}, "email": True}])
+
+        assert router.decide("qc_report", {}).rule == "only_qc"
+        assert router.decide("default", {}).rule is None
+
+
+class TestRoutedSend:
+    """Tests for sending routed cards."""
+
+    @patch('pingme.services.NotificationService._deliver_email')
+    @patch('pingme.services.NotificationService._deliver_webhook')
+    @patch('pingme.services.router_for')
+    def test_send_routed_card(self, mock_router_for, mock_webhook, mock_email, router):
+        """Test a routed send goes to every channel and transport of the decision."""
+        mock_router_for.return_value = router
+        mock_webhook.return_value = {"status_code": 200, "response": {}}
+        mock_email.return_value = {"status_code": 200, "response": "Email sent successfully"}
+
+        result = NotificationService.send_routed_card(Card(name="default", context={"severity": "critical"}))
+
+        assert result["rule"] == "critical"
+        assert list(result["webhook"]) == ["oncall"]
+        assert result["email"]["status_code"] == 200
+        assert result["logfile"] is None
+
+    def test_explain_endpoint_uses_config(self):
+        """Test /route/explain reports the default route of the shipped config."""
+        response = client.post("/route/explain", json={"name": "default", "context": {"severity": "info"}})
+
+        assert response.status_code == 200
+        assert response.json() == {"rule": None, "webhook": ["default"], "email": False, "logfile": False}
@@ -0,0 +1,180 @@
+"""Unit tests for the timer scheduler."""
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from pingme import scheduler
+from pingme.api import app
+from pingme.core import settings
+from pingme.scheduler import Scheduler
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def delivered():
+    """Collect delivered specs."""
+    return []
+
+
+@pytest.fixture
+def sched(tmp_path, delivered):
+    """A running scheduler persisting to a temporary file."""
+    s = Scheduler(str(tmp_path / "schedule.sqlite"), deliver=delivered.append).start()
+    yield s
+    s.stop()
+
+
+class TestScheduler:
+    """Tests for Scheduler."""
+
+    def test_delivers_when_due(self, sched, delivered):
+        """Test a job is delivered once its due time passes."""
+        sched.schedule({"card": {"name": "default"}}, time.time() + 0.05)
+
+        assert wait_for(lambda: len(delivered) == 1)
+        assert len(sched) == 0
+
+    def test_delivers_in_due_order(self, sched, delivered):
+        """Test jobs are delivered earliest first regardless of scheduling order."""
+        now = time.time()
+        sched.schedule({"n": 2}, now + 0.10)
+        sched.schedule({"n": 1}, now + 0.05)
+
+        assert wait_for(lambda: len(delivered) == 2)
+        assert [d["n"] for d in delivered] == [1, 2]
+
+    def test_cancel(self, sched, delivered):
+        """Test a cancelled job is not delivered."""
+        job_id = sched.schedule({"n": 1}, time.time() + 0.05)
+
+        assert sched.cancel(job_id) is True
+        assert sched.cancel(job_id) is False
+        time.sleep(0.1)
+        assert delivered == []
+
+    def test_heartbeat_rearms(self, sched, delivered):
+        """Test heartbeats push the dead-man alert back and it fires once they stop."""
+        for _ in range(5):
+            sched.heartbeat("pipeline", 0.1, {"key": "pipeline"})
+            time.sleep(0.03)
+        assert delivered == []
+
+        assert wait_for(lambda: len(delivered) == 1)
+        time.sleep(0.15)
+        assert len(delivered) == 1
+
+    def test_repeating_job(self, sched, delivered):
+        """Test jobs with every are rescheduled after each delivery."""
+        job_id = sched.schedule({"every": 0.05}, time.time())
+
+        assert wait_for(lambda: len(delivered) >= 2)
+        assert sched.get(job_id) is not None
+
+    def test_persists_across_restart(self, tmp_path, delivered):
+        """Test pending jobs are reloaded from disk."""
+        path = str(tmp_path / "schedule.sqlite")
+        first = Scheduler(path, deliver=delivered.append)
+        job_id = first.schedule({"n": 1}, time.time() + 3600)
+        first.stop()
+
+        second = Scheduler(path, deliver=delivered.append)
+        try:
+            assert second.get(job_id)["spec"] == {"n": 1}
+        finally:
+            second.stop()
+
+    def test_job_is_sent_by_one_process(self, tmp_path, delivered):
+        """Test schedulers of several workers on the same file send a due job once."""
+        path = str(tmp_path / "schedule.sqlite")
+        setup = Scheduler(path)
+        setup.schedule({"n": 1}, time.time() + 0.1)
+        setup.stop()
+        workers = [Scheduler(path, deliver=delivered.append).start() for _ in range(4)]
+        try:
+            assert wait_for(lambda: len(delivered) == 1)
+            time.sleep(0.2)
+            assert delivered == [{"n": 1}]
+        finally:
+            for worker in workers:
+                worker.stop()
+
+    def test_heartbeat_in_another_process_rearms(self, tmp_path, delivered):
+        """Test a heartbeat received by one worker keeps the other workers from sending the alert."""
+        path = str(tmp_path / "schedule.sqlite")
+        setup = Scheduler(path)
+        setup.heartbeat("pipeline", 0.1, {"key": "pipeline"})
+        setup.stop()
+        first = Scheduler(path, deliver=delivered.append).start()
+        second = Scheduler(path, deliver=delivered.append).start()
+        try:
+            second.heartbeat("pipeline", 3600, {"key": "pipeline"})
+            time.sleep(0.3)
+            assert delivered == []
+            assert first.get("heartbeat:pipeline")["due"] == second.get("heartbeat:pipeline")["due"]
+            assert second.cancel("heartbeat:pipeline") is True
+            assert first.get("heartbeat:pipeline") is None
+        finally:
+            first.stop()
+            second.stop()
+
+    def test_many_timers(self, sched):
+        """Test scheduling many timers stays cheap."""
+        due = time.time() + 3600
+        start = time.perf_counter()
+        for i in range(20000):
+            sched.schedule({"n": i}, due + i)
+
+        assert len(sched) == 20000
+        assert time.perf_counter() - start < 10
+
+
+class TestScheduleEndpoints:
+    """Tests for /schedule and /heartbeat."""
+
+    @pytest.fixture(autouse=True)
+    def data_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+        yield
+        scheduler.stop_scheduler()
+
+    def test_schedule_get_cancel(self):
+        """Test a scheduled card can be inspected and cancelled."""
+        client = TestClient(app)
+        card = {"name": "default", "context": {"title": "Later", "text": "Later"}}
+
+        response = client.post("/schedule", json={"card": card, "delay": 3600})
+        job_id = response.json()["id"]
+
+        assert response.status_code == 200
+        assert client.get(f"/schedule/{job_id}").json()["spec"]["card"] == {**card, "priority": "normal", "attachments": []}
+        assert client.delete(f"/schedule/{job_id}").status_code == 200
+        assert client.get(f"/schedule/{job_id}").status_code == 404
+
+    @patch('pingme.scheduler.NotificationService._deliver_webhook')
+    def test_missed_heartbeat_sends_alert(self, mock_deliver):
+        """Test a missed heartbeat delivers the default alert card."""
+        client = TestClient(app)
+
+        response = client.post("/heartbeat/nightly", params={"timeout": 0.05})
+
+        assert response.status_code == 200
+        assert wait_for(lambda: mock_deliver.called)
+        assert "nightly" in mock_deliver.call_args[0][0].context["title"]
+
+    def test_rejects_non_positive_intervals(self):
+        """Test negative delays, non-positive repeats and heartbeat timeouts are refused."""
+        client = TestClient(app)
+        card = {"name": "default", "context": {"title": "t", "text": "t"}}
+
+        assert client.post("/schedule", json={"card": card, "every": -1}).status_code == 422
+        assert client.post("/schedule", json={"card": card, "every": 0}).status_code == 422
+        assert client.post("/schedule", json={"card": card, "delay": -5}).status_code == 422
+        assert client.post("/heartbeat/nightly", params={"timeout": 0}).status_code == 422
+        assert len(scheduler.get_scheduler()) == 0
@@ -0,0 +1,119 @@
+"""Unit tests for the webhook payload size guard."""
+import json
+import os
+import pytest
+from unittest.mock import patch
+from pingme import sizeguard
+from pingme.pingme_class import Card, PingMe, resolved_payload
+from pingme.sizeguard import PayloadTooLarge
+
+TEMPLATE = {"title": "${title}", "body": [{"text": "${text}"}]}
+
+
+def render(context):
+    return resolved_payload(TEMPLATE, context)
+
+
+def fit(context, policy, channel="default"):
+    return sizeguard.fit(render, context, json.dumps(render(context)), channel, policy)
+
+
+class TestLimits:
+    """Tests for the per channel size limits."""
+
+    def test_channel_override(self):
+        """Test a channel limit overrides max_bytes and 0 means unlimited."""
+        policy = {"max_bytes": 1000, "channels": {"big": 0, "small": 100}}
+
+        assert sizeguard.max_bytes(policy, "default") == 1000
+        assert sizeguard.max_bytes(policy, "small") == 100
+        assert sizeguard.max_bytes(policy, "big") == 0
+        assert sizeguard.max_bytes(None, "default") == sizeguard.DEFAULT_MAX_BYTES
+
+    def test_small_payload_is_untouched(self):
+        """Test a payload under the limit is returned as is."""
+        context = {"title": "t", "text": "short"}
+
+        assert fit(context, {"max_bytes": 1000}) == [json.dumps(render(context))]
+
+
+class TestOversize:
+    """Tests for the oversize actions."""
+
+    def test_truncate_spills_full_text(self, tmp_path):
+        """Test truncation fits the limit and references a file with the full text."""
+        text = "\n".join(f'line {i} "quoted" æøå' for i in range(500))
+        policy = {"max_bytes": 2000, "spill_dir": str(tmp_path)}
+
+        payloads = fit({"title": "t", "text": text}, policy)
+
+        assert len(payloads) == 1
+        assert sizeguard.encoded_size(payloads[0]) <= 2000
+        kept = json.loads(payloads[0])["body"][0]["text"]
+        path = kept.rsplit(": ", 1)[1]
+        with open(path, encoding="utf-8") as file:
+            assert file.read() == text
+        assert text.startswith(kept.split("\n\n... truncated")[0])
+
+    def test_truncate_references_spill_url(self, tmp_path):
+        """Test spill_url replaces the local path in the card."""
+        policy = {"max_bytes": 500, "spill_dir": str(tmp_path), "spill_url": "https://files.example.org/spill/"}
+
+        payloads = fit({"title": "t", "text": "x" * 5000}, policy)
+
+        name = os.listdir(tmp_path)[0]
+        assert f"https://files.example.org/spill/{name}" in payloads[0]
+
+    def test_rejected_truncation_leaves_no_spill_file(self, tmp_path):
+        """Test a truncated card that still does not fit raises without writing a spill file."""
+        def padded(context):
+            # Grows once the truncation note is added, so the truncated card is still too large
+            return {"text": context["text"], "pad": "x" * 5000 if "truncated" in context["text"] else ""}
+
+        context = {"title": "t", "text": "x" * 5000}
+        with pytest.raises(PayloadTooLarge):
+            sizeguard.fit(padded, context, json.dumps(padded(context)), "default", {"max_bytes": 1000, "spill_dir": str(tmp_path)})
+
+        assert os.listdir(tmp_path) == []
+
+    def test_split_into_numbered_cards(self):
+        """Test splitting keeps every part under the limit and the text in order."""
+        text = "".join(f"row {i}\n" for i in range(1000))
+
+        payloads = fit({"title": "Report", "text": text}, {"max_bytes": 1000, "oversize": "split"})
+        cards = [json.loads(payload) for payload in payloads]
+
+        assert len(cards) > 1
+        assert all(sizeguard.encoded_size(payload) <= 1000 for payload in payloads)
+        assert [card["title"] for card in cards] == [f"Report ({i}/{len(cards)})" for i in range(1, len(cards) + 1)]
+        assert "".join(card["body"][0]["text"] for card in cards) == text
+
+    def test_reject(self):
+        """Test reject raises before anything is sent."""
+        with pytest.raises(PayloadTooLarge):
+            fit({"title": "t", "text": "x" * 5000}, {"max_bytes": 1000, "oversize": "reject"})
+
+    def test_too_large_without_text(self):
+        """Test a payload that is too large even with an empty text is rejected."""
+        with pytest.raises(PayloadTooLarge):
+            fit({"title": "x" * 5000, "text": "short"}, {"max_bytes": 1000})
+
+
+class TestSendWebhook:
+    """Tests for the size guard in PingMe.send_webhook."""
+
+    def test_split_card_is_sent_in_parts(self, mock_card_data, mock_webhook_response):
+        """Test each part of a split card is posted in order."""
+        mock_card_data["context"]["text"] = "word " * 20000
+        notification = PingMe(Card(**mock_card_data))
+        notification.webhook = {
+            **notification.webhook,
+            "channels": {"default": "http://test.webhook.local"},
+            "payload_limit": {"max_bytes": 28000, "oversize": "split"},
+        }
+        with patch('pingme.pingme_class.http_session.post', return_value=mock_webhook_response) as post:
+            responses = notification.send_webhook()
+
+        assert len(responses) == post.call_count == 4
+        assert all(len(call.kwargs["data"]) <= 28000 for call in post.call_args_list)
+        assert "Test Title (1/4)" in post.call_args_list[0].kwargs["data"]
@@ -0,0 +1,228 @@
+"""Unit tests for the spool transport and drainer."""
+import json
+import os
+import pytest
+from unittest.mock import patch
+from pingme import core, deadletter, spool
+from pingme.pingme_class import Card, PingMe
+from pingme.services import NotificationService
+from pingme.limits import InFlightLimiter
+from pingme.spool import Drainer
+
+
+class Response:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+
+@pytest.fixture
+def spool_dir(data_dir):
+    return os.path.join(data_dir, "spool")
+
+
+@pytest.fixture
+def entry():
+    return {"card": {"name": "default", "context": {"title": "t"}}, "channel": "default", "urls": ["http://hook"], "payload": "{}"}
+
+
+class TestSpoolWrite:
+    """Tests for writing to the spool."""
+
+    def test_write_is_complete_file(self, tmp_path, entry):
+        """Test a spooled file holds the entry and no temporary files are left behind."""
+        path = spool.write(str(tmp_path / "spool"), entry)
+
+        with open(path) as f:
+            assert json.load(f) == entry
+        assert os.listdir(tmp_path / "spool") == [os.path.basename(path)]
+
+    def test_pending_skips_temporary_files_and_keeps_order(self, tmp_path, entry):
+        """Test only complete files are pending, oldest first."""
+        directory = str(tmp_path)
+        first = spool.write(directory, entry)
+        second = spool.write(directory, entry)
+        open(os.path.join(directory, ".partial.json"), "w").close()
+
+        assert spool.pending(directory) == [first, second]
+        assert spool.pending(directory, limit=1) == [first]
+        assert spool.pending(str(tmp_path / "missing")) == []
+
+    def test_send_spool_writes_rendered_payload(self, spool_dir, mock_card_data):
+        """Test PingMe.send_spool writes the rendered payload and resolved URLs without sending."""
+        notification = PingMe(Card(**mock_card_data))
+        with patch('pingme.pingme_class.http_session.post') as post:
+            path = notification.send_spool()
+
+        post.assert_not_called()
+        with open(path) as f:
+            written = json.load(f)
+        assert written["payload"] == json.dumps(notification.payload)
+        assert written["card"]["context"]["title"] == "Test Title"
+        assert written["config_file"] == notification.config_file
+        assert os.path.dirname(path) == spool_dir
+
+    def test_send_card_to_spool(self, spool_dir, mock_card_data):
+        """Test NotificationService answers 202 with the spooled path."""
+        result = NotificationService.send_card_to_spool(Card(**mock_card_data))
+
+        assert result["status_code"] == 202
+        assert spool.pending(spool_dir) == [result["response"]["spooled"]]
+
+
+class TestDrainer:
+    """Tests for Drainer."""
+
+    def test_delivered_files_are_removed(self, tmp_path, entry):
+        """Test delivered entries are posted and removed."""
+        directory = str(tmp_path)
+        for _ in range(3):
+            spool.write(directory, entry)
+        posted = []
+
+        def post(url, data, headers):
+            posted.append((url, data))
+            return Response(200)
+
+        counts = Drainer(directory, post=post).drain_once()
+
+        assert counts == {"sent": 3, "kept": 0}
+        assert posted == [("http://hook", "{}")] * 3
+        assert spool.pending(directory) == []
+
+    def test_retryable_failures_are_kept(self, tmp_path, entry):
+        """Test server errors and exceptions leave the file for the next pass."""
+        directory = str(tmp_path)
+        spool.write(directory, entry)
+        spool.write(directory, entry)
+        responses = iter([Response(503), ConnectionError("down")])
+
+        def post(url, data, headers):
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        counts = Drainer(directory, post=post, concurrency=1).drain_once()
+
+        assert counts == {"sent": 0, "kept": 2}
+        assert len(spool.pending(directory)) == 2
+
+    def test_permanent_failures_are_dead_lettered(self, tmp_path, entry):
+        """Test a client error moves the entry to the dead-letter store."""
+        directory = str(tmp_path / "spool")
+        spool.write(directory, entry)
+
+        counts = Drainer(directory, post=lambda url, data, headers: Response(400, "bad payload")).drain_once()
+
+        assert counts == {"sent": 1, "kept": 0}
+        assert spool.pending(directory) == []
+        [letter] = deadletter.get_store().query()
+        assert letter["status_code"] == 400
+        assert letter["error"] == "bad payload"
+
+    def test_tenant_config_is_used(self, tmp_path, entry):
+        """Test entries are sent under their config's limits and dead-lettered with their config file."""
+        directory = str(tmp_path / "spool")
+        spool.write(directory, {**entry, "config_file": "/etc/pingme/lab1.env"})
+        limiter = InFlightLimiter()
+
+        with patch("pingme.spool.limits.limiter_for", return_value=limiter) as limiter_for:
+            Drainer(directory, post=lambda url, data, headers: Response(400, "bad payload")).drain_once()
+
+        limiter_for.assert_called_once_with("/etc/pingme/lab1.env")
+        [letter] = deadletter.get_store().query()
+        assert letter["config_file"] == "/etc/pingme/lab1.env"
+
+    def test_backing_off_entries_do_not_block_newer_ones(self, tmp_path, entry):
+        """Test a failing entry is retried later and newer entries are sent meanwhile."""
+        directory = str(tmp_path)
+        spool.write(directory, {**entry, "urls": ["http://down"]})
+        spool.write(directory, entry)
+        posted = []
+
+        def post(url, data, headers):
+            posted.append(url)
+            return Response(503 if url == "http://down" else 200)
+
+        drainer = Drainer(directory, post=post, batch=1, backoff=60)
+
+        assert drainer.drain_once() == {"sent": 0, "kept": 1}
+        assert drainer.drain_once() == {"sent": 1, "kept": 0}
+        assert drainer.drain_once() == {"sent": 0, "kept": 0}
+        assert posted == ["http://down", "http://hook"]
+        [path] = spool.pending(directory)
+        with open(path) as f:
+            assert json.load(f)["attempts"] == 1
+
+    def test_retries_only_go_to_failed_urls(self, tmp_path, entry):
+        """Test URLs of a group that were delivered are not posted again on the next attempt."""
+        directory = str(tmp_path)
+        spool.write(directory, {**entry, "urls": ["http://a", "http://b"]})
+        responses = {"http://a": [Response(200)], "http://b": [Response(503), Response(200)]}
+        posted = []
+
+        def post(url, data, headers):
+            posted.append(url)
+            return responses[url].pop(0)
+
+        drainer = Drainer(directory, post=post, backoff=0)
+
+        assert drainer.drain_once() == {"sent": 0, "kept": 1}
+        assert drainer.drain_once() == {"sent": 1, "kept": 0}
+        assert posted == ["http://a", "http://b", "http://b"]
+        assert spool.pending(directory) == []
+
+    def test_permanent_failure_of_one_url_dead_letters_only_that_url(self, tmp_path, entry):
+        """Test a client error from one URL of a group dead-letters that URL and part only."""
+        directory = str(tmp_path / "spool")
+        spool.write(directory, {**entry, "urls": ["http://a", "http://b"], "part": 1, "parts": 2})
+
+        Drainer(directory, post=lambda url, data, headers: Response(400 if url == "http://b" else 200)).drain_once()
+
+        [letter] = deadletter.get_store().query()
+        assert letter["targets"] == [{"url": "http://b", "part": 1}]
+        assert spool.pending(directory) == []
+
+    def test_claimed_files_are_sent_once(self, tmp_path, entry):
+        """Test two drainers sharing a directory do not both send a file."""
+        directory = str(tmp_path)
+        path = spool.write(directory, entry)
+        posted = []
+        first = Drainer(directory, post=lambda url, data, headers: posted.append(url) or Response(200))
+        second = Drainer(directory, post=lambda url, data, headers: posted.append(url) or Response(200))
+
+        claimed = spool.claim(path)
+        assert second._send(path) is True
+        assert spool.claim(path) is None
+        os.rename(claimed, path)
+        assert first._send(path) is True
+
+        assert posted == ["http://hook"]
+        assert os.listdir(directory) == []
+
+    def test_abandoned_claims_are_recovered(self, tmp_path, entry):
+        """Test a file claimed by a drainer that died is returned to the spool after the lease."""
+        directory = str(tmp_path)
+        claimed = spool.claim(spool.write(directory, entry))
+        os.utime(claimed, (0, 0))
+
+        assert spool.pending(directory) == []
+        assert spool.recover(directory, lease=60) == 1
+        assert len(spool.pending(directory)) == 1
+
+    def test_cli_drains_the_config_spool_directory(self, tmp_path, entry):
+        """Test pingme_drain reads the spool directory of its config file."""
+        directory = tmp_path / "configured"
+        yaml_file = tmp_path / "config.yaml"
+        default_yaml = open(f"{core.PACKAGE_DIR}/config/config.default.yaml").read()
+        yaml_file.write_text(default_yaml.replace("directory:  #", f"directory: {directory}  #", 1))
+        config_file = tmp_path / "config.env"
+        config_file.write_text(f"CORE_YAML_CONFIG_FILE={yaml_file}\n")
+        spool.write(str(directory), entry)
+
+        with patch("pingme.pingme_class.http_session.post", return_value=Response(200)) as post:
+            spool.cli(config_file=str(config_file), once=True)
+
+        post.assert_called_once()
+        assert spool.pending(str(directory)) == []
@@ -0,0 +1,68 @@
+"""Unit tests for multi-tenant config selection."""
+import pytest
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from pingme import tenants
+from pingme.api import app
+from pingme.core import settings
+
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def registered(monkeypatch):
+    """Register two tenants."""
+    monkeypatch.setattr(settings, "tenants", {"lab1": "/tmp/lab1.env", "lab2": "/tmp/lab2.env"})
+
+
+@pytest.fixture
+def mock_pingme():
+    """Mock PingMe in services, returning a successful webhook response."""
+    with patch('pingme.services.PingMe') as mock_pingme_class:
+        mock_instance = MagicMock()
+        mock_instance.send_webhook.return_value = MagicMock(status_code=200, json=MagicMock(return_value={}))
+        mock_pingme_class.return_value = mock_instance
+        yield mock_pingme_class
+
+
+class TestTenantSelection:
+    """Tests for selecting a tenant per request."""
+
+    def test_no_tenant_uses_settings(self, registered):
+        """Test the default config file is used without a tenant."""
+        assert tenants.active_config_file() == settings.config_file
+
+    def test_use_tenant(self, registered):
+        """Test use_tenant selects the tenant's config file for the block only."""
+        with tenants.use_tenant("lab1"):
+            assert tenants.active_config_file() == "/tmp/lab1.env"
+        assert tenants.active_config_file() == settings.config_file
+
+    def test_unknown_tenant(self, registered):
+        """Test an unregistered tenant raises UnknownTenant."""
+        with pytest.raises(tenants.UnknownTenant):
+            tenants.config_file_for("nope")
+
+    @patch('pingme.services.limiter_for')
+    def test_header_selects_config(self, mock_limiter_for, registered, mock_pingme):
+        """Test the X-PingMe-Tenant header selects the tenant's config file."""
+        response = client.post("/webhook/default", headers={"X-PingMe-Tenant": "lab2"})
+
+        assert response.status_code == 200
+        assert mock_pingme.call_args[1]["config_file"] == "/tmp/lab2.env"
+
+    @patch('pingme.services.limiter_for')
+    def test_path_prefix_selects_config(self, mock_limiter_for, registered, mock_pingme):
+        """Test the /tenant/{name}/ prefix selects the tenant's config file."""
+        response = client.post("/tenant/lab1/webhook/default")
+
+        assert response.status_code == 200
+        assert mock_pingme.call_args[1]["config_file"] == "/tmp/lab1.env"
+
+    def test_unknown_tenant_is_404(self, registered):
+        """Test requests for an unregistered tenant get 404."""
+        response = client.post("/tenant/nope/webhook/default")
+
+        assert response.status_code == 404
+        assert "nope" in response.json()["detail"]